@@ -1,17 +1,73 @@
+import time
+_SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
-import geopandas as gpd
 import pandas as pd
-import plotly.graph_objects as go
+import numpy as np
 import json
-from shapely.geometry import LineString, MultiLineString
+import os
+import shutil
+import sys
+import tempfile
 import warnings
+import functools
+import hashlib
+import heapq
+import threading
+import uuid
+import importlib.util
+import tracemalloc
+from contextlib import contextmanager
+
+import report_charts
+
+
+def lazy_import(name):
+    """
+    Modülü ilk attribute erişimine kadar yüklemeden döndür (importlib LazyLoader)
+    Ağır kütüphaneler (geopandas, shapely, plotly) sadece onları kullanan bölüm
+    çalıştığında yüklenir; yükleme prompt'u bunları beklemez.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+gpd = lazy_import("geopandas")
+shapely = lazy_import("shapely")
+sparse = lazy_import("scipy.sparse")
+go = lazy_import("plotly.graph_objects")
+px = lazy_import("plotly.express")
+
+_IMPORT_SECONDS = time.perf_counter() - _SCRIPT_STARTED
 
 warnings.filterwarnings("ignore")
 
+# Copy-on-Write: türetilmiş tablolar (filtre, seçim, assign) veriyi ancak yazıldığında
+# kopyalar. pandas 3+ için zaten varsayılan; pandas 2.x'te açıkça etkinleştir.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
 # =============================================================================
 # PAGE CONFIG
 # =============================================================================
 st.set_page_config(page_title="Türkiye Satış Haritası", layout="wide")
+
+
+@st.cache_resource
+def startup_metrics():
+    """Süreç başına soğuk başlangıç süreleri (import, geometri, ilk tam render)"""
+    return {}
+
+
+startup = startup_metrics()
+startup.setdefault("Import", _IMPORT_SECONDS)
 st.title("🗺️ Türkiye – Bölge & İl Bazlı Performans Analizi")
 
 # =============================================================================
@@ -30,6 +86,17 @@ REGION_COLORS = {
     "DİĞER": "#64748B"                 # Slate Gray
 }
 
+# =============================================================================
+# STRATEJİ RENKLERİ
+# =============================================================================
+STRATEGY_COLORS = {
+    "🚀 Agresif": "#EF4444",         # Kırmızı - Agresif
+    "⚡ Hızlandırılmış": "#F59E0B",  # Turuncu - Hızlı
+    "🛡️ Koruma": "#10B981",         # Yeşil - Güvenli
+    "💎 Potansiyel": "#8B5CF6",     # Mor - Değerli
+    "👁️ İzleme": "#6B7280"          # Gri - Pasif
+}
+
 # =============================================================================
 # ŞEHİR EŞLEŞTİRME (MASTER)
 # =============================================================================
@@ -64,6 +131,352 @@ FIX_CITY_MAP = {
     "K. MARAS": "KAHRAMANMARAŞ"
 }
 
+# =============================================================================
+# PERFORMANS ÖLÇÜMÜ (PROFİL PANELİ)
+# =============================================================================
+class RerunProfiler:
+    """
+    Her rerun için bölüm ve fonksiyon bazlı ölçüm yapar.
+
+    Kaydedilenler: duvar süresi, CPU süresi, satır sayısı ve grafik payload byte'ı.
+    track_memory=True iken memory=True işaretli aşamalarda tracemalloc snapshot'ı
+    alınır: aşamanın tepe (peak) ve kalıcı (retained) bellek kullanımı ile en çok
+    bellek ayıran satırlar kaydedilir.
+    Kapalıyken hiçbir ölçüm yapmaz, maliyeti yok denecek kadar azdır.
+    """
+
+    def __init__(self, enabled=False, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.active = enabled or track_memory
+        self.origin = time.perf_counter()
+        self.records = []
+        self._stack = []
+        self._section = None
+
+    def _open(self, name, kind, rows=None, memory=False):
+        if memory and self.track_memory:
+            mem = self._memory_begin()
+        else:
+            mem = None
+        rec = {
+            "name": name,
+            "kind": kind,
+            "rows": rows,
+            "payload": 0,
+            "depth": len(self._stack),
+            "start": time.perf_counter(),
+            "cpu_start": time.process_time(),
+            "mem": mem,
+        }
+        self._stack.append(rec)
+        return rec
+
+    def _close(self, rec):
+        rec["wall"] = time.perf_counter() - rec["start"]
+        rec["cpu"] = time.process_time() - rec.pop("cpu_start")
+        self._stack = [r for r in self._stack if r is not rec]
+        if rec["mem"] is not None:
+            self._memory_end(rec["mem"])
+        self.records.append(rec)
+
+    def _note_parent_peaks(self, peak):
+        # reset_peak() dış aşamaların tepesini sildiği için önce onlara aktar
+        for r in self._stack:
+            if r["mem"] is not None:
+                r["mem"]["peak_seen"] = max(r["mem"]["peak_seen"], peak)
+
+    def _memory_begin(self):
+        if not tracemalloc.is_tracing():
+            return {"snapshot": None, "start": 0, "peak_seen": 0}
+        self._note_parent_peaks(tracemalloc.get_traced_memory()[1])
+        snapshot = tracemalloc.take_snapshot()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return {"snapshot": snapshot, "start": current, "peak_seen": current}
+
+    def _memory_end(self, mem):
+        if mem["snapshot"] is None or not tracemalloc.is_tracing():
+            # Ölçüm başlarken veya sürerken izleme kapalıydı: değer yok
+            mem.update(snapshot=None, peak=None, retained=None, top_sites=["n/a"])
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, mem["peak_seen"])
+        self._note_parent_peaks(peak)
+
+        after = tracemalloc.take_snapshot()
+        top_sites = [
+            stat for stat in after.compare_to(mem.pop("snapshot"), "lineno")
+            if stat.size_diff > 0 and stat.traceback[0].filename not in MEMORY_IGNORED_FILES
+        ][:MEMORY_TOP_SITES]
+        del after
+        tracemalloc.reset_peak()
+
+        mem["peak"] = peak - mem["start"]
+        mem["retained"] = current - mem["start"]
+        mem["top_sites"] = [
+            f"{stat.traceback[0].filename.rsplit('/', 1)[-1]}:{stat.traceback[0].lineno} "
+            f"(+{stat.size_diff / 1024:,.0f} KB)"
+            for stat in top_sites
+        ]
+
+    def section(self, name, rows=None, memory=False):
+        """Açık bölümü kapatıp yenisini başlatır - script gövdesini girintilemeye gerek kalmaz"""
+        if not self.active:
+            return
+        if self._section is not None:
+            self._close(self._section)
+        self._section = self._open(name, "bölüm", rows, memory)
+
+    @contextmanager
+    def span(self, name, rows=None, memory=False, kind="fonksiyon"):
+        """Fonksiyon/alt adım ölçümü (iç içe kullanılabilir)"""
+        if not self.active:
+            yield None
+            return
+        rec = self._open(name, kind, rows, memory)
+        try:
+            yield rec
+        finally:
+            self._close(rec)
+
+    def set_rows(self, rows):
+        """En içteki açık ölçümün satır sayısını günceller"""
+        if self.active and self._stack:
+            self._stack[-1]["rows"] = rows
+
+    def add_payload(self, nbytes):
+        """Grafik payload boyutunu tüm açık ölçümlere ekler (süre gibi kapsayıcı)"""
+        if self.enabled:
+            for rec in self._stack:
+                rec["payload"] += nbytes
+
+    def finish(self):
+        if not self.active:
+            return
+        if self._section is not None:
+            self._close(self._section)
+            self._section = None
+
+    def to_frame(self):
+        """Kayıtları başlangıç sırasına göre tablo olarak döndür"""
+        if not self.records:
+            return pd.DataFrame(columns=["Ölçüm", "Tür", "Süre (ms)", "CPU (ms)", "Satır", "Payload (KB)"])
+        recs = sorted(self.records, key=lambda r: r["start"])
+        return pd.DataFrame({
+            "Ölçüm": ["  " * r["depth"] + r["name"] for r in recs],
+            "Tür": [r["kind"] for r in recs],
+            "Süre (ms)": [round(r["wall"] * 1000, 1) for r in recs],
+            "CPU (ms)": [round(r["cpu"] * 1000, 1) for r in recs],
+            "Satır": [r["rows"] for r in recs],
+            "Payload (KB)": [round(r["payload"] / 1024, 1) for r in recs],
+        })
+
+    def to_chrome_trace(self):
+        """chrome://tracing / Perfetto ile açılabilen Chrome-trace JSON'u üret"""
+        events = []
+        for r in sorted(self.records, key=lambda r: r["start"]):
+            events.append({
+                "name": r["name"],
+                "cat": r["kind"],
+                "ph": "X",
+                "ts": round((r["start"] - self.origin) * 1e6, 1),
+                "dur": round(r["wall"] * 1e6, 1),
+                "pid": 1,
+                "tid": 1,
+                "args": {
+                    "cpu_ms": round(r["cpu"] * 1000, 3),
+                    "rows": r["rows"],
+                    "payload_bytes": r["payload"],
+                },
+            })
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+    def memory_frame(self):
+        """memory=True aşamalarının tepe/kalıcı bellek tablosu"""
+        recs = sorted((r for r in self.records if r["mem"] is not None), key=lambda r: r["start"])
+        return pd.DataFrame({
+            "Aşama": [r["name"] for r in recs],
+            "Tepe (MB)": [_megabytes(r["mem"]["peak"]) for r in recs],
+            "Kalıcı (MB)": [_megabytes(r["mem"]["retained"]) for r in recs],
+            "En Çok Ayıran Satırlar": [" | ".join(r["mem"]["top_sites"]) for r in recs],
+        })
+
+
+def _megabytes(size):
+    return round(size / 1024 ** 2, 2) if size is not None else np.nan
+
+
+MEMORY_TOP_SITES = 3
+MEMORY_IGNORED_FILES = {
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+}
+
+
+def _row_count(obj):
+    if isinstance(obj, pd.DataFrame):
+        return len(obj)
+    if isinstance(obj, tuple) and obj and isinstance(obj[0], pd.DataFrame):
+        return len(obj[0])
+    return None
+
+
+def profiled(name=None, memory=False):
+    """Fonksiyonu aktif rerun profiline bağlayan dekoratör (memory=True: bellek aşaması)"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with perf.span(label, memory=memory):
+                result = func(*args, **kwargs)
+                perf.set_rows(_row_count(result))
+            return result
+
+        return wrapper
+    return decorator
+
+
+def _chart_label(fig):
+    """Profil satırı için grafik adı: başlık, yoksa ilk trace tipi"""
+    title = fig.layout.title.text
+    if title:
+        return title
+    return fig.data[0].type if fig.data else "boş grafik"
+
+
+def show_chart(fig, **kwargs):
+    """
+    st.plotly_chart sarmalayıcısı
+
+    Profil açıkken her çağrı ayrı bir "grafik" satırı olarak kaydedilir; payload,
+    tarayıcıya gönderilen figür JSON'unun byte boyutudur.
+    """
+    kwargs.setdefault("use_container_width", True)
+    if not perf.enabled:
+        st.plotly_chart(fig, **kwargs)
+        return
+    with perf.span(_chart_label(fig), kind="grafik"):
+        perf.add_payload(len(fig.to_json().encode("utf-8")))
+        st.plotly_chart(fig, **kwargs)
+
+
+def render_perf_panel(profiler):
+    """Sidebar'da rerun profil tablosunu ve Chrome-trace indirme butonunu göster"""
+    with st.sidebar.expander("⏱️ Rerun Profili", expanded=True):
+        perf_df = profiler.to_frame()
+        sections = perf_df[perf_df["Tür"] == "bölüm"]
+        st.caption(
+            f"Toplam: {sections['Süre (ms)'].sum():,.0f} ms | "
+            f"CPU: {sections['CPU (ms)'].sum():,.0f} ms | "
+            f"Payload: {sections['Payload (KB)'].sum():,.0f} KB"
+        )
+        st.dataframe(perf_df, use_container_width=True, hide_index=True, height=400)
+        st.download_button(
+            label="📥 Chrome Trace (JSON)",
+            data=profiler.to_chrome_trace().encode("utf-8"),
+            file_name=f"rerun_trace_{time.strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            help="chrome://tracing veya ui.perfetto.dev ile açın"
+        )
+
+
+def render_memory_panel(profiler):
+    """Sidebar'da aşama bazlı bellek raporunu ve oturumdaki en yüksek değerleri göster"""
+    mem_df = profiler.memory_frame()
+
+    # Oturum boyunca her aşamanın gördüğü en yüksek tepe değeri
+    session_peaks = st.session_state.setdefault("_memory_session_peaks", {})
+    for stage, peak in zip(mem_df["Aşama"], mem_df["Tepe (MB)"]):
+        if not np.isnan(peak):
+            session_peaks[stage] = max(session_peaks.get(stage, 0), peak)
+
+    with st.sidebar.expander("🧠 Bellek Raporu", expanded=True):
+        current, peak = tracemalloc.get_traced_memory()
+        st.caption(
+            f"İzlenen bellek: {current / 1024 ** 2:,.1f} MB | Süreç tepe: {peak / 1024 ** 2:,.1f} MB. "
+            "tracemalloc süreç genelidir; eşzamanlı oturumların tahsisleri de görünebilir. "
+            "Tepe sıfırlama (reset_peak) da süreç geneli olduğundan aynı anda ölçüm yapan "
+            "oturumlarda tepe değerleri eksik kalabilir."
+        )
+        st.dataframe(mem_df, use_container_width=True, hide_index=True)
+        st.markdown("**Bu oturumda aşama bazlı en yüksek tepe (MB)**")
+        st.dataframe(
+            pd.DataFrame({"Aşama": list(session_peaks), "Tepe (MB)": list(session_peaks.values())}),
+            use_container_width=True,
+            hide_index=True
+        )
+
+
+@st.cache_resource
+def memory_tracing_sessions():
+    """Bellek ölçümü açık oturumlar - tracemalloc süreç genelidir, tüm oturumlarca paylaşılır"""
+    return {"lock": threading.Lock(), "sessions": set()}
+
+
+def set_memory_tracing(session, enabled):
+    """
+    Oturumun bellek ölçümünü aç / kapat
+
+    tracemalloc ilk oturum açınca başlar, sadece son oturum kapatınca durur;
+    başka bir oturumun süren ölçümü kesilmez.
+    """
+    state = memory_tracing_sessions()
+    with state["lock"]:
+        if enabled:
+            state["sessions"].add(session)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        elif session in state["sessions"]:
+            state["sessions"].discard(session)
+            if not state["sessions"] and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+set_memory_tracing(
+    st.session_state.setdefault("_memory_session", uuid.uuid4().hex),
+    st.session_state.get("memory_panel", False)
+)
+perf = RerunProfiler(
+    enabled=st.session_state.get("perf_panel", False),
+    track_memory=st.session_state.get("memory_panel", False)
+)
+
+# =============================================================================
+# TABLO SUNUMU - SAYISAL KOLONLAR + FORMAT METADATA
+# =============================================================================
+# printf formatları - st.dataframe render anında tarayıcıda uygular
+NUMBER_FORMATS = {
+    "adet": "%,.0f",      # 1,234,567
+    "yuzde": "%.1f%%",    # 12.3%
+    "yuzde2": "%.2f%%",   # 12.34%
+}
+
+
+def show_table(df, formats=None, labels=None, **kwargs):
+    """
+    Tabloyu sayısal tipleri koruyarak gösterir
+
+    formats: {kolon: NUMBER_FORMATS anahtarı veya printf formatı}
+    labels: {kolon: görünen başlık} - kolonları kopyalayıp yeniden adlandırmaya gerek kalmaz
+    Formatlama tarayıcıda yapılır, kolonlar sayısal sıralanabilir kalır.
+    """
+    formats = formats or {}
+    labels = labels or {}
+    column_config = {}
+    for col in df.columns:
+        fmt = formats.get(col)
+        if fmt is not None:
+            column_config[col] = st.column_config.NumberColumn(
+                labels.get(col), format=NUMBER_FORMATS.get(fmt, fmt)
+            )
+        elif col in labels:
+            column_config[col] = st.column_config.Column(labels[col])
+    kwargs.setdefault("use_container_width", True)
+    st.dataframe(df, column_config=column_config, **kwargs)
+
 # =============================================================================
 # NORMALIZATION
 # =============================================================================
@@ -87,6 +500,7 @@ def normalize_city(name):
 # =============================================================================
 # DATA LOAD
 # =============================================================================
+@profiled(memory=True)
 @st.cache_data
 def load_excel(file=None):
     if file is not None:
@@ -94,9 +508,113 @@ def load_excel(file=None):
     # Eğer dosya yüklenmemişse boş DataFrame döndür
     return pd.DataFrame(columns=["Şehir", "Bölge", "Ticaret Müdürü", "Kutu Adet", "Toplam Adet"])
 
+GEOJSON_PATH = "turkey.geojson"
+GEOMETRY_ARTIFACT_DIR = ".geometry_cache"   # .gitignore'da; GeoJSON sürümü (sha1) başına bir alt klasör
+
+
+def _file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def build_geometry_artifact(source, version_dir):
+    """
+    GeoJSON'u bir kez OGR ile okuyup düz koordinat + offset dizilerine derle
+
+    shapely.to_ragged_array çıktısı .npy dosyalarına, özellik kolonları ve
+    kaynak dosyanın sha1 özeti meta.json'a yazılır. Dosyalar geçici bir kardeş
+    klasöre yazılır (meta.json en son) ve klasör os.replace ile tek adımda
+    yerine konur; okuyucular yarım artefakt görmez. Aynı sürümü başka bir
+    süreç önce yerleştirdiyse onunki kullanılır.
+    """
+    gdf = gpd.read_file(source)
+    geom_type, coords, offsets = shapely.to_ragged_array(gdf.geometry.values)
+    meta = {
+        "source_sha1": _file_sha1(source),
+        "geometry_type": int(geom_type),
+        "offset_levels": len(offsets),
+        # to_ragged_array tek parçalı Polygon'ları da MultiPolygon yapar; geri açmak için
+        "polygon_rows": np.flatnonzero(shapely.get_type_id(gdf.geometry.values) == shapely.GeometryType.POLYGON).tolist(),
+        "crs": gdf.crs.to_string() if gdf.crs is not None else None,
+        "properties": {
+            col: gdf[col].tolist() for col in gdf.columns if col != gdf.geometry.name
+        },
+    }
+
+    parent = os.path.dirname(version_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".build-", dir=parent)
+    try:
+        os.chmod(staging, 0o755)    # mkdtemp 0700 açar; diğer kullanıcılar da okuyabilsin
+        np.save(os.path.join(staging, "coords.npy"), coords)
+        for i, offset in enumerate(offsets):
+            np.save(os.path.join(staging, f"offsets_{i}.npy"), offset)
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        try:
+            os.replace(staging, version_dir)
+        except OSError:
+            if not os.path.exists(os.path.join(version_dir, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    # Eski sürümler - en iyi çaba; başka süreçlerin süren derlemelerine dokunulmaz
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if path == version_dir or entry.startswith(".build-"):
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+    return meta
+
+
+def geometry_artifact_dir(source=GEOJSON_PATH, target=GEOMETRY_ARTIFACT_DIR):
+    """Kaynak GeoJSON sürümünün artefakt klasörü; yoksa önce derlenir"""
+    version_dir = os.path.join(target, _file_sha1(source))
+    if not os.path.exists(os.path.join(version_dir, "meta.json")):
+        build_geometry_artifact(source, version_dir)
+    return version_dir
+
+
+def read_geometry_arrays(directory, mmap_mode=None):
+    """Artefaktın koordinat ve offset dizileri"""
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    coords = np.load(os.path.join(directory, "coords.npy"), mmap_mode=mmap_mode)
+    offsets = tuple(
+        np.load(os.path.join(directory, f"offsets_{i}.npy"), mmap_mode=mmap_mode)
+        for i in range(meta["offset_levels"])
+    )
+    return meta, coords, offsets
+
+
+def read_geometry_artifact(source=GEOJSON_PATH, target=GEOMETRY_ARTIFACT_DIR):
+    """
+    Derlenmiş geometriyi oku; yoksa veya GeoJSON değiştiyse önce yeniden derle
+
+    Artefakt yazılamıyor (salt okunur dağıtım) veya okunamıyorsa GeoJSON
+    doğrudan OGR ile okunur.
+    """
+    try:
+        meta, coords, offsets = read_geometry_arrays(geometry_artifact_dir(source, target))
+    except (OSError, ValueError):
+        return gpd.read_file(source)
+    geometry = shapely.from_ragged_array(shapely.GeometryType(meta["geometry_type"]), coords, offsets)
+    polygon_rows = np.asarray(meta.get("polygon_rows", []), dtype=np.int64)
+    geometry[polygon_rows] = shapely.get_geometry(geometry[polygon_rows], 0)
+    return gpd.GeoDataFrame(meta["properties"], geometry=geometry, crs=meta["crs"])
+
+
+@profiled()
 @st.cache_resource
 def load_geo():
-    gdf = gpd.read_file("turkey.geojson")
+    gdf = read_geometry_artifact()
     gdf["raw_name"] = gdf["name"].str.upper()
     gdf["fixed_name"] = gdf["raw_name"].replace(FIX_CITY_MAP)
     gdf["CITY_KEY"] = gdf["fixed_name"].apply(normalize_city)
@@ -105,10 +623,13 @@ def load_geo():
 # =============================================================================
 # DATA PREP
 # =============================================================================
+TOPLAM_COLUMN_CANDIDATES = ["Toplam Adet", "TOPLAM ADET", "Toplam", "TOPLAM", "Total", "Market Total"]
+
+@profiled(memory=True)
 def prepare_data(df, gdf):
 
-    df = df.copy()
-    gdf = gdf.copy()
+    # Sığ kopya: yeni kolonlar çağıranın DataFrame'ine eklenmez, veri kopyalanmaz (CoW)
+    df = df.copy(deep=False)
 
     df["Şehir_fix"] = df["Şehir"].str.upper().replace(FIX_CITY_MAP)
     df["CITY_KEY"] = df["Şehir_fix"].apply(normalize_city)
@@ -121,9 +642,8 @@ def prepare_data(df, gdf):
     
     # Toplam Adet kolonunu farklı isimlerde ara
     toplam_col = None
-    possible_names = ["Toplam Adet", "TOPLAM ADET", "Toplam", "TOPLAM", "Total", "Market Total"]
     
-    for col_name in possible_names:
+    for col_name in TOPLAM_COLUMN_CANDIDATES:
         if col_name in df.columns:
             toplam_col = col_name
             break
@@ -165,282 +685,2320 @@ def prepare_data(df, gdf):
     return merged, bolge_df, pf_toplam_kutu, toplam_kutu
 
 # =============================================================================
-# GEOMETRY HELPERS
+# KOMPAKT VERİ TEMSİLİ
+# =============================================================================
+# merge sonrası artık kullanılmayan isim / ham sayı kolonları
+REDUNDANT_COLUMNS = ["raw_name", "fixed_name", "Şehir_fix", "name", "source", "Kutu Adet"] + TOPLAM_COLUMN_CANDIDATES
+
+
+def _compact_count(series):
+    """Tam sayı olan kutu adetlerini int32'ye (sığmazsa int64'e) çevir"""
+    values = series.to_numpy(dtype="float64")
+    if not np.all(np.mod(values, 1) == 0):
+        return series
+    int32 = np.iinfo(np.int32)
+    if values.size == 0 or (values.min() >= int32.min and values.max() <= int32.max):
+        return series.astype("int32")
+    return series.astype("int64")
+
+
+@profiled(memory=True)
+def compact_prepared_data(merged, gdf):
+    """
+    Hazırlanmış veriyi kompakt tiplere çevirir
+
+    - Şehir / CITY_KEY: 81 il sözlüğünü paylaşan categorical kodlar
+    - Bölge / Ticaret Müdürü: categorical
+    - PF Kutu / Toplam Kutu: int32 (sığmazsa int64)
+    - Pazar Payı %: float32
+    - Gereksiz isim ve ham sayı kolonları atılır
+
+    Döndürür: (kompakt_df, önceki_byte, sonraki_byte)
+    """
+    before = int(merged.memory_usage(deep=True).sum())
+
+    merged = merged.drop(columns=[c for c in REDUNDANT_COLUMNS if c in merged.columns])
+
+    merged["Şehir"] = pd.Categorical(merged["Şehir"], categories=sorted(gdf["fixed_name"].unique()))
+    merged["CITY_KEY"] = pd.Categorical(merged["CITY_KEY"], categories=sorted(gdf["CITY_KEY"].unique()))
+    for col in ["Bölge", "Ticaret Müdürü"]:
+        merged[col] = pd.Categorical(merged[col], categories=sorted(merged[col].unique()))
+
+    merged["PF Kutu"] = _compact_count(merged["PF Kutu"])
+    merged["Toplam Kutu"] = _compact_count(merged["Toplam Kutu"])
+    merged["Pazar Payı %"] = merged["Pazar Payı %"].astype("float32")
+
+    after = int(merged.memory_usage(deep=True).sum())
+    return merged, before, after
+
+# =============================================================================
+# NOKTA VERİSİ (KOORDİNATLI ECZANE SATIRLARI)
 # =============================================================================
-def lines_to_lonlat(geom):
-    lons, lats = [], []
-    if isinstance(geom, LineString):
-        xs, ys = geom.xy
-        lons += list(xs) + [None]
-        lats += list(ys) + [None]
-    elif isinstance(geom, MultiLineString):
-        for line in geom.geoms:
-            xs, ys = line.xy
-            lons += list(xs) + [None]
-            lats += list(ys) + [None]
-    return lons, lats
-
-def get_region_center(gdf_region):
-    """Bölgenin merkez koordinatlarını hesapla"""
-    centroid = gdf_region.geometry.unary_union.centroid
-    return centroid.x, centroid.y
+LAT_COLUMN_CANDIDATES = ["Enlem", "ENLEM", "Latitude", "LATITUDE", "Lat", "lat"]
+LON_COLUMN_CANDIDATES = ["Boylam", "BOYLAM", "Longitude", "LONGITUDE", "Lon", "lon", "Lng", "lng"]
+
+
+def point_columns(df):
+    """(enlem, boylam) kolon adları; nokta verisi değilse None"""
+    lat = next((c for c in LAT_COLUMN_CANDIDATES if c in df.columns), None)
+    lon = next((c for c in LON_COLUMN_CANDIDATES if c in df.columns), None)
+    return (lat, lon) if lat and lon else None
+
+
+@st.cache_resource
+def get_province_tree(_gdf):
+    """İl poligonları üzerinde STRtree - süreç başına bir kez; poligonlar prepared (hızlı point-in-polygon)"""
+    polygons = np.asarray(_gdf.geometry.values)
+    shapely.prepare(polygons)
+    return shapely.STRtree(polygons)
+
+
+def locate_points(tree, lon, lat):
+    """
+    Her nokta için içinde bulunduğu il satırı (bulunamazsa -1)
+
+    STRtree.query tüm noktaları tek GEOS çağrısında sorgular: önce sınır
+    kutusu adayları, sonra vektörel point-in-polygon. İki il sınırındaki
+    noktalar ilk eşleşen ile atanır.
+    """
+    points = shapely.points(lon, lat)
+    point_idx, polygon_idx = tree.query(points, predicate="intersects")
+    rows = np.full(len(points), -1, dtype=np.int64)
+    first = np.unique(point_idx, return_index=True)[1]
+    rows[point_idx[first]] = polygon_idx[first]
+    return rows
+
+
+@profiled()
+@st.cache_data(max_entries=4)
+def aggregate_points(data_key, _df, _gdf):
+    """
+    Koordinatlı satırları illere atayıp il bazında tabloya indirger
+
+    - İl koordinattan gelir; koordinatı hiçbir ile düşmeyen satırlar isimle
+      atanır (isim de tanınmıyorsa atılır)
+    - İsimden çıkan il ile koordinat ili farklıysa uyumsuz sayılır
+    - Bölge / Ticaret Müdürü ilde en sık görülen değerdir
+
+    Döndürür: (il_tablosu, uyumsuzluk_tablosu, özet_sözlüğü) - il tablosu
+    prepare_data'nın beklediği kolonlarla.
+    """
+    lat_col, lon_col = point_columns(_df)
+    lat = pd.to_numeric(_df[lat_col], errors="coerce").to_numpy(dtype="float64")
+    lon = pd.to_numeric(_df[lon_col], errors="coerce").to_numpy(dtype="float64")
+    keys = _gdf["CITY_KEY"].to_numpy(dtype=object)
+
+    coord_rows = locate_points(get_province_tree(_gdf), lon, lat)
+
+    # İsim normalizasyonu benzersiz isimler üzerinde bir kez; boş isim astype(str)
+    # ile "NAN" metnine dönüşeceği için önceden maskelenir
+    named = _df["Şehir"].notna().to_numpy()
+    codes, names = pd.factorize(_df["Şehir"].astype(str).str.upper())
+    name_keys = pd.Series(names).replace(FIX_CITY_MAP).map(normalize_city).to_numpy(dtype=object)
+    name_rows = pd.Index(keys).get_indexer(name_keys)[codes]
+    name_rows[~named] = -1
+
+    rows = np.where(coord_rows >= 0, coord_rows, name_rows)
+    mismatch = (coord_rows >= 0) & (name_rows >= 0) & (coord_rows != name_rows)
+    unassigned_coords = coord_rows < 0
+    assigned = rows >= 0
+
+    pf = pd.to_numeric(_df["Kutu Adet"], errors="coerce").fillna(0).to_numpy(dtype="float64")
+    toplam_col = next((c for c in TOPLAM_COLUMN_CANDIDATES if c in _df.columns), None)
+    frame = pd.DataFrame({
+        "Şehir": _gdf["fixed_name"].to_numpy(dtype=object)[rows[assigned]],
+        "Bölge": _df["Bölge"].to_numpy(dtype=object)[assigned],
+        "Ticaret Müdürü": _df["Ticaret Müdürü"].to_numpy(dtype=object)[assigned],
+        "Kutu Adet": pf[assigned],
+    })
+    if toplam_col:
+        frame["Toplam Adet"] = pd.to_numeric(_df[toplam_col], errors="coerce").fillna(0).to_numpy(dtype="float64")[assigned]
+
+    sums = frame.groupby("Şehir", sort=False)[[c for c in ["Kutu Adet", "Toplam Adet"] if c in frame.columns]].sum()
+    for col in ["Bölge", "Ticaret Müdürü"]:
+        counts = frame.groupby(["Şehir", col], sort=False).size()
+        sums[col] = counts.loc[counts.groupby(level=0).idxmax()].reset_index(level=1)[col]
+    provinces = sums.reset_index()[["Şehir", "Bölge", "Ticaret Müdürü"] + [c for c in ["Kutu Adet", "Toplam Adet"] if c in sums.columns]]
+
+    mismatches = (
+        pd.DataFrame({
+            "Şehir (isim)": _df["Şehir"].to_numpy(dtype=object)[mismatch],
+            "Koordinat İli": _gdf["fixed_name"].to_numpy(dtype=object)[coord_rows[mismatch]],
+            "PF Kutu": pf[mismatch],
+        })
+        .groupby(["Şehir (isim)", "Koordinat İli"], as_index=False)
+        .agg(**{"Nokta": ("PF Kutu", "size"), "PF Kutu": ("PF Kutu", "sum")})
+        .sort_values("Nokta", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+    summary = {
+        "Nokta": len(_df),
+        "Koordinatla": int((coord_rows >= 0).sum()),
+        "İsimle": int((unassigned_coords & assigned).sum()),
+        "Atanamayan": int((~assigned).sum()),
+        "İsimsiz": int((~named).sum()),
+        "Uyumsuz": int(mismatch.sum()),
+    }
+    return provinces, mismatches, summary
 
 # =============================================================================
-# FIGURE - DÜZELTİLMİŞ ETİKETLER
+# GEOMETRY HELPERS
 # =============================================================================
-def create_figure(gdf, manager, view_mode, filtered_pf_toplam, filtered_toplam_pazar):
+MAP_COORD_DECIMALS = 4   # ≈ 11 m; harita ölçeğinde görünür fark yok
+NEIGHBOUR_BUFFER = 1e-3  # derece; komşu il sınırları arasındaki ince boşlukları kapatır (komşuluk + birleşik sınırlar)
+
+
+def encode_coords(values, decimals=MAP_COORD_DECIMALS):
     """
-    Harita oluşturur - etiketlerde FİLTRELENMİŞ veriye göre yüzde gösterir
+    Koordinatları nicemle ve float32 tipli diziye çevir
+
+    Plotly numpy dizilerini figür JSON'unda base64 "bdata" olarak gönderir;
+    float32 + 4 ondalık, 17 haneli float listelerinin yaklaşık dörtte biri.
+    NaN ayırıcılar korunur (çizgi kesintisi).
     """
-    gdf = gdf.copy()
+    return np.round(np.asarray(values, dtype="float64"), decimals).astype(np.float32)
 
-    if manager != "TÜMÜ":
-        gdf = gdf[gdf["Ticaret Müdürü"] == manager]
 
-    fig = go.Figure()
+def _segment_index(starts, ends):
+    """[start, end) aralıklarının birleşik pozisyon dizisi (Python döngüsüz)"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + shift
+
+
+class GeometryStore:
+    """
+    İl geometrilerinin sütunsal (ragged array) hali
+
+    Tüm koordinatlar tek bir float64 (N x 2) tamponda durur; halka, parça ve
+    il sınırları offset dizileriyle tutulur (shapely.to_ragged_array düzeni).
+    Tampon derlenmiş artefakttan salt-okunur mmap ile açılır ve cache_resource
+    ile tüm oturumlarda paylaşılır. Alt küme, sınır çizgisi, merkez ve GeoJSON
+    üretimi Shapely nesnesine dokunmadan dizi dilimleme ile yapılır.
+    """
+
+    def __init__(self, coords, offsets, city_keys):
+        self.coords = coords
+        self.ring_offsets, self.part_offsets, self.feature_offsets = offsets
+        self.keys = pd.Index(city_keys)
+
+        # Halka başına işaretli alan ve ağırlık merkezi (shoelace); delikler negatif
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+        cross[self.ring_offsets[1:-1] - 1] = 0          # halkalar arası geçiş kenarı
+        starts = self.ring_offsets[:-1]
+        ring_area = np.add.reduceat(cross, starts) / 2
+        ring_cx = np.add.reduceat((x[:-1] + x[1:]) * cross, starts)
+        ring_cy = np.add.reduceat((y[:-1] + y[1:]) * cross, starts)
+
+        exterior = np.zeros(len(starts), dtype=bool)
+        exterior[self.part_offsets[:-1]] = True
+        area = np.where(exterior, 1, -1) * np.abs(ring_area)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ring_cx, ring_cy = ring_cx / (6 * ring_area), ring_cy / (6 * ring_area)
+
+        # İl başına: halka -> parça -> il
+        ring_feature = np.searchsorted(self.part_offsets, np.arange(len(starts)), side="right") - 1
+        ring_feature = np.searchsorted(self.feature_offsets, ring_feature, side="right") - 1
+        n = len(self.keys)
+        self.area = np.bincount(ring_feature, weights=area, minlength=n)
+        self.centroids = np.column_stack([
+            np.bincount(ring_feature, weights=area * ring_cx, minlength=n) / self.area,
+            np.bincount(ring_feature, weights=area * ring_cy, minlength=n) / self.area,
+        ])
+        self._features = {}
+        self._outlines = {}
+
+    def rows(self, city_keys):
+        """CITY_KEY dizisi -> geometri satırları (bilinmeyen anahtar: -1)"""
+        return self.keys.get_indexer(np.asarray(city_keys, dtype=object))
+
+    def _ring_ranges(self, rows):
+        """Seçili illerin tüm halkaları için koordinat [başlangıç, bitiş) aralıkları"""
+        rows = np.asarray(rows, dtype=np.int64)
+        parts = _segment_index(self.feature_offsets[rows], self.feature_offsets[rows + 1])
+        rings = _segment_index(self.part_offsets[parts], self.part_offsets[parts + 1])
+        return self.ring_offsets[rings], self.ring_offsets[rings + 1]
+
+    def boundary_lonlat(self, rows):
+        """
+        Sınır çizgileri: halkalar arası NaN ayırıcılı tek lon / lat dizisi
+
+        Delikler dahil tüm halkalar (geom.boundary ile aynı) döner.
+        """
+        starts, ends = self._ring_ranges(rows)
+        if len(starts) == 0:
+            return np.empty(0), np.empty(0)
+        index = _segment_index(starts, ends)
+        # Her halkanın sonuna bir ayırıcı yuvası
+        slots = np.arange(len(index)) + np.repeat(np.arange(len(starts)), ends - starts)
+        out = np.full((len(index) + len(starts), 2), np.nan)
+        out[slots] = self.coords[index]
+        return out[:, 0], out[:, 1]
+
+    def center(self, rows):
+        """İllerin birleşiminin ağırlık merkezi (alan ağırlıklı il merkezleri)"""
+        weights = self.area[rows]
+        return tuple(weights @ self.centroids[rows] / weights.sum())
 
-    # Her bölge için ayrı trace
-    for region in gdf["Bölge"].unique():
-        region_gdf = gdf[gdf["Bölge"] == region]
+    def _feature_geometries(self, tolerance=0.0, decimals=MAP_COORD_DECIMALS):
+        """
+        Süreç başına bir kez: tek .tolist() + liste dilimleme ile GeoJSON geometrileri
+
+        GeoJSON iç içe liste olmak zorunda (tipli dizi olamaz); koordinatlar
+        decimals'a yuvarlanır, böylece JSON'da kısa ondalıklar çıkar.
+        tolerance > 0 ise halkalar önce toplu olarak sadeleştirilir (küçük haritalar).
+        """
+        key = (tolerance, decimals)
+        if key not in self._features:
+            coords, offsets = self.coords, (self.ring_offsets, self.part_offsets, self.feature_offsets)
+            if tolerance > 0:
+                multipolygons = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, np.asarray(coords), offsets)
+                _, coords, offsets = shapely.to_ragged_array(shapely.simplify(multipolygons, tolerance))
+            ring_offsets, part_offsets, feature_offsets = (offset.tolist() for offset in offsets)
+
+            coords = np.round(coords, decimals).tolist()
+            rings = [coords[a:b] for a, b in zip(ring_offsets[:-1], ring_offsets[1:])]
+            parts = [rings[a:b] for a, b in zip(part_offsets[:-1], part_offsets[1:])]
+            self._features[key] = [
+                {"type": "Polygon", "coordinates": parts[a]} if b - a == 1
+                else {"type": "MultiPolygon", "coordinates": parts[a:b]}
+                for a, b in zip(feature_offsets[:-1], feature_offsets[1:])
+            ]
+        return self._features[key]
+
+    def _buffered_provinces(self):
+        offsets = (self.ring_offsets, self.part_offsets, self.feature_offsets)
+        provinces = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, np.asarray(self.coords), offsets)
+        return shapely.buffer(provinces, NEIGHBOUR_BUFFER)
+
+    @staticmethod
+    def _exterior_lonlat(geometries):
+        """Poligonların dış halkaları - NaN ayırıcılı lon / lat"""
+        rings = shapely.get_exterior_ring(shapely.get_parts(geometries))
+        coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+        slots = np.arange(len(coords)) + ring_index
+        out = np.full((len(coords) + len(rings), 2), np.nan)
+        out[slots] = coords
+        return out[:, 0], out[:, 1]
+
+    def outline_lonlat(self, tolerance=0.0):
+        """Tüm illerin birleşiminin (ülke) dış sınırı - NaN ayırıcılı lon / lat, süreç başına bir kez"""
+        if tolerance not in self._outlines:
+            country = shapely.simplify(shapely.union_all(self._buffered_provinces()), tolerance)
+            self._outlines[tolerance] = self._exterior_lonlat(country)
+        return self._outlines[tolerance]
+
+    def group_outlines(self, groups, tolerance=0.0):
+        """İl grupları (ör. müdür bölgeleri) birleşiminin dış sınırları - NaN ayırıcılı lon / lat"""
+        provinces = self._buffered_provinces()
+        groups = np.asarray(groups)
+        unions = [shapely.union_all(provinces[groups == g]) for g in np.unique(groups)]
+        return self._exterior_lonlat(shapely.simplify(np.asarray(unions), tolerance))
+
+    def geojson(self, rows, tolerance=0.0, decimals=MAP_COORD_DECIMALS):
+        """Seçili iller için FeatureCollection (feature id = CITY_KEY)"""
+        geometries = self._feature_geometries(tolerance, decimals)
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "id": self.keys[row], "properties": {}, "geometry": geometries[row]}
+                for row in np.unique(rows).tolist()
+            ],
+        }
+
+
+@st.cache_resource
+def get_geometry_store(_gdf):
+    """load_geo ile aynı artefakt üzerinde mmap'li geometri deposu (artefakt yoksa bellekte)"""
+    try:
+        _, coords, offsets = read_geometry_arrays(geometry_artifact_dir(), mmap_mode="r")
+    except (OSError, ValueError):
+        _, coords, offsets = shapely.to_ragged_array(_gdf.geometry.values)
+    return GeometryStore(coords, offsets, _gdf["CITY_KEY"])
+
+# =============================================================================
+# FIGURE - DÜZELTİLMİŞ ETİKETLER
+# =============================================================================
+MAP_VIEWS = ["Bölge Görünümü", "Şehir Görünümü"]
+MAP_LAYOUT = dict(
+    geo=dict(
+        projection=dict(type="mercator"),
+        center=dict(lat=39, lon=35),
+        lonaxis=dict(range=[25, 45]),
+        lataxis=dict(range=[35, 43]),
+        visible=False,
+        bgcolor="rgba(240,240,240,0.3)"
+    ),
+    height=750,
+    margin=dict(l=0, r=0, t=40, b=0),
+    paper_bgcolor="white"
+)
+MAP_HOVERTEMPLATE = (
+    "<b>%{customdata[0]}</b><br>"
+    "Bölge: %{customdata[1]}<br>"
+    "PF Kutu: %{customdata[2]:,.0f}<br>"
+    "Pazar Payı: %{customdata[3]:.1f}%<br>"
+    "Komşu Pazar Payı: %{customdata[4]:.1f}%<br>"
+    "Komşuluk: %{customdata[5]}"
+    "<extra></extra>"
+)
+
+
+def _map_columns(gdf, store):
+    """Harita için gereken kolonlar numpy dizisi olarak (+ geometri satırları)"""
+    keys = gdf["CITY_KEY"].astype(object).to_numpy()
+    return {
+        "keys": keys,
+        "rows": store.rows(keys),
+        "regions": gdf["Bölge"].astype(object).to_numpy(),
+        "managers": gdf["Ticaret Müdürü"].astype(object).to_numpy(),
+        "pf": gdf["PF Kutu"].to_numpy(dtype="float64"),
+        "toplam": gdf["Toplam Kutu"].to_numpy(dtype="float64"),
+        "pay": gdf["Pazar Payı %"].to_numpy(dtype="float64").round(2),   # float32 kalıntı haneleri JSON'a taşınmasın
+        "sehir": gdf["Şehir"].astype(object).to_numpy(),
+        "komsu_pay": gdf["Komşu Pazar Payı %"].to_numpy(dtype="float64"),
+        "kume": gdf["Komşuluk Kümesi"].astype(object).to_numpy(),
+    }
+
+
+def _hover_data(cols, mask):
+    """MAP_HOVERTEMPLATE için satır başına customdata"""
+    return list(zip(
+        cols["sehir"][mask], cols["regions"][mask], cols["pf"][mask].tolist(), cols["pay"][mask].tolist(),
+        cols["komsu_pay"][mask].tolist(), cols["kume"][mask],
+    ))
+
+
+def _add_region_choropleths(fig, cols, store):
+    """Bölge başına bir choropleth trace (bölge rengi sabit z ile)"""
+    for region in pd.unique(cols["regions"]):
+        mask = cols["regions"] == region
         color = REGION_COLORS.get(region, "#CCCCCC")
         
         fig.add_choropleth(
-            geojson=json.loads(region_gdf.to_json()),
-            locations=region_gdf.index,
-            z=[1] * len(region_gdf),  # Sabit değer, renk için
+            geojson=store.geojson(cols["rows"][mask]),
+            locations=cols["keys"][mask],
+            z=np.ones(int(mask.sum()), dtype=np.int8),  # Sabit değer, renk için
             colorscale=[[0, color], [1, color]],
             marker_line_color="white",
             marker_line_width=1.5,
             showscale=False,
-            customdata=list(
-                zip(
-                    region_gdf["Şehir"],
-                    region_gdf["Bölge"],
-                    region_gdf["PF Kutu"],
-                    region_gdf["Pazar Payı %"]
-                )
-            ),
-            hovertemplate=(
-                "<b>%{customdata[0]}</b><br>"
-                "Bölge: %{customdata[1]}<br>"
-                "PF Kutu: %{customdata[2]:,.0f}<br>"
-                "Pazar Payı: %{customdata[3]:.1f}%"
-                "<extra></extra>"
-            ),
+            customdata=_hover_data(cols, mask),
+            hovertemplate=MAP_HOVERTEMPLATE,
             name=region
         )
 
-    # Sınır çizgileri
-    lons, lats = [], []
-    for geom in gdf.geometry.boundary:
-        lo, la = lines_to_lonlat(geom)
-        lons += lo
-        lats += la
+
+def _add_boundaries(fig, rows, store):
+    """Sınır çizgileri - tek koordinat tamponundan dilim, tipli dizi olarak"""
+    lons, lats = store.boundary_lonlat(rows)
 
     fig.add_scattergeo(
-        lon=lons,
-        lat=lats,
+        lon=encode_coords(lons),
+        lat=encode_coords(lats),
         mode="lines",
         line=dict(color="rgba(255,255,255,0.8)", width=1),
         hoverinfo="skip",
         showlegend=False
     )
 
-    # Etiket görünümü seçimine göre
-    if view_mode == "Bölge Görünümü":
-        # Bölge etiketleri - FİLTRELENMİŞ TOPLAMA GÖRE YÜZDE
-        label_lons, label_lats, label_texts = [], [], []
+
+def region_labels(cols, mask, store):
+    """
+    Bölge etiketleri - kapsamın (mask) PF toplamına göre yüzde
+
+    Döndürür: (lon, lat, metin) - sadece satışı olan bölgeler
+    """
+    regions, pf, toplam = cols["regions"][mask], cols["pf"][mask], cols["toplam"][mask]
+    rows = cols["rows"][mask]
+    pf_total = pf.sum()
+    label_lons, label_lats, label_texts = [], [], []
+    
+    for region in pd.unique(regions):
+        in_region = regions == region
+        total = pf[in_region].sum()
         
-        for region in gdf["Bölge"].unique():
-            region_gdf = gdf[gdf["Bölge"] == region]
-            total = region_gdf["PF Kutu"].sum()
+        if total > 0:  # Sadece veri olan bölgeleri göster
+            percent = (total / pf_total * 100) if pf_total > 0 else 0
+            region_toplam_pazar = toplam[in_region].sum()
+            pazar_payi = (total / region_toplam_pazar * 100) if region_toplam_pazar > 0 else 0
             
-            if total > 0:  # Sadece veri olan bölgeleri göster
-                # FİLTRELENMİŞ veriye göre yüzde hesapla
-                percent = (total / filtered_pf_toplam * 100) if filtered_pf_toplam > 0 else 0
-                
-                # Bölgedeki toplam pazar payını hesapla
-                region_toplam_pazar = region_gdf["Toplam Kutu"].sum()
-                pazar_payi = (total / region_toplam_pazar * 100) if region_toplam_pazar > 0 else 0
-                
-                lon, lat = get_region_center(region_gdf)
-                label_lons.append(lon)
-                label_lats.append(lat)
-                label_texts.append(
-                    f"<b>{region}</b><br>"
-                    f"{total:,.0f} ({percent:.1f}%)<br>"
-                    f"Pazar Payı: {pazar_payi:.1f}%"
-                )
+            lon, lat = store.center(np.unique(rows[in_region]))
+            label_lons.append(lon)
+            label_lats.append(lat)
+            label_texts.append(
+                f"<b>{region}</b><br>"
+                f"{total:,.0f} ({percent:.1f}%)<br>"
+                f"Pazar Payı: {pazar_payi:.1f}%"
+            )
+    return np.array(label_lons), np.array(label_lats), label_texts
 
-        fig.add_scattergeo(
-            lon=label_lons,
-            lat=label_lats,
-            mode="text",
-            text=label_texts,
-            textfont=dict(size=10, color="black", family="Arial Black"),
-            hoverinfo="skip",
-            showlegend=False
-        )
-    
-    else:  # Şehir Görünümü - FİLTRELENMİŞ TOPLAMA GÖRE YÜZDE
-        city_lons, city_lats, city_texts = [], [], []
-        
-        for idx, row in gdf.iterrows():
-            if row["PF Kutu"] > 0:
-                # FİLTRELENMİŞ veriye göre yüzde hesapla
-                percent = (row["PF Kutu"] / filtered_pf_toplam * 100) if filtered_pf_toplam > 0 else 0
-                
-                centroid = row.geometry.centroid
-                city_lons.append(centroid.x)
-                city_lats.append(centroid.y)
-                city_texts.append(
-                    f"<b>{row['Şehir']}</b><br>"
-                    f"{row['PF Kutu']:,.0f} ({percent:.1f}%)<br>"
-                    f"Pazar: {row['Pazar Payı %']:.1f}%"
-                )
-        
-        fig.add_scattergeo(
-            lon=city_lons,
-            lat=city_lats,
-            mode="text",
-            text=city_texts,
-            textfont=dict(size=8, color="black", family="Arial"),
-            hoverinfo="skip",
-            showlegend=False
-        )
 
-    fig.update_layout(
-        geo=dict(
-            projection=dict(type="mercator"),
-            center=dict(lat=39, lon=35),
-            lonaxis=dict(range=[25, 45]),
-            lataxis=dict(range=[35, 43]),
-            visible=False,
-            bgcolor="rgba(240,240,240,0.3)"
-        ),
-        height=750,
-        margin=dict(l=0, r=0, t=40, b=0),
-        paper_bgcolor="white"
+def city_labels(cols, mask, store):
+    """Şehir etiketleri - kapsamın PF toplamına göre yüzde; sadece aktif şehirler"""
+    pf = cols["pf"][mask]
+    active = pf > 0
+    pf_total = pf.sum()
+    percent = pf[active] / pf_total * 100 if pf_total > 0 else np.zeros(int(active.sum()))
+    centroids = store.centroids[cols["rows"][mask][active]]
+    texts = [
+        f"<b>{name}</b><br>"
+        f"{value:,.0f} ({share:.1f}%)<br>"
+        f"Pazar: {market_share:.1f}%"
+        for name, value, share, market_share in zip(cols["sehir"][mask][active], pf[active], percent, cols["pay"][mask][active])
+    ]
+    return centroids[:, 0], centroids[:, 1], texts
+
+
+def _add_labels(fig, points, view, visible=True):
+    lons, lats, texts = points
+    fig.add_scattergeo(
+        lon=encode_coords(lons),
+        lat=encode_coords(lats),
+        mode="text",
+        text=texts,
+        textfont=(
+            dict(size=10, color="black", family="Arial Black") if view == "Bölge Görünümü"
+            else dict(size=8, color="black", family="Arial")
+        ),
+        hoverinfo="skip",
+        showlegend=False,
+        visible=visible,
+        name=view
+    )
+
+
+@profiled(memory=True)
+def create_figure(gdf, manager, view_mode, store):
+    """
+    Harita oluşturur - etiketlerde FİLTRELENMİŞ veriye göre yüzde gösterir
+
+    Geometri GeometryStore'dan dilimlenir; Shapely nesnesi kullanılmaz.
+    """
+    if manager != "TÜMÜ":
+        gdf = gdf[gdf["Ticaret Müdürü"] == manager]
+
+    cols = _map_columns(gdf, store)
+    everything = np.ones(len(gdf), dtype=bool)
+
+    fig = go.Figure()
+    _add_region_choropleths(fig, cols, store)
+    _add_boundaries(fig, cols["rows"], store)
+
+    # Etiket görünümü seçimine göre - FİLTRELENMİŞ TOPLAMA GÖRE YÜZDE
+    if view_mode == "Bölge Görünümü":
+        _add_labels(fig, region_labels(cols, everything, store), view_mode)
+    else:
+        _add_labels(fig, city_labels(cols, everything, store), view_mode)
+
+    fig.update_layout(**MAP_LAYOUT)
+    return fig
+
+# =============================================================================
+# TARAYICI TARAFI HARİTA FİLTRESİ
+# =============================================================================
+def _restyle_coords(values):
+    """updatemenus argümanları tipli diziye çözülmez; nicemlenmiş düz liste"""
+    return np.round(np.asarray(values, dtype="float64"), MAP_COORD_DECIMALS).tolist()
+
+
+@profiled()
+@st.cache_resource(max_entries=8)
+def build_client_map(data_key, view_mode, _merged, _store):
+    """
+    Filtreleri tarayıcıda uygulayan harita (veri başına bir kez kurulur)
+
+    Tüm iller geometrisi ve il öznitelikleri figüre bir kez gömülür. Kapsam
+    menüsü (TÜMÜ / müdür / bölge) her bölge trace'inin locations + z
+    dizilerini ve etiket metinlerini restyle ile değiştirir; görünüm düğmeleri
+    etiket trace'lerinin görünürlüğünü açıp kapatır. Seçim değişince sunucu
+    çalışmaz, geometri yeniden gönderilmez.
+    """
+    cols = _map_columns(_merged, _store)
+    regions = pd.unique(cols["regions"])
+
+    fig = go.Figure()
+    _add_region_choropleths(fig, cols, _store)
+    _add_boundaries(fig, cols["rows"], _store)
+    everything = np.ones(len(cols["keys"]), dtype=bool)
+    _add_labels(fig, region_labels(cols, everything, _store), MAP_VIEWS[0], view_mode == MAP_VIEWS[0])
+    _add_labels(fig, city_labels(cols, everything, _store), MAP_VIEWS[1], view_mode == MAP_VIEWS[1])
+    label_traces = [len(regions) + 1, len(regions) + 2]
+
+    scopes = [("🌍 TÜMÜ", everything)]
+    scopes += [(f"👤 {m}", cols["managers"] == m) for m in sorted(pd.unique(cols["managers"]))]
+    scopes += [(f"📍 {b}", cols["regions"] == b) for b in sorted(pd.unique(cols["regions"])) if b != "DİĞER"]
+
+    traces = list(range(len(regions))) + label_traces
+    scope_buttons = []
+    for label, mask in scopes:
+        locations = [cols["keys"][mask & (cols["regions"] == region)].tolist() for region in regions]
+        region_points = region_labels(cols, mask, _store)
+        city_points = city_labels(cols, mask, _store)
+        scope_buttons.append(dict(
+            label=label,
+            method="restyle",
+            args=[{
+                # Choropleth trace'leri locations + z, etiket trace'leri lon / lat / text alır
+                "locations": locations + [None, None],
+                "z": [[1] * len(loc) for loc in locations] + [None, None],
+                "customdata": [_hover_data(cols, mask & (cols["regions"] == region)) for region in regions] + [None, None],
+                "lon": [None] * len(regions) + [_restyle_coords(region_points[0]), _restyle_coords(city_points[0])],
+                "lat": [None] * len(regions) + [_restyle_coords(region_points[1]), _restyle_coords(city_points[1])],
+                "text": [None] * len(regions) + [region_points[2], city_points[2]],
+            }, traces],
+        ))
+
+    view_buttons = [
+        dict(label=view, method="restyle", args=[{"visible": [view == v for v in MAP_VIEWS]}, label_traces])
+        for view in MAP_VIEWS
+    ]
+
+    fig.update_layout(**MAP_LAYOUT)
+    fig.update_layout(updatemenus=[
+        dict(type="dropdown", buttons=scope_buttons, active=0, x=0.01, xanchor="left", y=0.99, yanchor="top"),
+        dict(type="buttons", direction="right", buttons=view_buttons, active=MAP_VIEWS.index(view_mode),
+             x=0.99, xanchor="right", y=0.99, yanchor="top"),
+    ])
+    return fig
+
+def client_map_scope(fig, manager="TÜMÜ", bolge="TÜMÜ"):
+    """
+    Kenar çubuğu seçimine karşılık gelen kapsam düğmesini haritanın başlangıç
+    durumu yap: düğmenin restyle değerleri trace'lere yazılır, menü o düğmede
+    açılır. Önbellekteki figür değişmez (kopya). Müdür ve bölge birlikte
+    seçiliyse menüde ortak kapsam olmadığından müdür kapsamı açılır.
+    """
+    if manager != "TÜMÜ":
+        label = f"👤 {manager}"
+    elif bolge != "TÜMÜ":
+        label = f"📍 {bolge}"
+    else:
+        return fig
+    labels = [button.label for button in fig.layout.updatemenus[0].buttons]
+    if label not in labels:
+        return fig
+    active = labels.index(label)
+    values, traces = fig.layout.updatemenus[0].buttons[active].args
+    fig = go.Figure(fig)    # önbellekteki figür değişmez
+    for attr, per_trace in values.items():
+        for index, value in zip(traces, per_trace):
+            if value is not None:
+                fig.data[index][attr] = value
+    fig.layout.updatemenus[0].active = active
+    return fig
+
+# =============================================================================
+# DÖNEM ANİMASYONU
+# =============================================================================
+PERIOD_METRICS = {
+    # metrik: (renk skalası, hover / etiket formatı)
+    "PF Kutu": ("Blues", "{:,.0f}"),
+    "Pazar Payı %": ("Greens", "{:.1f}%"),
+}
+PERIOD_FRAME_MS = 600
+
+
+def _period_label(file_name):
+    return file_name.rsplit(".", 1)[0]
+
+
+@profiled()
+@st.cache_data(max_entries=8)
+def build_period_matrix(file_keys, _files, _store, _gdf):
+    """
+    Yüklenen her dosya bir dönem: (dönem x il) PF Kutu ve Toplam Kutu matrisleri
+
+    Koordinatlı dosyalar ana haritadaki gibi önce aggregate_points ile il
+    tablosuna indirgenir; il isimden değil koordinattan gelir. Tüm dosyalar
+    tek tabloda birleştirilir; şehir adı normalizasyonu benzersiz isimler
+    üzerinde bir kez yapılır ve dönem * il_sayısı + il kodu üzerinden tek
+    bincount ile toplanır. Boş veya eşleşmeyen şehirler atlanır.
+    """
+    parts = []
+    for period, file in enumerate(_files):
+        df = load_excel(file)
+        if point_columns(df) is not None:
+            df = aggregate_points(frame_fingerprint(df), df, _gdf)[0]
+        pf = pd.to_numeric(df["Kutu Adet"], errors="coerce").fillna(0)
+        toplam_col = next((c for c in TOPLAM_COLUMN_CANDIDATES if c in df.columns), None)
+        toplam = pd.to_numeric(df[toplam_col], errors="coerce").fillna(0) if toplam_col else pf * 3
+        parts.append(pd.DataFrame({"Dönem": period, "Şehir": df["Şehir"], "PF Kutu": pf, "Toplam Kutu": toplam}))
+    frame = pd.concat(parts, ignore_index=True)
+
+    # Boş isim astype(str) ile "NAN" metnine dönüşeceği için önceden maskelenir
+    named = frame["Şehir"].notna().to_numpy()
+    codes, names = pd.factorize(frame["Şehir"].astype(str).str.upper())
+    keys = pd.Series(names).replace(FIX_CITY_MAP).map(normalize_city).to_numpy(dtype=object)
+    rows = _store.rows(keys)[codes]
+    keep = named & (rows >= 0)
+
+    n_periods, n_provinces = len(_files), len(_store.keys)
+    flat = frame["Dönem"].to_numpy()[keep] * n_provinces + rows[keep]
+    size = n_periods * n_provinces
+    pf = np.bincount(flat, weights=frame["PF Kutu"].to_numpy(dtype="float64")[keep], minlength=size)
+    toplam = np.bincount(flat, weights=frame["Toplam Kutu"].to_numpy(dtype="float64")[keep], minlength=size)
+    pf, toplam = pf.reshape(n_periods, n_provinces), toplam.reshape(n_periods, n_provinces)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(toplam > 0, pf / toplam * 100, 0).round(2)
+    return {
+        "periods": [_period_label(file.name) for file in _files],
+        "PF Kutu": pf,
+        "Toplam Kutu": toplam,
+        "Pazar Payı %": share,
+    }
+
+
+@profiled()
+@st.cache_resource(max_entries=8)
+def build_period_animation(file_keys, metric, _matrix, _store, _names):
+    """
+    Dönem kaydırıcılı animasyonlu harita
+
+    Geometri (tüm iller) ve etiket konumları figürde bir kez tanımlanır; her
+    Plotly frame'i sadece il başına z değerlerini ve etiket metinlerini taşır.
+    Renk aralığı tüm dönemlerde sabittir, böylece dönemler karşılaştırılabilir.
+    """
+    values = _matrix[metric]
+    active = _matrix["PF Kutu"] > 0
+    colorscale, fmt = PERIOD_METRICS[metric]
+    periods = _matrix["periods"]
+    rows = np.arange(len(_store.keys))
+    keys = _store.keys.to_numpy(dtype=object)
+
+    # Tüm (dönem x il) etiketleri tek geçişte; satışı olmayan iller boş
+    texts = np.full(values.shape, "", dtype=object)
+    texts[active] = [fmt.format(v) for v in values[active]]
+    z = values.astype(np.float32)
+
+    fig = go.Figure()
+    fig.add_choropleth(
+        geojson=_store.geojson(rows),
+        locations=keys,
+        z=z[0],
+        zmin=float(values.min()),
+        zmax=float(values.max()),
+        colorscale=colorscale,
+        marker_line_color="white",
+        marker_line_width=1,
+        customdata=_names,
+        hovertemplate="<b>%{customdata}</b><br>" + metric + ": %{z:,.1f}<extra></extra>",
+        colorbar=dict(title=metric, thickness=12),
+    )
+    fig.add_scattergeo(
+        lon=encode_coords(_store.centroids[:, 0]),
+        lat=encode_coords(_store.centroids[:, 1]),
+        mode="text",
+        text=texts[0].tolist(),
+        textfont=dict(size=7, color="black"),
+        hoverinfo="skip",
+        showlegend=False,
+    )
+    fig.frames = [
+        go.Frame(name=period, data=[go.Choropleth(z=z[i]), go.Scattergeo(text=texts[i].tolist())], traces=[0, 1])
+        for i, period in enumerate(periods)
+    ]
+
+    play = dict(frame=dict(duration=PERIOD_FRAME_MS, redraw=True), transition=dict(duration=0), fromcurrent=True)
+    fig.update_layout(**MAP_LAYOUT)
+    fig.update_layout(
+        height=650,
+        margin=dict(l=0, r=0, t=40, b=60),
+        updatemenus=[dict(
+            type="buttons", direction="left", x=0.01, xanchor="left", y=0, yanchor="top",
+            buttons=[
+                dict(label="▶", method="animate", args=[None, play]),
+                dict(label="⏸", method="animate", args=[[None], dict(mode="immediate", frame=dict(duration=0, redraw=False))]),
+            ],
+        )],
+        sliders=[dict(
+            active=0, x=0.08, len=0.9, y=0, yanchor="top", currentvalue=dict(prefix="Dönem: "),
+            steps=[
+                dict(label=period, method="animate",
+                     args=[[period], dict(mode="immediate", frame=dict(duration=0, redraw=True), transition=dict(duration=0))])
+                for period in periods
+            ],
+        )],
+    )
+    return fig
+
+# =============================================================================
+# KÜÇÜK ÇOKLU HARİTALAR
+# =============================================================================
+SMALL_MULTIPLE_COLUMNS = 4
+SMALL_MULTIPLE_HEIGHT = 230          # panel satırı başına piksel
+SMALL_MULTIPLE_TOLERANCE = 0.03      # derece; ~250 px genişlikte fark edilmez
+SMALL_MULTIPLE_DECIMALS = 2
+SMALL_MULTIPLE_COLORSCALE = [[0, "#DBEAFE"], [0.5, "#3B82F6"], [1, "#1E3A8A"]]
+
+
+@profiled()
+@st.cache_resource(max_entries=8)
+def build_small_multiples(data_key, by, metric, _merged, _store):
+    """
+    Müdür / bölge başına bir mini Türkiye haritası, tek figürde geo subplot ızgarası
+
+    Paneller aynı sadeleştirilmiş GeoJSON özellik listesinden (süreç başına bir
+    kez kurulur) sadece kendi illerini alır; kapsam bağlamı için her panelde
+    Türkiye dış sınırı tipli dizi çizgi olarak durur. Müdürler / bölgeler
+    illeri paylaştırdığı için tüm ızgaranın geometrisi tek haritanınki kadardır.
+    Ortak coloraxis tek renk çubuğu verir. Figür sözlük olarak kurulur.
+    """
+    panel_values = _merged[by].astype(object).to_numpy()
+    panels = [p for p in sorted(pd.unique(panel_values)) if p not in ("YOK", "DİĞER")]
+    panel_index = pd.Index(panels).get_indexer(panel_values)
+    rows = _store.rows(_merged["CITY_KEY"].astype(object).to_numpy())
+    keep = np.flatnonzero((panel_index >= 0) & (rows >= 0))
+
+    # Satırları panele göre grupla: tek stabil sıralama + sınırlar
+    keep = keep[np.argsort(panel_index[keep], kind="stable")]
+    bounds = np.searchsorted(panel_index[keep], np.arange(len(panels) + 1))
+    values = _merged[metric].to_numpy(dtype="float64")[keep]
+    pf = _merged["PF Kutu"].to_numpy(dtype="float64")[keep]
+    market = _merged["Toplam Kutu"].to_numpy(dtype="float64")[keep]
+    cities = _merged["Şehir"].astype(object).to_numpy()[keep]
+    keys = _store.keys.to_numpy(dtype=object)
+    outline_lons, outline_lats = (encode_coords(v) for v in _store.outline_lonlat(SMALL_MULTIPLE_TOLERANCE))
+
+    n_cols = max(1, min(SMALL_MULTIPLE_COLUMNS, len(panels)))
+    n_rows = max(1, -(-len(panels) // n_cols))
+    fmt = PERIOD_METRICS[metric][1]
+
+    data, layout = [], {
+        "height": SMALL_MULTIPLE_HEIGHT * n_rows,
+        "margin": dict(l=0, r=0, t=30, b=0),
+        "paper_bgcolor": "white",
+        "showlegend": False,
+        "coloraxis": dict(
+            cmin=0, cmax=float(values.max()) if len(values) else 1.0,
+            colorscale=SMALL_MULTIPLE_COLORSCALE, colorbar=dict(title=metric, thickness=12),
+        ),
+        "annotations": [],
+    }
+    for i, panel in enumerate(panels):
+        part = slice(bounds[i], bounds[i + 1])
+        geo_id = "geo" if i == 0 else f"geo{i + 1}"
+        row, col = divmod(i, n_cols)
+        x0, y1 = col / n_cols, 1 - row / n_rows
+        layout[geo_id] = dict(
+            MAP_LAYOUT["geo"],
+            domain=dict(x=[x0 + 0.005, x0 + 1 / n_cols - 0.005], y=[y1 - 1 / n_rows + 0.02, y1 - 0.04]),
+        )
+
+        # Panel başlığı: PF toplamı veya panelin toplam pazar payı
+        panel_pf, panel_market = pf[part].sum(), market[part].sum()
+        summary = panel_pf if metric == "PF Kutu" else (panel_pf / panel_market * 100 if panel_market > 0 else 0)
+        layout["annotations"].append(dict(
+            text=f"<b>{panel}</b> · {fmt.format(summary)}",
+            x=x0 + 0.5 / n_cols, y=y1, xref="paper", yref="paper",
+            xanchor="center", yanchor="top", showarrow=False, font=dict(size=11),
+        ))
+
+        data.append(dict(
+            type="scattergeo", geo=geo_id, lon=outline_lons, lat=outline_lats, mode="lines",
+            line=dict(color="#94A3B8", width=0.8), hoverinfo="skip",
+        ))
+        data.append(dict(
+            type="choropleth",
+            geo=geo_id,
+            geojson=_store.geojson(rows[keep[part]], SMALL_MULTIPLE_TOLERANCE, SMALL_MULTIPLE_DECIMALS),
+            locations=keys[rows[keep[part]]],
+            z=values[part].astype(np.float32),
+            coloraxis="coloraxis",
+            marker=dict(line=dict(color="white", width=0.5)),
+            customdata=cities[part],
+            hovertemplate=f"<b>{panel}</b><br>%{{customdata}}: %{{z:,.1f}}<extra></extra>",
+        ))
+    return go.Figure(dict(data=data, layout=layout))
+
+# =============================================================================
+# KOMŞULUK ANALİZİ
+# =============================================================================
+NEIGHBOUR_CLUSTERS = {
+    # (il payı, komşu payı) ortalamaya göre yüksek / düşük
+    "HH": "🔥 Güçlü Bölge",           # güçlü il, güçlü komşular
+    "HL": "🏝️ Güçlü Ada",             # güçlü il, zayıf komşular
+    "LH": "🎯 Yayılım Fırsatı",       # zayıf il, güçlü komşular
+    "LL": "❄️ Zayıf Bölge",           # zayıf il, zayıf komşular
+}
+NEIGHBOUR_NO_DATA = "Veri yok"
+
+
+@st.cache_resource
+def get_adjacency(_gdf):
+    """
+    81 il komşuluk matrisi (scipy.sparse CSR, simetrik 0/1) - süreç başına bir kez
+
+    Tamponlanmış poligonlar STRtree ile tek sorguda kesişim testinden geçer.
+    """
+    polygons = np.asarray(_gdf.geometry.values)
+    left, right = shapely.STRtree(polygons).query(shapely.buffer(polygons, NEIGHBOUR_BUFFER), predicate="intersects")
+    keep = left != right
+    n = len(polygons)
+    adjacency = sparse.csr_matrix((np.ones(int(keep.sum())), (left[keep], right[keep])), shape=(n, n))
+    return ((adjacency + adjacency.T) > 0).astype(np.float64).tocsr()
+
+
+@profiled()
+@st.cache_data(max_entries=8)
+def neighbourhood_metrics(data_key, _merged, _gdf):
+    """
+    İl başına komşuluk metrikleri (ulusal; filtre sınırları komşuluğu kesmez)
+
+    - Komşu Pazar Payı %: pazarı olan komşuların ortalama payı (satır
+      standartlaştırılmış mekânsal gecikme, tek seyrek matris-vektör çarpımı)
+    - Komşuluk Kümesi: il payı ve komşu payının ortalamaya göre konumu (HH/HL/LH/LL)
+    - Yayılım Potansiyeli: il payı komşu seviyesine çıksa kazanılacak kutu
+    - Komşu PF Kutu: komşu illerdeki toplam PF satışı
+
+    Döndürür: CITY_KEY indeksli DataFrame (geometri sırasıyla)
+    """
+    keys = _gdf["CITY_KEY"].to_numpy(dtype=object)
+    rows = pd.Index(keys).get_indexer(_merged["CITY_KEY"].astype(object).to_numpy())
+    ok = rows >= 0
+    n = len(keys)
+    pf = np.bincount(rows[ok], weights=_merged["PF Kutu"].to_numpy(dtype="float64")[ok], minlength=n)
+    market = np.bincount(rows[ok], weights=_merged["Toplam Kutu"].to_numpy(dtype="float64")[ok], minlength=n)
+    has_market = market > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(has_market, pf / market * 100, 0.0)
+
+    adjacency = get_adjacency(_gdf)
+    # Pazarı olmayan komşular ortalamaya girmez
+    weights = adjacency @ sparse.diags(has_market.astype(np.float64))
+    degree = np.asarray(weights.sum(axis=1)).ravel()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lag = np.where(degree > 0, (weights @ share) / degree, np.nan)
+
+    mean = share[has_market].mean() if has_market.any() else 0.0
+    codes = np.char.add(np.where(share >= mean, "H", "L"), np.where(lag >= mean, "H", "L"))
+    cluster = pd.Series(codes).map(NEIGHBOUR_CLUSTERS).to_numpy(dtype=object)
+    cluster[~has_market | np.isnan(lag)] = NEIGHBOUR_NO_DATA
+    spill = np.where(has_market & ~np.isnan(lag), np.clip(lag - share, 0, None) / 100 * market, 0.0)
+
+    return pd.DataFrame({
+        "Komşu Pazar Payı %": np.nan_to_num(lag).round(2),
+        "Komşuluk Kümesi": cluster,
+        "Yayılım Potansiyeli": spill.round(0),
+        "Komşu PF Kutu": adjacency @ pf,
+    }, index=pd.Index(keys, name="CITY_KEY"))
+
+
+def attach_neighbourhood(merged, neighbourhood):
+    """Komşuluk kolonlarını il satırlarına ekle (CITY_KEY ile pozisyonel eşleme)"""
+    rows = neighbourhood.index.get_indexer(merged["CITY_KEY"].astype(object).to_numpy())
+    return merged.assign(**{col: neighbourhood[col].to_numpy()[rows] for col in neighbourhood.columns})
+
+# =============================================================================
+# BÖLGE DENGELEME (MÜDÜR ATAMA ÖNERİSİ)
+# =============================================================================
+TERRITORY_NO_MANAGER = "YOK"       # prepare_data: veride müdürü olmayan il
+TERRITORY_TIME_BUDGET = 0.5        # saniye; yerel arama üst sınırı
+TERRITORY_OUTLINE_TOLERANCE = 0.01
+
+
+class TerritoryOptimizer:
+    """
+    Bitişik ve dengeli müdür bölgeleri: bölge büyütme + yerel hamle / takas
+
+    Amaç = Σ_k (pazar_k / hedef - 1)² + il_ağırlığı · Σ_k (il_k / hedef - 1)²
+           + değişim_cezası · (müdürü değişen il sayısı)
+
+    Bir ilin taşınması sadece iki bölgenin toplamını değiştirir; hamle farkı
+    O(1) hesaplanır, bitişiklik sadece değişen bölgelerde BFS ile doğrulanır.
+    """
+
+    def __init__(self, adjacency, market, current, n_managers, workload_weight=0.5, stability=0.02):
+        indptr, indices = adjacency.indptr, adjacency.indices
+        self.neighbours = [indices[indptr[i]:indptr[i + 1]].tolist() for i in range(adjacency.shape[0])]
+        self.market = np.asarray(market, dtype="float64").tolist()
+        self.current = np.asarray(current).tolist()       # -1: müdürsüz il
+        self.k = n_managers
+        self.market_target = (sum(self.market) / n_managers) or 1.0
+        self.count_target = len(self.market) / n_managers
+        self.workload_weight = workload_weight
+        self.stability = stability
+        self.evaluated = 0
+        self.accepted = 0
+        self.islands = []
+
+    def _cost(self, market, count):
+        return ((market / self.market_target - 1) ** 2
+                + self.workload_weight * (count / self.count_target - 1) ** 2)
+
+    def _change(self, i, k):
+        return self.stability if k != self.current[i] else 0.0
+
+    def _connected(self, nodes):
+        """Düğüm kümesi komşuluk grafında tek parça mı"""
+        if not nodes:
+            return False
+        start = next(iter(nodes))
+        seen, stack = {start}, [start]
+        while stack:
+            for j in self.neighbours[stack.pop()]:
+                if j in nodes and j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+        return len(seen) == len(nodes)
+
+    def _start(self, owner):
+        self.owner = owner
+        self.members = [set() for _ in range(self.k)]
+        self.load = [0.0] * self.k
+        for i, k in enumerate(owner):
+            self.members[k].add(i)
+            self.load[k] += self.market[i]
+
+    def objective(self):
+        change = sum(self._change(i, k) for i, k in enumerate(self.owner))
+        return sum(self._cost(self.load[k], len(self.members[k])) for k in range(self.k)) + change
+
+    def grow(self, centroids):
+        """
+        Her müdürün mevcut illerinden en büyük bitişik parçasıyla başla; boş
+        illeri her adımda en az yüklü bölgeye, önce kendi illerini, sonra
+        çekirdeğe en yakın komşu ili vererek dağıt.
+        """
+        n = len(self.market)
+        owner = [-1] * n
+        for k in range(self.k):
+            own = {i for i in range(n) if self.current[i] == k}
+            best, best_market = set(), -1.0
+            while own:
+                part, stack = set(), [own.pop()]
+                while stack:
+                    i = stack.pop()
+                    part.add(i)
+                    for j in self.neighbours[i]:
+                        if j in own:
+                            own.discard(j)
+                            stack.append(j)
+                part_market = sum(self.market[i] for i in part)
+                if part_market > best_market:
+                    best, best_market = part, part_market
+            for i in best:
+                owner[i] = k
+
+        members = [[i for i in range(n) if owner[i] == k] for k in range(self.k)]
+        cores = [centroids[m].mean(axis=0) for m in members]
+        load = [sum(self.market[i] for i in m) for m in members]
+        heap = [(load[k] / self.market_target + self.workload_weight * len(members[k]) / self.count_target, k)
+                for k in range(self.k)]
+        heapq.heapify(heap)
+        while heap:
+            _, k = heapq.heappop(heap)
+            frontier = {j for i in members[k] for j in self.neighbours[i] if owner[j] == -1}
+            if not frontier:
+                continue                  # bölge kapandı; komşuları dolu
+            j = min(frontier, key=lambda j: (self.current[j] != k, float(((centroids[j] - cores[k]) ** 2).sum())))
+            owner[j] = k
+            members[k].append(j)
+            load[k] += self.market[j]
+            heapq.heappush(heap, (load[k] / self.market_target + self.workload_weight * len(members[k]) / self.count_target, k))
+
+        # Hiçbir çekirdeğe bağlı olmayan iller (komşuluk grafında ayrı parça):
+        # parçanın bir ili en yakın çekirdeğe, kalanı komşusu üzerinden aynı
+        # bölgeye. Bu bölgeler bitişik olamaz; iller self.islands ile işaretlenir.
+        leftover = {i for i in range(n) if owner[i] == -1}
+        self.islands = sorted(leftover)
+        while leftover:
+            attached = False
+            for j in sorted(leftover):
+                owners = [owner[x] for x in self.neighbours[j] if owner[x] >= 0]
+                if owners:
+                    owner[j] = min(owners, key=load.__getitem__)
+                    load[owner[j]] += self.market[j]
+                    leftover.discard(j)
+                    attached = True
+            if not attached:
+                j = min(leftover)
+                owner[j] = int(np.argmin(((np.asarray(cores) - centroids[j]) ** 2).sum(axis=1)))
+                load[owner[j]] += self.market[j]
+                leftover.discard(j)
+        self._start(owner)
+        return owner
+
+    def _move(self, i, a, b):
+        self.owner[i] = b
+        self.members[a].discard(i)
+        self.members[b].add(i)
+        self.load[a] -= self.market[i]
+        self.load[b] += self.market[i]
+
+    def move_delta(self, i, a, b):
+        m = self.market[i]
+        ca, cb = len(self.members[a]), len(self.members[b])
+        return (self._cost(self.load[a] - m, ca - 1) + self._cost(self.load[b] + m, cb + 1)
+                - self._cost(self.load[a], ca) - self._cost(self.load[b], cb)
+                + self._change(i, b) - self._change(i, a))
+
+    def swap_delta(self, i, j, a, b):
+        shift = self.market[j] - self.market[i]
+        ca, cb = len(self.members[a]), len(self.members[b])
+        return (self._cost(self.load[a] + shift, ca) + self._cost(self.load[b] - shift, cb)
+                - self._cost(self.load[a], ca) - self._cost(self.load[b], cb)
+                + self._change(i, b) - self._change(i, a) + self._change(j, a) - self._change(j, b))
+
+    def improve(self, time_budget=TERRITORY_TIME_BUDGET, seed=0):
+        """
+        Sınır ilini komşu bölgeye taşı; taşıma kalmazsa komşu il çiftlerini
+        takas et. İlk iyileştiren hamle uygulanır, iyileşme bitince durur.
+        """
+        started = time.perf_counter()
+        order = np.random.default_rng(seed).permutation(len(self.market)).tolist()
+        improved = True
+        while improved and time.perf_counter() - started < time_budget:
+            improved = False
+            for i in order:
+                a = self.owner[i]
+                for b in {self.owner[j] for j in self.neighbours[i]} - {a}:
+                    self.evaluated += 1
+                    if self.move_delta(i, a, b) < -1e-12 and self._connected(self.members[a] - {i}):
+                        self._move(i, a, b)
+                        self.accepted += 1
+                        improved = True
+                        break
+            if improved:
+                continue
+            for i in order:
+                for j in self.neighbours[i]:
+                    a, b = self.owner[i], self.owner[j]
+                    if a == b:
+                        continue
+                    self.evaluated += 1
+                    if (self.swap_delta(i, j, a, b) < -1e-12
+                            and self._connected((self.members[a] - {i}) | {j})
+                            and self._connected((self.members[b] - {j}) | {i})):
+                        self._move(i, a, b)
+                        self._move(j, b, a)
+                        self.accepted += 1
+                        improved = True
+        return self.owner
+
+
+@profiled()
+@st.cache_data(max_entries=8)
+def propose_territories(data_key, workload_weight, stability, _merged, _gdf):
+    """
+    Müdür bölgesi önerisi (ulusal; kenar çubuğu filtrelerinden bağımsız)
+
+    İlin mevcut müdürü, ildeki en büyük pazarlı satırın müdürüdür.
+    Döndürür: (il tablosu, müdür özeti, önerilen bölge sınırları (lon, lat), istatistikler)
+    ya da ikiden az müdür varsa None
+    """
+    started = time.perf_counter()
+    keys = _gdf["CITY_KEY"].to_numpy(dtype=object)
+    n = len(keys)
+    rows = pd.Index(keys).get_indexer(_merged["CITY_KEY"].astype(object).to_numpy())
+    market = np.bincount(rows, weights=_merged["Toplam Kutu"].to_numpy(dtype="float64"), minlength=n)
+
+    owners = (
+        pd.DataFrame({"row": rows, "mudur": _merged["Ticaret Müdürü"].astype(object).to_numpy(),
+                      "pazar": _merged["Toplam Kutu"].to_numpy()})
+        .sort_values("pazar", ascending=False, kind="stable")
+        .drop_duplicates("row")
+    )
+    current_names = np.full(n, TERRITORY_NO_MANAGER, dtype=object)
+    current_names[owners["row"].to_numpy()] = owners["mudur"].to_numpy()
+    managers = pd.Index(sorted(set(current_names) - {TERRITORY_NO_MANAGER}))
+    if len(managers) < 2:
+        return None
+
+    store = get_geometry_store(_gdf)
+    optimizer = TerritoryOptimizer(get_adjacency(_gdf), market, managers.get_indexer(current_names),
+                                   len(managers), workload_weight, stability)
+    optimizer.grow(store.centroids)
+    grown = optimizer.objective()
+    search_started = time.perf_counter()
+    proposed = np.asarray(optimizer.improve())
+    search_seconds = time.perf_counter() - search_started
+    proposed_names = managers.to_numpy(dtype=object)[proposed]
+
+    cities = pd.DataFrame({
+        "CITY_KEY": keys,
+        "Şehir": _gdf["fixed_name"].to_numpy(dtype=object),
+        "Toplam Kutu": market,
+        "Mevcut Müdür": current_names,
+        "Önerilen Müdür": proposed_names,
+        "lon": store.centroids[:, 0],
+        "lat": store.centroids[:, 1],
+        "Ada": np.isin(np.arange(n), optimizer.islands),
+    })
+
+    def per_manager(names):
+        return (pd.DataFrame({"Ticaret Müdürü": names, "Pazar": market})
+                .groupby("Ticaret Müdürü").agg(Pazar=("Pazar", "sum"), Şehir=("Pazar", "size"))
+                .reindex(managers, fill_value=0))
+
+    before, after = per_manager(current_names), per_manager(proposed_names)
+    target = market.sum() / len(managers)
+    summary = pd.DataFrame({
+        "Ticaret Müdürü": managers,
+        "Mevcut Pazar": before["Pazar"].to_numpy(),
+        "Önerilen Pazar": after["Pazar"].to_numpy(),
+        "Mevcut Şehir": before["Şehir"].to_numpy(),
+        "Önerilen Şehir": after["Şehir"].to_numpy(),
+        "Mevcut Sapma %": (before["Pazar"].to_numpy() / target - 1) * 100 if target > 0 else 0.0,
+        "Önerilen Sapma %": (after["Pazar"].to_numpy() / target - 1) * 100 if target > 0 else 0.0,
+    })
+
+    outline = store.group_outlines(proposed, TERRITORY_OUTLINE_TOLERANCE)
+    stats = {
+        "Başlangıç Amacı": grown,
+        "Önerilen Amaç": optimizer.objective(),
+        "Denenen Hamle": optimizer.evaluated,
+        "Uygulanan Hamle": optimizer.accepted,
+        "Hamle / sn": optimizer.evaluated / search_seconds if search_seconds > 0 else 0.0,
+        "Süre": time.perf_counter() - started,
+        "Ada İl": len(optimizer.islands),
+    }
+    return cities, summary, outline, stats
+
+
+def territory_overlay(fig, proposal):
+    """Harita kopyasına önerilen müdür bölgelerinin sınırları ve müdürü değişen iller"""
+    cities, _, (lon, lat), _ = proposal
+    changed = cities[cities["Mevcut Müdür"] != cities["Önerilen Müdür"]]
+    fig = go.Figure(fig)    # önbellekteki figür değişmez
+    fig.add_trace(go.Scattergeo(
+        lon=encode_coords(lon), lat=encode_coords(lat),
+        mode="lines", line=dict(width=2.5, color="#0F172A"),
+        hoverinfo="skip", showlegend=False, name="Önerilen Bölgeler"
+    ))
+    fig.add_trace(go.Scattergeo(
+        lon=encode_coords(changed["lon"]), lat=encode_coords(changed["lat"]),
+        mode="markers", marker=dict(symbol="diamond", size=10, color="#F59E0B", line=dict(width=1, color="white")),
+        customdata=list(zip(changed["Şehir"], changed["Mevcut Müdür"], changed["Önerilen Müdür"])),
+        hovertemplate="<b>%{customdata[0]}</b><br>%{customdata[1]} → %{customdata[2]}<extra></extra>",
+        showlegend=False, name="Müdürü Değişen İller"
+    ))
+    return fig
+
+# =============================================================================
+# ZİYARET ROTALARI
+# =============================================================================
+EARTH_RADIUS_KM = 6371.0
+ROUTE_COLORS = [
+    "#0F172A", "#7C3AED", "#DB2777", "#EA580C", "#0891B2", "#16A34A",
+    "#CA8A04", "#DC2626", "#2563EB", "#9333EA", "#059669", "#B45309",
+]
+
+
+@st.cache_resource
+def get_distance_matrix(_gdf):
+    """İl merkezleri arası haversine mesafe matrisi (km, geometri sırasıyla) - süreç başına bir kez"""
+    lon, lat = np.radians(get_geometry_store(_gdf).centroids).T
+    a = (np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+         + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[:, None] - lon[None, :]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def plan_tour(dist, rows):
+    """
+    Kapalı tur: en yakın komşu + 2-opt, ilk satır sabit başlangıç
+
+    2-opt her i için tüm j kenar değişimlerinin kazancını tek vektörel
+    işlemle hesaplar ve en iyisini uygular; iyileşme kalmayınca durur.
+    Döndürür: tur sırasıyla satırlar, toplam km (başlangıca dönüş dahil)
+    """
+    rows = np.asarray(rows)
+    n = len(rows)
+    d = dist[np.ix_(rows, rows)]
+    tour = [0]
+    free = np.ones(n, dtype=bool)
+    free[0] = False
+    for _ in range(n - 1):
+        nearest = int(np.argmin(np.where(free, d[tour[-1]], np.inf)))
+        tour.append(nearest)
+        free[nearest] = False
+    tour = np.asarray(tour)
+
+    improved = n > 3
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            j = np.arange(i + 1, n)
+            a, b = tour[i - 1], tour[i]
+            c, e = tour[j], tour[(j + 1) % n]
+            gain = d[a, c] + d[b, e] - d[a, b] - d[c, e]
+            k = int(np.argmin(gain))
+            if gain[k] < -1e-9:
+                tour[i:j[k] + 1] = tour[i:j[k] + 1][::-1]
+                improved = True
+    closed = np.r_[tour, 0]
+    return rows[tour], float(d[closed[:-1], closed[1:]].sum())
+
+
+@profiled()
+@st.cache_data(max_entries=16)
+def plan_routes(data_key, stops, _merged, _gdf):
+    """
+    Müdür başına kapalı ziyaret turu: merkez il → işaretli iller → merkez il
+
+    Merkez il, müdürün en çok PF Kutu sattığı ildir.
+    stops: ((Ticaret Müdürü, Şehir), ...) - ziyaret edilecek işaretli iller
+    Döndürür: (durak tablosu - tur sırasıyla, müdür özeti, hesaplama süresi)
+    """
+    started = time.perf_counter()
+    dist = get_distance_matrix(_gdf)
+    centroids = get_geometry_store(_gdf).centroids
+    names = _gdf["fixed_name"].to_numpy(dtype=object)
+    row_of = pd.Index(names)
+
+    home = (
+        pd.DataFrame({"mudur": _merged["Ticaret Müdürü"].astype(object).to_numpy(),
+                      "row": row_of.get_indexer(_merged["Şehir"].astype(object).to_numpy()),
+                      "pf": _merged["PF Kutu"].to_numpy()})
+        .query("row >= 0")
+        .sort_values("pf", ascending=False, kind="stable")
+        .drop_duplicates("mudur")
+        .set_index("mudur")["row"]
+    )
+    stops = pd.DataFrame(list(stops), columns=["Ticaret Müdürü", "Şehir"])
+    stops["row"] = row_of.get_indexer(stops["Şehir"])
+    stops = stops[(stops["row"] >= 0) & (stops["Ticaret Müdürü"] != TERRITORY_NO_MANAGER)]
+
+    legs, summary = [], []
+    for manager, group in stops.groupby("Ticaret Müdürü", sort=True):
+        base = int(home.get(manager, group["row"].iloc[0]))
+        rows = [base] + [r for r in dict.fromkeys(group["row"].tolist()) if r != base]
+        tour, km = plan_tour(dist, rows)
+        step = np.r_[0.0, dist[tour[:-1], tour[1:]]]
+        legs.append(pd.DataFrame({
+            "Ticaret Müdürü": manager,
+            "Sıra": np.arange(len(tour)),
+            "Şehir": names[tour],
+            "Mesafe km": step,
+            "lon": centroids[tour, 0],
+            "lat": centroids[tour, 1],
+        }))
+        summary.append((manager, names[base], len(tour) - 1, km))
+
+    columns = ["Ticaret Müdürü", "Sıra", "Şehir", "Mesafe km", "lon", "lat"]
+    legs = pd.concat(legs, ignore_index=True) if legs else pd.DataFrame(columns=columns)
+    summary = pd.DataFrame(summary, columns=["Ticaret Müdürü", "Merkez", "Durak", "Tur km"])
+    return legs, summary, time.perf_counter() - started
+
+
+def route_overlay(fig, legs):
+    """Harita kopyasına müdür başına kapalı ziyaret turu (scattergeo çizgi + durak)"""
+    fig = go.Figure(fig)    # önbellekteki figür değişmez
+    for i, (manager, tour) in enumerate(legs.groupby("Ticaret Müdürü", sort=True)):
+        closed = pd.concat([tour, tour.head(1)])
+        fig.add_trace(go.Scattergeo(
+            lon=encode_coords(closed["lon"]), lat=encode_coords(closed["lat"]),
+            mode="lines+markers",
+            line=dict(width=2, color=ROUTE_COLORS[i % len(ROUTE_COLORS)]),
+            marker=dict(size=6, color=ROUTE_COLORS[i % len(ROUTE_COLORS)], line=dict(width=1, color="white")),
+            customdata=list(zip(closed["Sıra"], closed["Şehir"])),
+            hovertemplate=f"<b>{manager}</b><br>" + "%{customdata[0]}. durak: %{customdata[1]}<extra></extra>",
+            showlegend=False, name=f"Rota: {manager}"
+        ))
+    return fig
+
+# =============================================================================
+# YATIRIM STRATEJİSİ - GELİŞTİRİLMİŞ ALGORİTMA
+# =============================================================================
+@profiled(memory=True)
+def calculate_investment_strategy(df):
+    """
+    Geliştirilmiş Yatırım Stratejisi Algoritması
+    
+    Metrikler:
+    1. Pazar Büyüklüğü (Toplam Kutu): Pazarın ne kadar büyük olduğunu gösterir
+    2. Mevcut Performans (PF Kutu): Şu anki satış hacmimiz
+    3. Pazar Payı (%): Pazardaki yerimiz
+    
+    Strateji Mantığı:
+    - 🚀 AGRESİF: Büyük pazar + Düşük pazar payı = Büyük büyüme potansiyeli
+      → En yüksek ROI potansiyeli, agresif yatırım gerekli
+    
+    - ⚡ HIZLANDIRILMIŞ: Orta/Büyük pazar + Orta pazar payı = Momentum var
+      → İyi performans gösteriyor, hızlandırılmış yatırım ile liderliğe geçebilir
+    
+    - 🛡️ KORUMA: Büyük pazar + Yüksek pazar payı = Lider pozisyon
+      → Mevcut konumu korumak kritik, savunma odaklı
+    
+    - 💎 POTANSİYEL: Küçük pazar + Düşük pazar payı ANCAK yüksek büyüme hızı
+      → Gelecek vaat eden, seçici yatırım
+    
+    - 👁️ İZLEME: Küçük pazar + Düşük performans
+      → Düşük öncelik, izleme modunda tut
+      (Komşuları güçlü olan zayıf iller - 🎯 Yayılım Fırsatı - 💎 Potansiyel'e alınır)
+    """
+    # Analiz tabloları geometri taşımaz; sadece aktif şehirler
+    df = df.drop(columns="geometry", errors="ignore")
+    df = df[df["PF Kutu"] > 0]
+    
+    if len(df) == 0:
+        return df
+    
+    # 1. PAZAR BÜYÜKLÜĞÜ SEGMENTİ (Toplam Kutu)
+    try:
+        df["Pazar Büyüklüğü"] = pd.qcut(
+            df["Toplam Kutu"], 
+            q=3, 
+            labels=["Küçük", "Orta", "Büyük"],
+            duplicates='drop'
+        )
+    except:
+        df["Pazar Büyüklüğü"] = "Orta"
+    
+    # 2. PERFORMANS SEGMENTİ (PF Kutu)
+    try:
+        df["Performans"] = pd.qcut(
+            df["PF Kutu"], 
+            q=3, 
+            labels=["Düşük", "Orta", "Yüksek"],
+            duplicates='drop'
+        )
+    except:
+        df["Performans"] = "Orta"
+    
+    # 3. PAZAR PAYI SEGMENTİ
+    try:
+        df["Pazar Payı Segment"] = pd.qcut(
+            df["Pazar Payı %"], 
+            q=3, 
+            labels=["Düşük", "Orta", "Yüksek"],
+            duplicates='drop'
+        )
+    except:
+        df["Pazar Payı Segment"] = "Orta"
+    
+    # 4. BÜYÜME POTANSİYELİ (Gap = Pazar - Bizim Satış)
+    df["Büyüme Alanı"] = df["Toplam Kutu"] - df["PF Kutu"]
+    try:
+        df["Büyüme Potansiyeli"] = pd.qcut(
+            df["Büyüme Alanı"],
+            q=3,
+            labels=["Düşük", "Orta", "Yüksek"],
+            duplicates='drop'
+        )
+    except:
+        df["Büyüme Potansiyeli"] = "Orta"
+    
+    # 5. STRATEJİ ATAMA
+    def assign_strategy(row):
+        pazar_buyuklugu = str(row["Pazar Büyüklüğü"])
+        pazar_payi = str(row["Pazar Payı Segment"])
+        buyume_potansiyeli = str(row["Büyüme Potansiyeli"])
+        performans = str(row["Performans"])
+        
+        # AGRESİF: Büyük pazar + Düşük pazar payı + Yüksek büyüme alanı
+        if (pazar_buyuklugu in ["Büyük", "Orta"] and 
+            pazar_payi == "Düşük" and 
+            buyume_potansiyeli in ["Yüksek", "Orta"]):
+            return "🚀 Agresif"
+        
+        # HIZLANDIRILMIŞ: Orta/Büyük pazar + Orta pazar payı + İyi performans
+        elif (pazar_buyuklugu in ["Büyük", "Orta"] and 
+              pazar_payi == "Orta" and
+              performans in ["Orta", "Yüksek"]):
+            return "⚡ Hızlandırılmış"
+        
+        # KORUMA: Büyük pazar + Yüksek pazar payı
+        elif (pazar_buyuklugu == "Büyük" and 
+              pazar_payi == "Yüksek"):
+            return "🛡️ Koruma"
+        
+        # POTANSİYEL: Küçük pazar ama yüksek büyüme potansiyeli
+        elif (pazar_buyuklugu == "Küçük" and 
+              buyume_potansiyeli == "Yüksek" and
+              performans in ["Orta", "Yüksek"]):
+            return "💎 Potansiyel"
+        
+        # İZLEME: Geri kalan her şey
+        else:
+            return "👁️ İzleme"
+    
+    # Satır bazlı apply sadece segment kolonlarını görür; tüm tabloyu object
+    # dizisine çevirmez
+    segmentler = ["Pazar Büyüklüğü", "Pazar Payı Segment", "Büyüme Potansiyeli", "Performans"]
+    df["Yatırım Stratejisi"] = df[segmentler].apply(assign_strategy, axis=1)
+    
+    # KOMŞULUK: zayıf il + güçlü komşular izlemede bırakılmaz
+    if "Komşuluk Kümesi" in df.columns:
+        yayilim = (df["Yatırım Stratejisi"] == "👁️ İzleme") & (df["Komşuluk Kümesi"] == NEIGHBOUR_CLUSTERS["LH"])
+        df["Yatırım Stratejisi"] = df["Yatırım Stratejisi"].mask(yayilim, "💎 Potansiyel")
+    
+    return df
+
+# =============================================================================
+# FİLTRE DURUMU ANAHTARI
+# =============================================================================
+def frame_fingerprint(df):
+    """DataFrame içeriğinin kısa özeti - filtre durumu önbellek anahtarları için"""
+    hashed = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+# =============================================================================
+# SIRALAMA İNDEKSİ (TOP-N)
+# =============================================================================
+class RankingIndex:
+    """
+    Filtre durumu başına tek sıralama yapısı
+
+    Her metrik için bir kez azalan argsort ve prefix-sum dizisi tutulur;
+    top-k satırları ve top-k toplamları O(k) dilimleme ile cevaplanır.
+    Eşit değerlerde nlargest(keep="first") ile aynı sırayı verir (stable sort).
+    """
+
+    def __init__(self, df, metrics=("PF Kutu",)):
+        self.df = df
+        self._order = {}
+        self._prefix = {}
+        for metric in metrics:
+            self._build(metric)
+
+    def _build(self, metric):
+        values = self.df[metric].to_numpy(dtype="float64")
+        order = np.argsort(-values, kind="stable")
+        self._order[metric] = order
+        self._prefix[metric] = np.cumsum(values[order])
+
+    def order(self, metric):
+        """Azalan sıradaki satır pozisyonları"""
+        if metric not in self._order:
+            self._build(metric)
+        return self._order[metric]
+
+    def cumulative(self, metric):
+        """Azalan sıradaki kümülatif toplam (prefix-sum)"""
+        self.order(metric)
+        return self._prefix[metric]
+
+    def top(self, metric, k):
+        """nlargest(k, metric) karşılığı"""
+        return self.df.iloc[self.order(metric)[:k]]
+
+    def top_sum(self, metric, k):
+        """En büyük k değerin toplamı"""
+        prefix = self.cumulative(metric)
+        k = min(k, len(prefix))
+        return float(prefix[k - 1]) if k > 0 else 0.0
+
+    def top_where(self, metric, mask, k):
+        """Maskeyi sağlayan satırlar içinden nlargest(k, metric) - yeniden sıralama yapmaz"""
+        order = self.order(metric)
+        return self.df.iloc[order[np.asarray(mask)[order]][:k]]
+
+    def sorted_frame(self, metric):
+        """sort_values(metric, ascending=False) karşılığı"""
+        return self.df.iloc[self.order(metric)]
+
+
+@st.cache_resource(max_entries=64)
+def get_ranking_index(state_key, _df):
+    """Filtre durumu (veri özeti, müdür, bölge) başına önbelleklenmiş sıralama indeksi"""
+    return RankingIndex(_df, metrics=("PF Kutu", "Toplam Kutu"))
+
+# =============================================================================
+# EŞİK İNDEKSİ (FIRSAT KEŞFİ)
+# =============================================================================
+class ThresholdIndex:
+    """
+    Metrik eşikleriyle şehir seçimi için sıralı indeksler
+
+    Her metrik için bir kez artan argsort, sıralı değerler ve satır → sıra
+    pozisyonu (rank) tutulur. Bir eşik aralığı searchsorted ile sıralı dizide
+    bitişik bir dilime dönüşür; en dar dilimdeki adaylar diğer metriklerin
+    rank aralıklarıyla kesiştirilir. Tam tablo taraması yapılmaz.
+    """
+
+    def __init__(self, df, metrics=()):
+        self.df = df
+        self._order = {}
+        self._sorted = {}
+        self._rank = {}
+        for metric in metrics:
+            self._build(metric)
+
+    def _build(self, metric):
+        values = self.df[metric].to_numpy(dtype="float64")
+        order = np.argsort(values, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        self._order[metric] = order
+        self._sorted[metric] = values[order]
+        self._rank[metric] = rank
+
+    def bounds(self, metric, above=None, below=None):
+        """metric > above ve metric < below koşulunun sıralı dizideki [lo, hi) dilimi"""
+        if metric not in self._rank:    # _build'in son yazdığı sözlük; oturumlar arası yarım indeks görülmez
+            self._build(metric)
+        values = self._sorted[metric]
+        lo = int(np.searchsorted(values, above, side="right")) if above is not None else 0
+        hi = int(np.searchsorted(values, below, side="left")) if below is not None else len(values)
+        return lo, max(lo, hi)
+
+    def select(self, conditions, order_by):
+        """
+        Koşulları sağlayan satır pozisyonları, order_by metriğine göre azalan sırada
+
+        conditions: {metrik: (above, below)} - None olan sınır uygulanmaz
+        """
+        slices = {metric: self.bounds(metric, *limits) for metric, limits in conditions.items()}
+        narrowest = min(slices, key=lambda m: slices[m][1] - slices[m][0])
+        lo, hi = slices[narrowest]
+        candidates = self._order[narrowest][lo:hi]
+        for metric, (lo, hi) in slices.items():
+            if metric != narrowest:
+                rank = self._rank[metric][candidates]
+                candidates = candidates[(rank >= lo) & (rank < hi)]
+        # Sonuç sırası order_by indeksindeki rank'ten gelir - değerler yeniden sıralanmaz
+        self.bounds(order_by)
+        rank = self._rank[order_by][candidates]
+        return candidates[np.argsort(-rank)]
+
+
+@st.cache_resource(max_entries=64)
+def get_threshold_index(state_key, _df):
+    """Filtre durumu başına önbelleklenmiş eşik indeksi"""
+    return ThresholdIndex(_df)
+
+# =============================================================================
+# HİYERARŞİK ROLLUP MOTORU
+# =============================================================================
+class HierarchyRollup:
+    """
+    Türkiye → Bölge → Strateji → Müdür → Şehir hiyerarşisi için ortak toplama motoru
+
+    En ince seviye (Bölge, Strateji, Müdür, Şehir) tek bir groupby ile hesaplanır;
+    üst seviyeler bu küçük yaprak tablodan yeniden toplanır ve önbelleğe alınır.
+    Her seviyede: PF Kutu, Toplam Kutu, Şehir Sayısı, Ort./Std Pazar Payı %,
+    Toplam Pazar Payı % (ağırlıklı) ve PF Pay % (toplam PF içindeki pay).
+    """
+
+    LEAF_KEYS = ["Bölge", "Yatırım Stratejisi", "Ticaret Müdürü", "Şehir"]
+
+    def __init__(self, df):
+        self.df = df
+        self._leaf = None
+        self._levels = {}
+
+    @property
+    def leaf(self):
+        # Boş filtrede strateji kolonları olmayabilir; ilk kullanımda hesapla
+        if self._leaf is None:
+            leaf = (
+                self.df[self.LEAF_KEYS + ["PF Kutu", "Toplam Kutu", "Pazar Payı %"]]
+                .assign(_pay_kare=lambda d: d["Pazar Payı %"].astype("float64") ** 2)
+                .groupby(self.LEAF_KEYS, observed=True)
+                .agg(**{
+                    "PF Kutu": ("PF Kutu", "sum"),
+                    "Toplam Kutu": ("Toplam Kutu", "sum"),
+                    "Şehir Sayısı": ("Pazar Payı %", "size"),
+                    "_pay_toplam": ("Pazar Payı %", "sum"),
+                    "_pay_kare": ("_pay_kare", "sum"),
+                })
+                .reset_index()
+            )
+            for key in self.LEAF_KEYS:
+                leaf[key] = leaf[key].astype(object)
+            self._leaf = leaf
+        return self._leaf
+
+    def level(self, *keys):
+        """
+        İstenen seviyenin toplamları (ör. level("Bölge", "Yatırım Stratejisi"))
+        Döndürülen tablo sığ kopyadır; kolon eklemek önbelleği değiştirmez.
+        """
+        if keys not in self._levels:
+            measures = ["PF Kutu", "Toplam Kutu", "Şehir Sayısı", "_pay_toplam", "_pay_kare"]
+            if keys:
+                table = self.leaf.groupby(list(keys), sort=True)[measures].sum().reset_index()
+            else:
+                table = self.leaf[measures].sum().to_frame().T
+            self._levels[keys] = self._finalize(table)
+        return self._levels[keys].copy(deep=False)
+
+    def _finalize(self, table):
+        n = table["Şehir Sayısı"].to_numpy(dtype="float64")
+        pay_toplam = table.pop("_pay_toplam").to_numpy(dtype="float64")
+        pay_kare = table.pop("_pay_kare").to_numpy(dtype="float64")
+        pf = table["PF Kutu"].to_numpy(dtype="float64")
+        toplam = table["Toplam Kutu"].to_numpy(dtype="float64")
+        pf_genel = float(self.leaf["PF Kutu"].sum())
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ortalama = pay_toplam / n
+            # Örneklem std (ddof=1) - pandas .std() ile aynı; tek şehirde NaN
+            varyans = (pay_kare - n * ortalama ** 2) / (n - 1)
+            table["Ort. Pazar Payı %"] = ortalama
+            table["Std Pazar Payı %"] = np.where(n > 1, np.sqrt(np.clip(varyans, 0, None)), np.nan)
+            table["Toplam Pazar Payı %"] = np.where(toplam > 0, pf / toplam * 100, 0.0)
+            table["PF Pay %"] = pf / pf_genel * 100 if pf_genel > 0 else 0.0
+        return table
+
+
+@st.cache_resource(max_entries=64)
+def get_rollup(state_key, _df):
+    """Filtre durumu başına önbelleklenmiş rollup motoru"""
+    return HierarchyRollup(_df)
+
+# =============================================================================
+# BEYAZ ALAN (SIFIR SATIŞ) İNDEKSİ
+# =============================================================================
+class CoverageIndex:
+    """
+    81 il üzerinden sıfır satış (beyaz alan) tespiti
+
+    load_geo'daki tam il listesi, satış yapılan il anahtarlarıyla anti-join edilir.
+    Her müdür ve bölge için iki bitmap (il sayısı uzunluğunda bool dizi) tutulur:
+    kapsamda olan iller ve kapsamda satış yapılan iller. Herhangi bir filtrede
+    beyaz alan = kapsam & ~satış; tablo tekrar taranmaz.
+    """
+
+    def __init__(self, merged, gdf):
+        cities = merged["CITY_KEY"].cat.categories
+        geo_keys = pd.Index(gdf["CITY_KEY"].unique())
+        n = len(cities)
+
+        city_codes = merged["CITY_KEY"].cat.codes.to_numpy()
+        has_city = city_codes >= 0
+        city_codes = city_codes[has_city]
+        pf = merged["PF Kutu"].to_numpy()[has_city]
+        toplam = merged["Toplam Kutu"].to_numpy()[has_city]
+        sold = pf > 0
+
+        # İl bazlı özet: pazar büyüklüğü ve sorumlu (ilk satır)
+        first = pd.Series(np.arange(len(city_codes))).groupby(city_codes).first()
+        sehir = merged["Şehir"].astype(object).to_numpy()[has_city]
+        bolge = merged["Bölge"].astype(object).to_numpy()[has_city]
+        mudur = merged["Ticaret Müdürü"].astype(object).to_numpy()[has_city]
+        province = pd.DataFrame({
+            "Şehir": pd.Series(sehir[first.to_numpy()], index=first.index),
+            "Bölge": pd.Series(bolge[first.to_numpy()], index=first.index),
+            "Ticaret Müdürü": pd.Series(mudur[first.to_numpy()], index=first.index),
+        }).reindex(np.arange(n))
+        province["Toplam Kutu"] = np.bincount(city_codes, weights=toplam, minlength=n)
+
+        # Tüm Türkiye: il listesinde olup hiç satış anahtarı olmayan iller
+        self.national_scope = np.asarray(cities.isin(geo_keys))
+        self.national_sold = np.bincount(city_codes, weights=sold, minlength=n) > 0
+        self.province = province
+
+        self.manager_scope, self.manager_sold = self._bitmaps(merged["Ticaret Müdürü"], has_city, city_codes, sold, n)
+        self.region_scope, self.region_sold = self._bitmaps(merged["Bölge"], has_city, city_codes, sold, n)
+
+    @staticmethod
+    def _bitmaps(column, has_city, city_codes, sold, n):
+        labels = column.cat.categories
+        codes = column.cat.codes.to_numpy()[has_city]
+        scope = np.zeros((len(labels), n), dtype=bool)
+        scope[codes, city_codes] = True
+        sold_map = np.zeros((len(labels), n), dtype=bool)
+        sold_map[codes[sold], city_codes[sold]] = True
+        return (
+            dict(zip(labels, scope)),
+            dict(zip(labels, sold_map)),
+        )
+
+    def mask(self, manager="TÜMÜ", bolge="TÜMÜ"):
+        """Seçili filtrede sıfır satışlı illerin bitmap'i"""
+        scope = self.national_scope.copy()
+        sold = self.national_sold.copy()
+        empty = np.zeros_like(scope)
+        if manager != "TÜMÜ":
+            scope &= self.manager_scope.get(manager, empty)
+            sold &= self.manager_sold.get(manager, empty)
+        if bolge != "TÜMÜ":
+            scope &= self.region_scope.get(bolge, empty)
+            sold &= self.region_sold.get(bolge, empty)
+        return scope & ~sold
+
+    def masks(self, managers, bolges):
+        """
+        Birden çok (müdür, bölge) kapsamı için bitmap matrisi - kapsam başına bir satır
+        "TÜMÜ" satırı ulusal bitmap'leri kullanır; mask() ile aynı sonucu verir.
+        """
+        scope_m, sold_m = self._stack(self.manager_scope, self.manager_sold, managers)
+        scope_b, sold_b = self._stack(self.region_scope, self.region_sold, bolges)
+        return scope_m & scope_b & ~(sold_m & sold_b)
+
+    def _stack(self, scope_maps, sold_maps, labels):
+        empty = np.zeros_like(self.national_scope)
+        names = pd.Index(["TÜMÜ"] + list(scope_maps))
+        scope = np.vstack([self.national_scope, *scope_maps.values(), empty])
+        sold = np.vstack([self.national_sold, *sold_maps.values(), empty])
+        rows = names.get_indexer(labels)
+        rows[rows < 0] = len(names)
+        return scope[rows], sold[rows]
+
+    def white_space(self, manager="TÜMÜ", bolge="TÜMÜ"):
+        """Sıfır satışlı iller, pazar büyüklüğüne göre azalan sırada"""
+        result = self.province[self.mask(manager, bolge)]
+        return result.sort_values("Toplam Kutu", ascending=False, kind="stable").reset_index(drop=True)
+
+
+@st.cache_resource(max_entries=16)
+def get_coverage_index(data_key, _merged, _gdf):
+    """Yüklenen veri başına bir kez kurulan beyaz alan indeksi"""
+    return CoverageIndex(_merged, _gdf)
+
+# =============================================================================
+# ÖNCELİK SKORU MOTORU
+# =============================================================================
+# Bileşen -> varsayılan ağırlık (sidebar slider'ları ile değiştirilebilir, 0-100)
+PRIORITY_WEIGHTS = {
+    "Pazar Büyüklüğü": 35,
+    "Pay Açığı": 25,
+    "Büyüme Alanı": 25,
+    "Segment": 15,
+}
+
+# Strateji segmentinin öncelik katkısı (0-1)
+STRATEGY_PRIORITY = {
+    "🚀 Agresif": 1.0,
+    "⚡ Hızlandırılmış": 0.8,
+    "💎 Potansiyel": 0.6,
+    "🛡️ Koruma": 0.4,
+    "👁️ İzleme": 0.1,
+}
+
+
+def _min_max(values):
+    """0-1 aralığına ölçekle; sabit kolon 0 döner"""
+    values = np.asarray(values, dtype="float64")
+    span = values.max() - values.min() if values.size else 0.0
+    if span <= 0:
+        return np.zeros_like(values)
+    return (values - values.min()) / span
+
+
+class PriorityScorer:
+    """
+    Ağırlıklı öncelik skoru
+
+    Bileşenler filtre durumu başına bir kez 0-1 aralığına ölçeklenip (n x 4)
+    matrise yazılır; skor = bileşenler @ ağırlıklar * 100. Ağırlık değişince
+    sadece bu matris çarpımı tekrarlanır.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.components = np.column_stack([
+            _min_max(df["Toplam Kutu"]),
+            1.0 - _min_max(df["Pazar Payı %"]),
+            _min_max(df["Büyüme Alanı"]),
+            df["Yatırım Stratejisi"].map(STRATEGY_PRIORITY).fillna(0).to_numpy(dtype="float64"),
+        ]) if len(df) else np.zeros((0, len(PRIORITY_WEIGHTS)))
+
+    @staticmethod
+    def normalize(weights):
+        """Ağırlıkları toplamı 1 olacak şekilde ölçekle (hepsi 0 ise eşit ağırlık)"""
+        w = np.array([weights.get(name, 0) for name in PRIORITY_WEIGHTS], dtype="float64")
+        total = w.sum()
+        return w / total if total > 0 else np.full(len(w), 1 / len(w))
+
+    def score(self, weights):
+        """Tüm şehirler için 0-100 öncelik skoru"""
+        return self.components @ self.normalize(weights) * 100
+
+    def top(self, weights, k):
+        """En yüksek skorlu k şehir, skora göre azalan sırada"""
+        scores = self.score(weights)
+        k = min(k, len(scores))
+        if k == 0:
+            return self.df.iloc[:0].assign(**{"Öncelik Skoru": scores[:0]})
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return self.df.iloc[idx].assign(**{"Öncelik Skoru": scores[idx]})
+
+
+@st.cache_resource(max_entries=64)
+def get_priority_scorer(state_key, _df):
+    """Filtre durumu başına önbelleklenmiş öncelik skoru bileşenleri"""
+    return PriorityScorer(_df)
+
+# =============================================================================
+# SANKEY MOTORU
+# =============================================================================
+SANKEY_LEVELS = ["Bölge", "Yatırım Stratejisi", "Ticaret Müdürü", "Şehir"]
+SANKEY_TOP_K = 15          # Seviye başına gösterilecek düğüm sayısı; kalanlar "Diğer"
+SANKEY_OTHER = "Diğer"
+SANKEY_LEVEL_COLORS = {"Ticaret Müdürü": "#0EA5E9", "Şehir": "#64748B"}
+
+
+def _hex_to_rgba(color, alpha):
+    color = color.lstrip("#")
+    r, g, b = (int(color[i:i + 2], 16) for i in (0, 2, 4))
+    return f"rgba({r}, {g}, {b}, {alpha})"
+
+
+def _sankey_level_codes(labels, weights, top_k):
+    """
+    Seviye etiketlerini tamsayı düğüm kodlarına çevir (PF'e göre azalan)
+    top_k dışındaki küçük akışlar tek bir "Diğer" koduna toplanır.
+    """
+    codes, uniques = pd.factorize(labels)
+    totals = np.bincount(codes, weights=weights, minlength=len(uniques))
+    order = np.argsort(-totals, kind="stable")
+    keep = order[:top_k]
+    remap = np.full(len(uniques), len(keep), dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    names = list(uniques[keep])
+    if len(uniques) > len(keep):
+        names.append(SANKEY_OTHER)
+    return remap[codes], names
+
+
+@st.cache_data(max_entries=64)
+def build_sankey(state_key, _df, top_k=SANKEY_TOP_K):
+    """
+    Bölge → Strateji → Müdür → Şehir Sankey verisi
+
+    Her seviye factorize ile tamsayı koda çevrilir; ardışık iki seviye arasındaki
+    akışlar (kaynak_kod * hedef_sayısı + hedef_kod) anahtarı üzerinde tek bir
+    bincount ile toplanır. Python seviyesinde satır döngüsü yoktur.
+    """
+    weights = _df["PF Kutu"].to_numpy(dtype="float64")
+    level_codes, level_names, offsets = [], [], []
+    offset = 0
+    for level in SANKEY_LEVELS:
+        labels = _df[level].astype(object).to_numpy()
+        k = top_k if level != "Yatırım Stratejisi" else len(STRATEGY_COLORS)
+        codes, names = _sankey_level_codes(labels, weights, k)
+        level_codes.append(codes)
+        level_names.append(names)
+        offsets.append(offset)
+        offset += len(names)
+
+    # Düğüm renkleri: bölge ve strateji kendi paletinden, "Diğer" açık gri
+    labels, node_colors = [], []
+    for level, names in zip(SANKEY_LEVELS, level_names):
+        palette = REGION_COLORS if level == "Bölge" else STRATEGY_COLORS
+        default = SANKEY_LEVEL_COLORS.get(level, "#3B82F6")
+        labels += names
+        node_colors += [
+            "#94A3B8" if name == SANKEY_OTHER else palette.get(name, default)
+            for name in names
+        ]
+
+    strateji_codes = level_codes[1]
+    strateji_colors = np.array(
+        [_hex_to_rgba(STRATEGY_COLORS.get(name, "#6B7280"), 0.4) for name in level_names[1]],
+        dtype=object
+    )
+
+    sources, targets, values, link_colors = [], [], [], []
+    for i in range(len(SANKEY_LEVELS) - 1):
+        src, tgt = level_codes[i], level_codes[i + 1]
+        n_src, n_tgt = len(level_names[i]), len(level_names[i + 1])
+        flows = np.bincount(src * n_tgt + tgt, weights=weights, minlength=n_src * n_tgt)
+        keys = np.flatnonzero(flows > 0)
+        sources.append(keys // n_tgt + offsets[i])
+        targets.append(keys % n_tgt + offsets[i + 1])
+        values.append(flows[keys])
+
+        if i == 0:
+            # Bölge → Strateji: nötr mavi
+            link_colors.append(np.full(len(keys), "rgba(59, 130, 246, 0.3)", dtype=object))
+        elif i == 1:
+            # Strateji → Müdür: kaynak stratejinin rengi
+            link_colors.append(strateji_colors[keys // n_tgt])
+        else:
+            # Müdür → Şehir: akışa en çok katkı veren stratejinin rengi
+            pair = src * n_tgt + tgt
+            by_strateji = np.zeros((n_src * n_tgt, len(level_names[1])))
+            np.add.at(by_strateji, (pair, strateji_codes), weights)
+            link_colors.append(strateji_colors[by_strateji[keys].argmax(axis=1)])
+
+    return {
+        "labels": labels,
+        "node_colors": node_colors,
+        "source": np.concatenate(sources).tolist(),
+        "target": np.concatenate(targets).tolist(),
+        "value": np.concatenate(values).tolist(),
+        "link_colors": np.concatenate(link_colors).tolist(),
+    }
+
+# =============================================================================
+# KONSANTRASYON ANALİZİ
+# =============================================================================
+CONCENTRATION_BREAKPOINTS = (80, 90, 95)   # Satışın % kaçına kaç şehirde ulaşılıyor
+CONCENTRATION_TOP_K = (5, 10)              # Top-k şehir payları
+
+# HHI (0-10.000) risk eşikleri - yaygın rekabet otoritesi sınırları
+HHI_RISK_LEVELS = [(2500, "🔴 Yüksek"), (1500, "🟡 Orta"), (0, "🟢 Düşük")]
+
+
+def hhi_risk_level(hhi):
+    """HHI değer(ler)ini risk seviyesine çevir"""
+    hhi = np.asarray(hhi, dtype="float64")
+    return np.select(
+        [hhi > limit for limit, _ in HHI_RISK_LEVELS[:-1]],
+        [label for _, label in HHI_RISK_LEVELS[:-1]],
+        default=HHI_RISK_LEVELS[-1][1]
+    )
+
+
+def concentration_stats(values, segments, n_segments):
+    """
+    Segment başına konsantrasyon metrikleri - tek geçişte
+
+    values: şehir PF değerleri, segments: her değerin segment kodu (0..n_segments-1).
+    lexsort ile (segment artan, değer azalan) sıralanır; segment içi kümülatif
+    pay (cumfrac) tek bir cumsum'dan türetilir. Breakpoint'ler segment + cumfrac
+    anahtarında searchsorted ile bulunur (anahtar tüm dizide monoton artar).
+
+    Döndürür: segment başına kolonlar içeren DataFrame (index = segment kodu)
+    """
+    values = np.asarray(values, dtype="float64")
+    segments = np.asarray(segments, dtype=np.int64)
+    order = np.lexsort((-values, segments))
+    v, seg = values[order], segments[order]
+
+    counts = np.bincount(seg, minlength=n_segments)
+    totals = np.bincount(seg, weights=v, minlength=n_segments)
+    starts = np.cumsum(counts) - counts
+
+    cum = np.cumsum(v)
+    seg_cum = cum - np.repeat(np.concatenate([[0.0], cum])[starts], counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cumfrac = np.where(totals[seg] > 0, seg_cum / totals[seg], 1.0)
+        share = np.where(totals[seg] > 0, v / totals[seg] * 100, 0.0)
+
+    # Sıra (1..n) - segment içi, azalan değere göre
+    rank = np.arange(len(v)) - np.repeat(starts, counts) + 1
+
+    result = pd.DataFrame({"Şehir Sayısı": counts, "PF Kutu": totals})
+    result["HHI"] = np.bincount(seg, weights=share ** 2, minlength=n_segments)
+
+    # Gini (azalan sıra ile): (n+1)/n - 2 * Σ(r * x) / (n * T)
+    weighted_rank = np.bincount(seg, weights=rank * v, minlength=n_segments)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gini = (counts + 1) / counts - 2 * weighted_rank / (counts * totals)
+    result["Gini"] = np.where((counts > 0) & (totals > 0), gini, np.nan)
+
+    for k in CONCENTRATION_TOP_K:
+        last = starts + np.minimum(k, counts) - 1
+        top = np.where(counts > 0, seg_cum[np.clip(last, 0, None)] if len(v) else 0.0, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[f"Top {k} %"] = np.where(totals > 0, top / totals * 100, 0.0)
+
+    key = seg + cumfrac
+    for pct in CONCENTRATION_BREAKPOINTS:
+        target = np.arange(n_segments) + pct / 100 - 1e-9
+        hit = np.searchsorted(key, target, side="left")
+        result[f"%{pct} Şehir"] = np.where(counts > 0, hit - starts + 1, 0)
+
+    result["Risk Seviyesi"] = hhi_risk_level(result["HHI"])
+    return result
+
+
+@st.cache_data(max_entries=16)
+def organization_concentration(data_key, _merged):
+    """
+    Tüm organizasyon için konsantrasyon tablosu: TÜMÜ + her müdür + her bölge
+
+    Kapsamlar tek bir yığılmış (stacked) segment dizisine yazılır ve
+    concentration_stats tek çağrıda hepsini hesaplar.
+    """
+    active = _merged[_merged["PF Kutu"] > 0]
+    pf = active["PF Kutu"].to_numpy(dtype="float64")
+
+    scopes = [("TÜMÜ", ["TÜMÜ"], np.zeros(len(active), dtype=np.int64))]
+    for kind, column in [("Müdür", "Ticaret Müdürü"), ("Bölge", "Bölge")]:
+        codes, uniques = pd.factorize(active[column].astype(object))
+        scopes.append((kind, list(uniques), codes))
+
+    segments, names, kinds = [], [], []
+    offset = 0
+    for kind, labels, codes in scopes:
+        segments.append(codes + offset)
+        names += labels
+        kinds += [kind] * len(labels)
+        offset += len(labels)
+
+    result = concentration_stats(np.tile(pf, len(scopes)), np.concatenate(segments), offset)
+    result.insert(0, "Kapsam", kinds)
+    result.insert(1, "Ad", names)
+    return result[result["Şehir Sayısı"] > 0].reset_index(drop=True)
+
+# =============================================================================
+# AKSİYON PLANI MOTORU
+# =============================================================================
+ACTION_PRIORITY_COLORS = {"🔴 Kritik": "#DC2626", "🟠 Yüksek": "#EA580C", "🟡 Orta": "#0891B2"}
+ACTION_LIMITS = {"firsat": 3, "giris": 2, "mudur": 2}   # Kapsam başına kural limitleri
+ACTION_MUDUR_PAY_LIMIT = 5                               # Bu payın altındaki müdürler görüşmeye
+OPPORTUNITY_MAX_PAY = 10.0                               # Büyük Fırsatlar varsayılan eşikleri; pazar eşiği
+OPPORTUNITY_MIN_BUYUME = 50000                           # kapsam medyanı, büyüme eşiği en fazla kapsam maks.
+
+
+def _top_per_segment(segments, sort_key, k):
+    """
+    Her segmentte sort_key'e göre artan ilk k pozisyon (segment sırasıyla)
+    lexsort + segment içi sıra; Python döngüsü yok.
+    """
+    order = np.lexsort((sort_key, segments))
+    seg = segments[order]
+    idx = np.arange(len(seg))
+    boundary = np.r_[True, seg[1:] != seg[:-1]] if len(seg) else np.zeros(0, dtype=bool)
+    start = np.maximum.accumulate(np.where(boundary, idx, 0)) if len(seg) else idx
+    return order[(idx - start) < k]
+
+
+def _fmt_adet(values):
+    return pd.Series(values).map("{:,.0f}".format).to_numpy(dtype=object)
+
+
+@st.cache_data(max_entries=16)
+def build_action_plan(data_key, opportunity_key, _merged, _coverage):
+    """
+    Tüm kapsamlar için aksiyon planı: TÜMÜ, her müdür, her bölge ve her (müdür, bölge)
+
+    Hazırlanmış veri satırları 4 kapsama yığılır (stacked) ve kapsam kodu
+    factorize ile tek tamsayıya indirilir. Üç kural kapsam kodu üzerinde
+    vektörel değerlendirilir:
+      1. 🔴 Fırsat eşiklerini sağlayan en büyük pazarlar → agresif yatırım
+      2. 🟠 Sıfır satışlı, pazarı olan iller (beyaz alan bitmap'leri) → giriş
+      3. 🟡 Pazar payı ACTION_MUDUR_PAY_LIMIT altındaki müdürler → görüşme
+
+    opportunity_key: kullanıcının değiştirdiği Büyük Fırsatlar eşikleri
+    ((metrik, (above, below)), ...) - tüm kapsamlara uygulanır. Değiştirilmeyen
+    eşikler kapsam başına varsayılandır (Toplam Kutu > kapsam medyanı, ...),
+    bu yüzden filtre değişince plan yeniden üretilmez.
+    Döndürür: kapsam kolonları + Sıra, Öncelik, Aksiyon, Neden, Sorumlu, Potansiyel
+    """
+    n = len(_merged)
+    mudur = _merged["Ticaret Müdürü"].astype(object).to_numpy()
+    bolge = _merged["Bölge"].astype(object).to_numpy()
+    tumu = np.full(n, "TÜMÜ", dtype=object)
+
+    stack_m = np.concatenate([tumu, mudur, tumu, mudur])
+    stack_b = np.concatenate([tumu, tumu, bolge, bolge])
+    stack_row = np.tile(np.arange(n), 4)
+    scope_codes, scopes = pd.MultiIndex.from_arrays([stack_m, stack_b]).factorize()
+    scope_codes = scope_codes.astype(np.int64)
+
+    sehir = _merged["Şehir"].astype(object).to_numpy()
+    pf = _merged["PF Kutu"].to_numpy(dtype="float64")
+    toplam = _merged["Toplam Kutu"].to_numpy(dtype="float64")
+    metrics = {
+        "PF Kutu": pf,
+        "Toplam Kutu": toplam,
+        "Pazar Payı %": _merged["Pazar Payı %"].to_numpy(dtype="float64"),
+        "Büyüme Alanı": toplam - pf,
+    }
+    active = pf > 0
+
+    frames = []
+
+    # 1. Fırsat eşiklerini sağlayan aktif şehirler, pazar büyüklüğüne göre
+    pos = np.flatnonzero(active[stack_row])
+    segment, row = scope_codes[pos], stack_row[pos]
+    by_scope = pd.DataFrame({"Toplam Kutu": toplam[row], "Büyüme Alanı": metrics["Büyüme Alanı"][row]}).groupby(segment)
+    scope_median = by_scope["Toplam Kutu"].median().reindex(range(len(scopes))).to_numpy()
+    scope_max = by_scope["Büyüme Alanı"].max().reindex(range(len(scopes))).to_numpy()
+    limits = {
+        # Büyük Fırsatlar slider varsayılanları ile aynı (int'e kesilmiş)
+        "Toplam Kutu": (np.floor(scope_median[segment]), None),
+        "Pazar Payı %": (None, OPPORTUNITY_MAX_PAY),
+        "Büyüme Alanı": (np.minimum(OPPORTUNITY_MIN_BUYUME, np.floor(scope_max[segment])), None),
+    }
+    limits.update(dict(opportunity_key))
+    firsat = np.ones(len(pos), dtype=bool)
+    for metric, (above, below) in limits.items():
+        values = metrics[metric][row]
+        if above is not None:
+            firsat &= values > above
+        if below is not None:
+            firsat &= values < below
+    pos = pos[firsat]
+    pos = pos[_top_per_segment(scope_codes[pos], -toplam[stack_row[pos]], ACTION_LIMITS["firsat"])]
+    rows = stack_row[pos]
+    frames.append(pd.DataFrame({
+        "_scope": scope_codes[pos],
+        "_kural": 1,
+        "Öncelik": "🔴 Kritik",
+        "Aksiyon": sehir[rows] + "'de agresif yatırım",
+        "Neden": "Pazar büyük (" + _fmt_adet(toplam[rows]) + ") ama payımız %"
+                 + pd.Series(metrics["Pazar Payı %"][rows]).map("{:.1f}".format).to_numpy(dtype=object),
+        "Sorumlu": mudur[rows],
+        "Potansiyel": "+" + _fmt_adet(toplam[rows] - pf[rows]) + " kutu",
+    }))
+
+    # 2. Beyaz alan: kapsam başına sıfır satışlı ve pazarı olan iller
+    white = _coverage.masks(scopes.get_level_values(0), scopes.get_level_values(1))
+    province = _coverage.province
+    white &= (province["Toplam Kutu"].to_numpy() > 0)[None, :]
+    scope_idx, prov_idx = np.nonzero(white)
+    prov_toplam = province["Toplam Kutu"].to_numpy(dtype="float64")
+    keep = _top_per_segment(scope_idx, -prov_toplam[prov_idx], ACTION_LIMITS["giris"])
+    scope_idx, prov_idx = scope_idx[keep], prov_idx[keep]
+    frames.append(pd.DataFrame({
+        "_scope": scope_idx,
+        "_kural": 2,
+        "Öncelik": "🟠 Yüksek",
+        "Aksiyon": province["Şehir"].to_numpy(dtype=object)[prov_idx] + "'ye giriş yap",
+        "Neden": "Hiç satış yok ama pazar var (" + _fmt_adet(prov_toplam[prov_idx]) + ")",
+        "Sorumlu": province["Ticaret Müdürü"].to_numpy(dtype=object)[prov_idx],
+        "Potansiyel": "+" + _fmt_adet(prov_toplam[prov_idx]) + " kutu",
+    }))
+
+    # 3. Kapsam içindeki müdürlerin ağırlıklı pazar payı
+    act = np.flatnonzero(active[stack_row])
+    mudur_codes, mudur_names = pd.factorize(mudur)
+    pair = scope_codes[act] * len(mudur_names) + mudur_codes[stack_row[act]]
+    size = len(scopes) * len(mudur_names)
+    pair_pf = np.bincount(pair, weights=pf[stack_row[act]], minlength=size)
+    pair_toplam = np.bincount(pair, weights=toplam[stack_row[act]], minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pair_pay = np.where(pair_toplam > 0, pair_pf / pair_toplam * 100, 0.0)
+    pairs = np.flatnonzero((np.bincount(pair, minlength=size) > 0) & (pair_pay < ACTION_MUDUR_PAY_LIMIT))
+    pairs = pairs[_top_per_segment(pairs // len(mudur_names), pair_pay[pairs], ACTION_LIMITS["mudur"])]
+    frames.append(pd.DataFrame({
+        "_scope": pairs // len(mudur_names),
+        "_kural": 3,
+        "Öncelik": "🟡 Orta",
+        "Aksiyon": np.asarray(mudur_names, dtype=object)[pairs % len(mudur_names)] + " ile performans görüşmesi",
+        "Neden": "Genel pazar payı %" + pd.Series(pair_pay[pairs]).map("{:.1f}".format).to_numpy(dtype=object)
+                 + " - ortalamanın altında",
+        "Sorumlu": "Bölge Müdürü",
+        "Potansiyel": "Ekip motivasyonu artışı",
+    }))
+
+    plan = pd.concat(frames, ignore_index=True).sort_values(["_scope", "_kural"], kind="stable")
+    plan.insert(0, "Kapsam Müdür", scopes.get_level_values(0)[plan["_scope"]].to_numpy(dtype=object))
+    plan.insert(1, "Kapsam Bölge", scopes.get_level_values(1)[plan["_scope"]].to_numpy(dtype=object))
+    plan.insert(2, "Sıra", plan.groupby("_scope").cumcount().to_numpy() + 1)
+    return plan.drop(columns=["_scope", "_kural"]).reset_index(drop=True)
+
+# =============================================================================
+# BCG MATRİSİ
+# =============================================================================
+# Kadran kodu = 2 * (pazar >= medyan) + (pay >= medyan)
+BCG_QUADRANTS = [
+    "🐕 Dogs (Düşük Öncelik)",               # 0: küçük pazar, düşük pay
+    "💰 Cash Cows (Nakit İnekleri)",         # 1: küçük pazar, yüksek pay
+    "❓ Question Marks (Soru İşaretleri)",   # 2: büyük pazar, düşük pay
+    "⭐ Stars (Yıldızlar)",                  # 3: büyük pazar, yüksek pay
+]
+
+
+class BCGIndex:
+    """
+    Tüm kapsamlar için BCG medyanları
+
+    Aktif şehirler TÜMÜ / müdür / bölge / (müdür, bölge) kapsamlarına yığılır ve
+    medyanlar tek bir groupby ile hesaplanır. Herhangi bir filtrede kadran
+    ataması, medyan tablosundan bir arama + iki vektörel karşılaştırmadır.
+    """
+
+    def __init__(self, merged):
+        active = merged[merged["PF Kutu"] > 0]
+        mudur = active["Ticaret Müdürü"].astype(object).to_numpy()
+        bolge = active["Bölge"].astype(object).to_numpy()
+        tumu = np.full(len(active), "TÜMÜ", dtype=object)
+        stacked = pd.DataFrame({
+            "Kapsam Müdür": np.concatenate([tumu, mudur, tumu, mudur]),
+            "Kapsam Bölge": np.concatenate([tumu, tumu, bolge, bolge]),
+            "Toplam Kutu": np.tile(active["Toplam Kutu"].to_numpy(), 4),
+            "Pazar Payı %": np.tile(active["Pazar Payı %"].to_numpy(), 4),
+        })
+        self.medians = stacked.groupby(["Kapsam Müdür", "Kapsam Bölge"])[["Toplam Kutu", "Pazar Payı %"]].median()
+
+    def median(self, manager="TÜMÜ", bolge="TÜMÜ"):
+        """(pazar medyanı, pay medyanı) - kapsamda aktif şehir yoksa NaN"""
+        if (manager, bolge) not in self.medians.index:
+            return np.nan, np.nan
+        row = self.medians.loc[(manager, bolge)]
+        return float(row["Toplam Kutu"]), float(row["Pazar Payı %"])
+
+    def classify(self, df, manager="TÜMÜ", bolge="TÜMÜ"):
+        """Satır başına kadran kodu (0-3)"""
+        pazar_median, pay_median = self.median(manager, bolge)
+        buyuk = df["Toplam Kutu"].to_numpy() >= pazar_median
+        yuksek = df["Pazar Payı %"].to_numpy() >= pay_median
+        return (buyuk.astype(np.int8) << 1) | yuksek.astype(np.int8)
+
+    @staticmethod
+    def summary(df, codes):
+        """Kadran başına şehir sayısı, toplam PF ve ortalama pay - bincount ile"""
+        n = len(BCG_QUADRANTS)
+        counts = np.bincount(codes, minlength=n)
+        pf = np.bincount(codes, weights=df["PF Kutu"].to_numpy(dtype="float64"), minlength=n)
+        pay = np.bincount(codes, weights=df["Pazar Payı %"].to_numpy(dtype="float64"), minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ort_pay = np.where(counts > 0, pay / counts, np.nan)
+        stats = pd.DataFrame({
+            "Kategori": BCG_QUADRANTS,
+            "Şehir Sayısı": counts,
+            "Toplam PF Kutu": pf,
+            "Ort. Pay": ort_pay,
+        })
+        return stats[stats["Şehir Sayısı"] > 0].reset_index(drop=True)
+
+
+@st.cache_resource(max_entries=16)
+def get_bcg_index(data_key, _merged):
+    """Yüklenen veri başına bir kez kurulan BCG medyan tablosu"""
+    return BCGIndex(_merged)
+
+# =============================================================================
+# RAPOR GRAFİKLERİ (SUNUCU TARAFI - MATPLOTLIB AGG)
+# =============================================================================
+REPORT_RENDER_WORKERS = 3     # harita, BCG, Pareto aynı anda
+
+
+@st.cache_resource
+def get_map_base_layer(_gdf):
+    """Statik il geometrisi - süreç başına bir kez çizilir"""
+    return report_charts.MapBaseLayer(_gdf)
+
+
+@st.cache_resource
+def get_report_pool(_base):
+    """
+    Rapor grafikleri için süreç havuzu - süreç başına bir kez, tüm oturumlar paylaşır
+
+    matplotlib iş parçacığı güvenli değil; her işçi süreç kendi font önbelleği
+    ve rcParams'ı ile çizer, oturumlar arası kilit gerekmez. İşçiler fork ile
+    açılır: spawn / forkserver ana modülü yeniden çalıştırır, o da bu Streamlit
+    betiği. fork olmayan platformlarda None (grafikler oturumda sırayla çizilir).
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        report_charts.init_worker(_base)
+        return None
+    return ProcessPoolExecutor(
+        max_workers=REPORT_RENDER_WORKERS,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=report_charts.init_worker,
+        initargs=(_base,),
     )
 
-    return fig
 
-# =============================================================================
-# YATIRIM STRATEJİSİ - GELİŞTİRİLMİŞ ALGORİTMA
-# =============================================================================
-def calculate_investment_strategy(df):
+@st.cache_data(max_entries=32)
+def render_report_charts(state_key, _jobs, _base):
     """
-    Geliştirilmiş Yatırım Stratejisi Algoritması
-    
-    Metrikler:
-    1. Pazar Büyüklüğü (Toplam Kutu): Pazarın ne kadar büyük olduğunu gösterir
-    2. Mevcut Performans (PF Kutu): Şu anki satış hacmimiz
-    3. Pazar Payı (%): Pazardaki yerimiz
-    
-    Strateji Mantığı:
-    - 🚀 AGRESİF: Büyük pazar + Düşük pazar payı = Büyük büyüme potansiyeli
-      → En yüksek ROI potansiyeli, agresif yatırım gerekli
-    
-    - ⚡ HIZLANDIRILMIŞ: Orta/Büyük pazar + Orta pazar payı = Momentum var
-      → İyi performans gösteriyor, hızlandırılmış yatırım ile liderliğe geçebilir
-    
-    - 🛡️ KORUMA: Büyük pazar + Yüksek pazar payı = Lider pozisyon
-      → Mevcut konumu korumak kritik, savunma odaklı
-    
-    - 💎 POTANSİYEL: Küçük pazar + Düşük pazar payı ANCAK yüksek büyüme hızı
-      → Gelecek vaat eden, seçici yatırım
-    
-    - 👁️ İZLEME: Küçük pazar + Düşük performans
-      → Düşük öncelik, izleme modunda tut
+    Rapor grafiklerini süreç havuzunda paralel çiz; (veri özeti, filtre) başına önbellek
+
+    _jobs: {isim: (report_charts fonksiyonu, argümanlar)}. Çöken işçi havuzu
+    bozar; havuz bir kez yeniden kurulup işler tekrar gönderilir.
     """
-    df = df.copy()
-    df = df[df["PF Kutu"] > 0]  # Sadece aktif şehirler
-    
-    if len(df) == 0:
-        return df
-    
-    # 1. PAZAR BÜYÜKLÜĞÜ SEGMENTİ (Toplam Kutu)
-    try:
-        df["Pazar Büyüklüğü"] = pd.qcut(
-            df["Toplam Kutu"], 
-            q=3, 
-            labels=["Küçük", "Orta", "Büyük"],
-            duplicates='drop'
-        )
-    except:
-        df["Pazar Büyüklüğü"] = "Orta"
-    
-    # 2. PERFORMANS SEGMENTİ (PF Kutu)
-    try:
-        df["Performans"] = pd.qcut(
-            df["PF Kutu"], 
-            q=3, 
-            labels=["Düşük", "Orta", "Yüksek"],
-            duplicates='drop'
-        )
-    except:
-        df["Performans"] = "Orta"
-    
-    # 3. PAZAR PAYI SEGMENTİ
-    try:
-        df["Pazar Payı Segment"] = pd.qcut(
-            df["Pazar Payı %"], 
-            q=3, 
-            labels=["Düşük", "Orta", "Yüksek"],
-            duplicates='drop'
-        )
-    except:
-        df["Pazar Payı Segment"] = "Orta"
-    
-    # 4. BÜYÜME POTANSİYELİ (Gap = Pazar - Bizim Satış)
-    df["Büyüme Alanı"] = df["Toplam Kutu"] - df["PF Kutu"]
-    try:
-        df["Büyüme Potansiyeli"] = pd.qcut(
-            df["Büyüme Alanı"],
-            q=3,
-            labels=["Düşük", "Orta", "Yüksek"],
-            duplicates='drop'
-        )
-    except:
-        df["Büyüme Potansiyeli"] = "Orta"
-    
-    # 5. STRATEJİ ATAMA
-    def assign_strategy(row):
-        pazar_buyuklugu = str(row["Pazar Büyüklüğü"])
-        pazar_payi = str(row["Pazar Payı Segment"])
-        buyume_potansiyeli = str(row["Büyüme Potansiyeli"])
-        performans = str(row["Performans"])
-        
-        # AGRESİF: Büyük pazar + Düşük pazar payı + Yüksek büyüme alanı
-        if (pazar_buyuklugu in ["Büyük", "Orta"] and 
-            pazar_payi == "Düşük" and 
-            buyume_potansiyeli in ["Yüksek", "Orta"]):
-            return "🚀 Agresif"
-        
-        # HIZLANDIRILMIŞ: Orta/Büyük pazar + Orta pazar payı + İyi performans
-        elif (pazar_buyuklugu in ["Büyük", "Orta"] and 
-              pazar_payi == "Orta" and
-              performans in ["Orta", "Yüksek"]):
-            return "⚡ Hızlandırılmış"
-        
-        # KORUMA: Büyük pazar + Yüksek pazar payı
-        elif (pazar_buyuklugu == "Büyük" and 
-              pazar_payi == "Yüksek"):
-            return "🛡️ Koruma"
-        
-        # POTANSİYEL: Küçük pazar ama yüksek büyüme potansiyeli
-        elif (pazar_buyuklugu == "Küçük" and 
-              buyume_potansiyeli == "Yüksek" and
-              performans in ["Orta", "Yüksek"]):
-            return "💎 Potansiyel"
-        
-        # İZLEME: Geri kalan her şey
-        else:
-            return "👁️ İzleme"
-    
-    df["Yatırım Stratejisi"] = df.apply(assign_strategy, axis=1)
-    
-    return df
+    from concurrent.futures.process import BrokenProcessPool
+
+    for attempt in range(2):
+        pool = get_report_pool(_base)
+        if pool is None:
+            return {name: fn(*args) for name, (fn, args) in _jobs.items()}
+        try:
+            futures = {name: pool.submit(fn, *args) for name, (fn, args) in _jobs.items()}
+            return {name: future.result() for name, future in futures.items()}
+        except BrokenProcessPool:
+            get_report_pool.clear()
+            if attempt:
+                raise
 
 # =============================================================================
 # APP FLOW
@@ -454,14 +3012,19 @@ uploaded_files = st.sidebar.file_uploader(
     accept_multiple_files=True
 )
 
+perf.section("Yükleme")
 df = None
-geo = load_geo()
 
 if not uploaded_files:
     st.warning("⚠️ Lütfen sol taraftan bir veya daha fazla Excel dosyası yükleyin!")
     st.info("📋 Excel dosyası şu kolonları içermelidir: **Şehir**, **Bölge**, **Ticaret Müdürü**, **Kutu Adet**, **Toplam Adet**")
     st.stop()
 
+# Geometri yükleme prompt'undan sonra - derlenmiş artefakttan (OGR yok)
+geo_started = time.perf_counter()
+geo = load_geo()
+startup.setdefault("Geometri", time.perf_counter() - geo_started)
+
 # Birden fazla dosya varsa seçim ekle
 if len(uploaded_files) > 1:
     file_names = [f.name for f in uploaded_files]
@@ -473,17 +3036,66 @@ else:
     df = load_excel(uploaded_files[0])
     st.sidebar.success(f"✅ Yüklendi: {uploaded_files[0].name}")
 
+data_key = frame_fingerprint(df)
+
+# Koordinatlı (eczane bazlı) dosya: noktaları illere ata, il tablosuna indirge
+point_check = None
+if point_columns(df) is not None:
+    df, point_mismatches, point_summary = aggregate_points(data_key, df, geo)
+    point_check = (point_mismatches, point_summary)
+    data_key = frame_fingerprint(df)
+    st.sidebar.info(
+        f"📍 {point_summary['Nokta']:,} nokta: {point_summary['Koordinatla']:,} koordinatla, "
+        f"{point_summary['İsimle']:,} isimle atandı; {point_summary['Atanamayan']:,} atanamadı, "
+        f"{point_summary['Uyumsuz']:,} isim/koordinat uyumsuz, {point_summary['İsimsiz']:,} isimsiz"
+    )
+
+perf.section("Hazırlık", rows=len(df))
 merged, bolge_df, pf_toplam_kutu, toplam_kutu = prepare_data(df, geo)
+merged, bytes_before, bytes_after = compact_prepared_data(merged, geo)
+merged = attach_neighbourhood(merged, neighbourhood_metrics(data_key, merged, geo))
+if bytes_before > 0:
+    st.sidebar.caption(
+        f"🗜️ Kompakt veri: {bytes_before / 1024:,.0f} KB → {bytes_after / 1024:,.0f} KB "
+        f"(%{(1 - bytes_after / bytes_before) * 100:.0f} tasarruf)"
+    )
 
 st.sidebar.header("🔍 Filtre")
 
+# Harita filtresi tarayıcıda mı uygulansın
+client_map = st.sidebar.toggle(
+    "🖥️ Haritayı tarayıcıda filtrele",
+    key="client_map",
+    help="Harita tüm illerle bir kez gönderilir; kapsam ve görünüm haritanın üstündeki "
+         "menülerden sunucuya gitmeden değiştirilir. Kenar çubuğu filtreleri diğer bölümleri etkiler."
+)
+
 # Görünüm modu
 view_mode = st.sidebar.radio(
     "Görünüm Modu",
-    ["Bölge Görünümü", "Şehir Görünümü"],
+    MAP_VIEWS,
     index=0
 )
 
+# Müdür bölgesi dengeleme önerisi haritanın üstüne çizilir
+territory_proposal = st.sidebar.toggle(
+    "🧩 Bölge dengeleme önerisi",
+    key="territory_proposal",
+    help="Müdür bölgelerini bitişik kalacak ve pazar / il sayısı dengelenecek şekilde yeniden öner"
+)
+if territory_proposal:
+    territory_workload = st.sidebar.slider("İl sayısı ağırlığı", 0.0, 1.0, 0.5, step=0.1, key="territory_workload",
+                                           help="0: sadece pazar (Toplam Kutu) dengelenir")
+    territory_stability = st.sidebar.slider("Değişim cezası", 0.0, 0.1, 0.02, step=0.01, key="territory_stability",
+                                            help="Müdürü değişen her il için ceza; yüksek değer mevcut atamaya yakın kalır")
+
+# Büyük Fırsatlar + sıfır satışlı iller için müdür başına ziyaret turu
+visit_routes = st.sidebar.toggle(
+    "🚗 Ziyaret rotaları",
+    key="visit_routes",
+    help="Her müdür için merkez ilinden başlayıp işaretli illeri dolaşan tur haritaya çizilir"
+)
+
 # Ticaret Müdürü filtresi
 managers = ["TÜMÜ"] + sorted(merged["Ticaret Müdürü"].unique())
 selected_manager = st.sidebar.selectbox("Ticaret Müdürü", managers)
@@ -499,6 +3111,13 @@ selected_bolge = st.sidebar.selectbox("Bölge Seçin", bolge_list)
 strateji_list = ["Tümü", "🚀 Agresif", "⚡ Hızlandırılmış", "🛡️ Koruma", "💎 Potansiyel", "👁️ İzleme"]
 selected_strateji = st.sidebar.selectbox("Yatırım Stratejisi", strateji_list)
 
+# Öncelik skoru ağırlıkları
+st.sidebar.header("⚖️ Öncelik Ağırlıkları")
+priority_weights = {
+    name: st.sidebar.slider(name, 0, 100, default, step=5, key=f"priority_{name}")
+    for name, default in PRIORITY_WEIGHTS.items()
+}
+
 # Renk legend'ı
 st.sidebar.header("🎨 Bölge Renkleri")
 for region, color in REGION_COLORS.items():
@@ -509,10 +3128,11 @@ for region, color in REGION_COLORS.items():
 # FİLTRELEME MANTIĞI
 # =============================================================================
 # Seçilen müdüre göre veriyi filtrele
+perf.section("Filtreleme", rows=len(merged), memory=True)
 if selected_manager != "TÜMÜ":
     filtered_data = merged[merged["Ticaret Müdürü"] == selected_manager]
 else:
-    filtered_data = merged.copy()
+    filtered_data = merged
 
 # Bölge filtresini uygula
 if selected_bolge != "TÜMÜ":
@@ -523,9 +3143,107 @@ filtered_pf_toplam = filtered_data["PF Kutu"].sum()
 filtered_toplam_pazar = filtered_data["Toplam Kutu"].sum()
 filtered_aktif_sehir = (filtered_data["PF Kutu"] > 0).sum()
 
+# Nokta verisinde isim / koordinat uyumsuzlukları
+if point_check is not None and point_check[1]["Uyumsuz"] + point_check[1]["Atanamayan"] > 0:
+    with st.expander(f"📍 Konum Kontrolü - {point_check[1]['Uyumsuz']:,} uyumsuz, {point_check[1]['Atanamayan']:,} atanamayan nokta"):
+        st.caption("Koordinat bir ile düşüyorsa satış o ile yazılır; şehir adı farklıysa burada listelenir.")
+        show_table(point_check[0], formats={"Nokta": "adet", "PF Kutu": "adet"}, hide_index=True)
+
 # Haritayı FİLTRELENMİŞ veriye göre çiz
-fig = create_figure(filtered_data, selected_manager, view_mode, filtered_pf_toplam, filtered_toplam_pazar)
-st.plotly_chart(fig, use_container_width=True)
+perf.section("Harita", rows=len(filtered_data))
+if client_map:
+    fig = client_map_scope(
+        build_client_map(data_key, view_mode, merged, get_geometry_store(geo)), selected_manager, selected_bolge
+    )
+    st.caption("🖥️ Harita filtreleri tarayıcıda: kapsam ve görünüm için haritanın üstündeki menüleri kullanın.")
+else:
+    fig = create_figure(filtered_data, selected_manager, view_mode, get_geometry_store(geo))
+territory = propose_territories(data_key, territory_workload, territory_stability, merged, geo) if territory_proposal else None
+if territory is not None:
+    fig = territory_overlay(fig, territory)
+# Rotalar işaretli iller belli olunca (Sıfır Satış bölümünden sonra) aynı yere çizilir
+map_slot = st.empty()
+if not visit_routes:
+    with map_slot:
+        show_chart(fig)
+
+if territory_proposal:
+    perf.section("Bölge Dengeleme", rows=len(merged))
+    with st.expander("🧩 Bölge Dengeleme Önerisi", expanded=True):
+        if territory is None:
+            st.info("Dengeleme için en az iki Ticaret Müdürü gerekli.")
+        else:
+            t_cities, t_summary, _, t_stats = territory
+            t_changes = t_cities[t_cities["Mevcut Müdür"] != t_cities["Önerilen Müdür"]]
+            st.caption(
+                "Siyah çizgiler önerilen bitişik müdür bölgeleri, ◆ müdürü değişen iller. "
+                "Öneri tüm Türkiye için hesaplanır; kenar çubuğu filtrelerinden etkilenmez."
+            )
+            if t_stats["Ada İl"] > 0:
+                st.warning(
+                    f"🏝️ {t_stats['Ada İl']} il hiçbir müdürün bölgesine komşu değil; en yakın bölgeye "
+                    f"bağlandı ve bu bölgeler bitişik değil: {', '.join(t_cities.loc[t_cities['Ada'], 'Şehir'])}"
+                )
+            tc1, tc2, tc3, tc4 = st.columns(4)
+            with tc1:
+                st.metric("📏 En Büyük Pazar Sapması",
+                          f"%{t_summary['Önerilen Sapma %'].abs().max():.0f}",
+                          f"{t_summary['Önerilen Sapma %'].abs().max() - t_summary['Mevcut Sapma %'].abs().max():+.0f} puan",
+                          delta_color="inverse")
+            with tc2:
+                st.metric("🔁 Müdürü Değişen İl", f"{len(t_changes)}")
+            with tc3:
+                st.metric("⚡ Hamle / sn", f"{t_stats['Hamle / sn']:,.0f}",
+                          f"{t_stats['Denenen Hamle']:,} denendi, {t_stats['Uygulanan Hamle']:,} uygulandı",
+                          delta_color="off")
+            with tc4:
+                st.metric("⏱️ Süre", f"{t_stats['Süre'] * 1000:,.0f} ms")
+
+            tcol1, tcol2 = st.columns(2)
+            with tcol1:
+                st.markdown("##### 🔁 Değişiklikler")
+                show_table(
+                    t_changes[["Şehir", "Mevcut Müdür", "Önerilen Müdür", "Toplam Kutu"]]
+                    .sort_values("Toplam Kutu", ascending=False, kind="stable"),
+                    formats={"Toplam Kutu": "adet"},
+                    labels={"Toplam Kutu": "Toplam Pazar"},
+                    hide_index=True
+                )
+            with tcol2:
+                st.markdown("##### 👥 Müdür Dengesi")
+                show_table(
+                    t_summary,
+                    formats={"Mevcut Pazar": "adet", "Önerilen Pazar": "adet",
+                             "Mevcut Sapma %": "%+.0f%%", "Önerilen Sapma %": "%+.0f%%"},
+                    labels={"Ticaret Müdürü": "Müdür"},
+                    hide_index=True
+                )
+
+# Birden fazla dönem yüklendiyse animasyonlu dönem haritası
+if len(uploaded_files) > 1 and st.toggle(
+    "🎞️ Dönem Animasyonu",
+    key="period_animation",
+    help="Her yüklenen dosya bir dönem (yükleme sırasıyla); geometri bir kez, her karede sadece değerler gönderilir"
+):
+    perf.section("Dönem Animasyonu", rows=len(uploaded_files))
+    period_metric = st.radio("Metrik", list(PERIOD_METRICS), horizontal=True, key="period_metric")
+    period_keys = tuple((f.file_id, f.name, f.size) for f in uploaded_files)
+    store = get_geometry_store(geo)
+    period_matrix = build_period_matrix(period_keys, uploaded_files, store, geo)
+    show_chart(build_period_animation(
+        period_keys, period_metric, period_matrix, store, geo["fixed_name"].to_numpy(dtype=object)
+    ))
+
+# Müdür / bölge karşılaştırması: tek figürde küçük çoklu haritalar
+if st.toggle("🗺️ Küçük Çoklu Haritalar", key="small_multiples",
+             help="Her müdür veya bölge için bir mini harita; kenar çubuğundan tek tek seçmeye gerek kalmaz"):
+    perf.section("Küçük Çoklu Haritalar", rows=len(merged))
+    sm_col1, sm_col2 = st.columns(2)
+    with sm_col1:
+        small_by = st.radio("Panel", ["Ticaret Müdürü", "Bölge"], horizontal=True, key="small_multiples_by")
+    with sm_col2:
+        small_metric = st.radio("Metrik", list(PERIOD_METRICS), horizontal=True, key="small_multiples_metric")
+    show_chart(build_small_multiples(data_key, small_by, small_metric, merged, get_geometry_store(geo)))
 
 # Genel İstatistikler - FİLTRELENMİŞ veriye göre
 col1, col2, col3, col4 = st.columns(4)
@@ -540,8 +3258,9 @@ with col4:
     st.metric("🏙️ Aktif Şehir", f"{filtered_aktif_sehir}")
 
 # Bölge tablosu - FİLTRELENMİŞ veriye göre
+perf.section("Bölge Tablosu", rows=len(filtered_data))
 display_bolge = (
-    filtered_data.groupby("Bölge", as_index=False)
+    filtered_data.groupby("Bölge", as_index=False, observed=True)
     .agg({"PF Kutu": "sum", "Toplam Kutu": "sum"})
     .sort_values("PF Kutu", ascending=False)
 )
@@ -550,28 +3269,35 @@ display_bolge["Pazar Payı %"] = (display_bolge["PF Kutu"] / display_bolge["Topl
 display_bolge["Pazar Payı %"] = display_bolge["Pazar Payı %"].replace([float('inf'), -float('inf')], 0).fillna(0)
 
 st.subheader("📊 Bölge Bazlı Performans")
-bolge_display = display_bolge[display_bolge["PF Kutu"] > 0].copy()
+bolge_display = display_bolge[display_bolge["PF Kutu"] > 0]
 bolge_display = bolge_display[["Bölge", "PF Kutu", "Toplam Kutu", "PF Pay %", "Pazar Payı %"]]
 
-# Sayıları formatlayarak string'e çevir
-bolge_display["PF Kutu Formatli"] = bolge_display["PF Kutu"].apply(lambda x: f"{x:,.0f}")
-bolge_display["Toplam Kutu Formatli"] = bolge_display["Toplam Kutu"].apply(lambda x: f"{x:,.0f}")
-
-# Gösterilecek kolonları seç
-display_cols = bolge_display[["Bölge", "PF Kutu Formatli", "Toplam Kutu Formatli", "PF Pay %", "Pazar Payı %"]].copy()
-display_cols.columns = ["Bölge", "PF Kutu", "Toplam Pazar", "PF Pay % (Filtrede)", "Pazar Payı %"]
-
-st.dataframe(
-    display_cols, 
-    use_container_width=True, 
+show_table(
+    bolge_display,
+    formats={"PF Kutu": "adet", "Toplam Kutu": "adet", "PF Pay %": "yuzde2", "Pazar Payı %": "yuzde2"},
+    labels={"Toplam Kutu": "Toplam Pazar", "PF Pay %": "PF Pay % (Filtrede)"},
     hide_index=True
 )
 
 # Yatırım Stratejisi Hesaplama - FİLTRELENMİŞ veri üzerinde
+perf.section("Yatırım Stratejisi", rows=len(filtered_data))
 investment_df = calculate_investment_strategy(filtered_data)
 
 # Strateji filtresini uygula
-investment_df_original = investment_df.copy()  # Grafikler için orijinali sakla
+investment_df_original = investment_df  # Grafikler için orijinali sakla (CoW - kopya yok)
+filter_key = (data_key, selected_manager, selected_bolge)
+ranking = get_ranking_index(filter_key, investment_df_original)  # Tüm top-N bölümleri bunu kullanır
+rollup = get_rollup(filter_key, investment_df_original)  # Tüm hiyerarşik toplamlar bunu kullanır
+thresholds = get_threshold_index(filter_key, investment_df_original)  # Fırsat eşik seçimleri
+
+# Sıfır satışlı iller strateji tablosunda yok (PF Kutu ≤ 0 elenir); il listesinden gelir
+coverage = get_coverage_index(data_key, merged, geo)
+white_space = coverage.white_space(selected_manager, selected_bolge)
+
+# Öncelik skoru: bileşenler filtre başına önbellekte, ağırlık değişimi sadece yeniden skorlar
+priority = get_priority_scorer(filter_key, investment_df_original)
+if len(investment_df_original) > 0:
+    investment_df_original = investment_df_original.assign(**{"Öncelik Skoru": priority.score(priority_weights)})
 if selected_strateji != "Tümü" and len(investment_df) > 0:
     investment_df = investment_df[investment_df["Yatırım Stratejisi"] == selected_strateji]
 
@@ -637,6 +3363,7 @@ if len(investment_df_original) > 0:
         - **Aksiyon**: Minimal kaynak, durumu takip et
         """)
 
+perf.section("Şehir Tablosu", rows=len(investment_df))
 st.subheader("🏙️ Şehir Bazlı Detay Analiz")
 # Şehir bazında tabloyu hazırla
 if len(investment_df) > 0:
@@ -645,21 +3372,17 @@ if len(investment_df) > 0:
         "Pazar Payı %", "Yatırım Stratejisi", 
         "Pazar Büyüklüğü", "Performans", "Pazar Payı Segment",
         "Büyüme Potansiyeli", "Ticaret Müdürü"
-    ]].copy()
+    ]]
 else:
     city_df = filtered_data[filtered_data["PF Kutu"] > 0][[
         "Şehir", "Bölge", "PF Kutu", "Toplam Kutu", 
         "Pazar Payı %", "Ticaret Müdürü"
-    ]].copy()
+    ]]
     city_df["Yatırım Stratejisi"] = "👁️ İzleme"
 
 # PF Kutu'ya göre sırala
 city_df = city_df.sort_values("PF Kutu", ascending=False).reset_index(drop=True)
 
-# Sayıları formatlayarak string'e çevir
-city_df["PF Kutu Formatli"] = city_df["PF Kutu"].apply(lambda x: f"{x:,.0f}")
-city_df["Toplam Kutu Formatli"] = city_df["Toplam Kutu"].apply(lambda x: f"{x:,.0f}")
-
 # FİLTRELENMİŞ veriye göre PF Pay % hesapla
 city_df["PF Pay % (Filtrede)"] = (city_df["PF Kutu"] / filtered_pf_toplam * 100).round(2) if filtered_pf_toplam > 0 else 0
 
@@ -669,67 +3392,57 @@ city_df.index = city_df.index + 1
 # Gösterilecek kolonları yeniden düzenle
 if len(investment_df) > 0:
     display_city = city_df[[
-        "Şehir", "Bölge", "PF Kutu Formatli", "Toplam Kutu Formatli",
+        "Şehir", "Bölge", "PF Kutu", "Toplam Kutu",
         "PF Pay % (Filtrede)", "Pazar Payı %",
         "Yatırım Stratejisi", "Pazar Büyüklüğü", "Büyüme Potansiyeli",
         "Ticaret Müdürü"
-    ]].copy()
-    display_city.columns = [
-        "Şehir", "Bölge", "PF Kutu", "Toplam Pazar",
-        "PF Pay % (Filtre)", "Pazar Payı %",
-        "Strateji", "Pazar", "Büyüme",
-        "Ticaret Müdürü"
-    ]
+    ]]
 else:
     display_city = city_df[[
-        "Şehir", "Bölge", "PF Kutu Formatli", "Toplam Kutu Formatli",
+        "Şehir", "Bölge", "PF Kutu", "Toplam Kutu",
         "PF Pay % (Filtrede)", "Pazar Payı %", "Yatırım Stratejisi",
         "Ticaret Müdürü"
-    ]].copy()
-    display_city.columns = [
-        "Şehir", "Bölge", "PF Kutu", "Toplam Pazar",
-        "PF Pay % (Filtre)", "Pazar Payı %", "Strateji",
-        "Ticaret Müdürü"
-    ]
+    ]]
 
 st.caption("📊 Şehirler **PF Kutu hacmine** göre sıralanmıştır")
-st.dataframe(
+show_table(
     display_city,
-    use_container_width=True,
+    formats={"PF Kutu": "adet", "Toplam Kutu": "adet", "PF Pay % (Filtrede)": "yuzde2", "Pazar Payı %": "yuzde2"},
+    labels={
+        "Toplam Kutu": "Toplam Pazar",
+        "PF Pay % (Filtrede)": "PF Pay % (Filtre)",
+        "Yatırım Stratejisi": "Strateji",
+        "Pazar Büyüklüğü": "Pazar",
+        "Büyüme Potansiyeli": "Büyüme"
+    },
     hide_index=False
 )
 
 # =============================================================================
 # GÖRSELLEŞTİRMELER - İYİLEŞTİRİLMİŞ
 # =============================================================================
-import plotly.express as px
 
 
 
+perf.section("Top 10 & Strateji Dağılımı", rows=len(investment_df_original))
 if len(investment_df_original) > 0:
     col_viz1, col_viz2 = st.columns(2)
     
     with col_viz1:
         st.markdown("#### 🏆 Top 10 Öncelikli Şehirler")
         if "Öncelik Skoru" in investment_df_original.columns:
-            top10 = investment_df_original.nlargest(10, "Öncelik Skoru")[["Şehir", "Öncelik Skoru", "Yatırım Stratejisi"]]
+            top10 = priority.top(priority_weights, 10)[["Şehir", "Öncelik Skoru", "Yatırım Stratejisi"]]
             fig_bar = px.bar(
                 top10, 
                 x="Öncelik Skoru", 
                 y="Şehir",
                 orientation='h',
                 color="Yatırım Stratejisi",
-                color_discrete_map={
-                    "🚀 Agresif": "#EF4444",
-                    "⚡ Hızlandırılmış": "#F59E0B",
-                    "🛡️ Koruma": "#10B981",
-                    "💎 Potansiyel": "#8B5CF6",
-                    "👁️ İzleme": "#6B7280"
-                }
+                color_discrete_map=STRATEGY_COLORS
             )
             fig_bar.update_traces(textposition='outside', texttemplate='%{x:.0f}')
         else:
-            top10 = investment_df_original.nlargest(10, "PF Kutu")[["Şehir", "PF Kutu"]]
+            top10 = ranking.top("PF Kutu", 10)[["Şehir", "PF Kutu"]]
             fig_bar = px.bar(
                 top10, 
                 x="PF Kutu", 
@@ -747,7 +3460,7 @@ if len(investment_df_original) > 0:
             plot_bgcolor='rgba(0,0,0,0)',
             paper_bgcolor='rgba(0,0,0,0)'
         )
-        st.plotly_chart(fig_bar, use_container_width=True)
+        show_chart(fig_bar)
     
     with col_viz2:
         st.markdown("#### 🎯 Yatırım Stratejisi Dağılımı")
@@ -755,13 +3468,7 @@ if len(investment_df_original) > 0:
         strateji_counts.columns = ["Strateji", "Şehir Sayısı"]
         
         # Modern renkler - stratejiye uygun
-        color_map = {
-            "🚀 Agresif": "#EF4444",         # Kırmızı - Agresif
-            "⚡ Hızlandırılmış": "#F59E0B",  # Turuncu - Hızlı
-            "🛡️ Koruma": "#10B981",         # Yeşil - Güvenli
-            "💎 Potansiyel": "#8B5CF6",     # Mor - Değerli
-            "👁️ İzleme": "#6B7280"          # Gri - Pasif
-        }
+        color_map = STRATEGY_COLORS
         
         fig_pie = px.pie(
             strateji_counts,
@@ -776,7 +3483,7 @@ if len(investment_df_original) > 0:
             paper_bgcolor='rgba(0,0,0,0)'
         )
         fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_pie, use_container_width=True)
+        show_chart(fig_pie)
     
     # İYİLEŞTİRİLMİŞ Scatter plot: Pazar Büyüklüğü vs Pazar Payı
     
@@ -785,10 +3492,11 @@ if len(investment_df_original) > 0:
     # =========================================================================
     
     # 1. TREEMAP - Hiyerarşik Görünüm (En Anlaşılır)
+    perf.section("Treemap", rows=len(investment_df_original), memory=True)
     st.markdown("#### 🗺️ Hiyerarşik Pazar Haritası")
     st.caption("📦 Bölge → Strateji → Şehir • Kutu boyutu = PF Kutu | Renk = Pazar Payı %")
     
-    treemap_df = investment_df_original.copy()
+    treemap_df = rollup.level('Bölge', 'Yatırım Stratejisi', 'Şehir').rename(columns={'Ort. Pazar Payı %': 'Pazar Payı %'})
     treemap_df["Strateji_Kısa"] = treemap_df["Yatırım Stratejisi"].str.replace("🚀 ", "").str.replace("⚡ ", "").str.replace("🛡️ ", "").str.replace("💎 ", "").str.replace("👁️ ", "")
     
     fig_treemap = px.treemap(
@@ -816,21 +3524,19 @@ if len(investment_df_original) > 0:
         marker=dict(line=dict(color='white', width=2))
     )
     
-    st.plotly_chart(fig_treemap, use_container_width=True)
+    show_chart(fig_treemap)
     
     st.markdown("---")
     
     # 2 & 3. SUNBURST + TOP 15 DUAL AXIS
+    perf.section("Sunburst & Top 15", rows=len(investment_df_original))
     col_sun1, col_sun2 = st.columns(2)
     
     with col_sun1:
         st.markdown("#### ☀️ Radyal Dağılım (Sunburst)")
         st.caption("🎯 Merkezden dışa: Türkiye → Bölge → Strateji")
         
-        sunburst_df = investment_df_original.groupby(['Bölge', 'Yatırım Stratejisi'], as_index=False).agg({
-            'PF Kutu': 'sum',
-            'Pazar Payı %': 'mean'
-        })
+        sunburst_df = rollup.level('Bölge', 'Yatırım Stratejisi').rename(columns={'Ort. Pazar Payı %': 'Pazar Payı %'})
         
         fig_sunburst = px.sunburst(
             sunburst_df,
@@ -847,13 +3553,13 @@ if len(investment_df_original) > 0:
             font=dict(size=10, color='white')
         )
         
-        st.plotly_chart(fig_sunburst, use_container_width=True)
+        show_chart(fig_sunburst)
     
     with col_sun2:
         st.markdown("#### 📊 Top 15 Şehir - PF Kutu Hacmi")
         st.caption("🏆 En yüksek PF Kutu hacmine sahip 15 şehir")
         
-        top15 = investment_df_original.nlargest(15, 'PF Kutu').copy()
+        top15 = ranking.top('PF Kutu', 15)
         
         fig_top15 = px.bar(
             top15,
@@ -881,11 +3587,12 @@ if len(investment_df_original) > 0:
             showlegend=False
         )
         
-        st.plotly_chart(fig_top15, use_container_width=True)
+        show_chart(fig_top15)
     
     st.markdown("---")
     
     # 4 & 5. BOX PLOT + VIOLIN PLOT
+    perf.section("Box Plot & Strateji Payı", rows=len(investment_df_original))
     col_dist1, col_dist2 = st.columns(2)
     
     with col_dist1:
@@ -911,28 +3618,21 @@ if len(investment_df_original) > 0:
             showlegend=False
         )
         
-        st.plotly_chart(fig_box, use_container_width=True)
+        show_chart(fig_box)
     
     with col_dist2:
         st.markdown("#### 📈 Strateji Bazlı Pazar Payı")
         st.caption("🎯 Her stratejideki ortalama pazar payı (±Std)")
         
-        strateji_stats = investment_df_original.groupby('Yatırım Stratejisi').agg({
-            'Pazar Payı %': ['mean', 'std', 'count'],
-            'PF Kutu': 'sum'
-        }).reset_index()
+        strateji_stats = rollup.level('Yatırım Stratejisi')[
+            ['Yatırım Stratejisi', 'Ort. Pazar Payı %', 'Std Pazar Payı %', 'Şehir Sayısı', 'PF Kutu']
+        ]
         
         strateji_stats.columns = ['Strateji', 'Ort_Pay', 'Std_Pay', 'Şehir_Sayısı', 'Toplam_PF']
         
         fig_strateji = go.Figure()
         
-        colors_map = {
-            "🚀 Agresif": "#EF4444",
-            "⚡ Hızlandırılmış": "#F59E0B",
-            "🛡️ Koruma": "#10B981",
-            "💎 Potansiyel": "#8B5CF6",
-            "👁️ İzleme": "#6B7280"
-        }
+        colors_map = STRATEGY_COLORS
         
         fig_strateji.add_trace(go.Bar(
             x=strateji_stats['Strateji'],
@@ -958,15 +3658,16 @@ if len(investment_df_original) > 0:
             )
         )
         
-        st.plotly_chart(fig_strateji, use_container_width=True)
+        show_chart(fig_strateji)
     
     st.markdown("---")
     
     # 6. WATERFALL CHART - Bölge Katkı Analizi
+    perf.section("Waterfall", rows=len(investment_df_original))
     st.markdown("#### 💧 Bölgelerin Kümülatif Katkı Analizi (Waterfall)")
     st.caption("📊 Her bölgenin toplam PF Kutu'ya katkısı - soldan sağa birikiyor")
     
-    bolge_katki = investment_df_original.groupby('Bölge')['PF Kutu'].sum().sort_values(ascending=False).reset_index()
+    bolge_katki = rollup.level('Bölge')[['Bölge', 'PF Kutu']].sort_values('PF Kutu', ascending=False)
     
     fig_waterfall = go.Figure(go.Waterfall(
         name="PF Kutu",
@@ -996,21 +3697,20 @@ if len(investment_df_original) > 0:
         showlegend=False
     )
     
-    st.plotly_chart(fig_waterfall, use_container_width=True)
+    show_chart(fig_waterfall)
     
     st.markdown("---")
     
     # 7. HEATMAP - Bölge x Strateji Matrix
+    perf.section("Heatmap", rows=len(investment_df_original))
     st.markdown("#### 🔥 Bölge × Strateji Isı Haritası")
     st.caption("🎨 Hangi bölgede hangi strateji ne kadar güçlü?")
     
-    heatmap_data = investment_df_original.pivot_table(
+    heatmap_data = rollup.level('Bölge', 'Yatırım Stratejisi').pivot(
         index='Bölge',
         columns='Yatırım Stratejisi',
-        values='PF Kutu',
-        aggfunc='sum',
-        fill_value=0
-    )
+        values='PF Kutu'
+    ).fillna(0)
     
     fig_heatmap = px.imshow(
         heatmap_data,
@@ -1027,36 +3727,25 @@ if len(investment_df_original) > 0:
         xaxis=dict(tickangle=-30)
     )
     
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+    show_chart(fig_heatmap)
     
     st.markdown("---")
     
     # 8. BCG MATRIX - Stratejik Pozisyonlama (MAVİ TONLARI)
+    perf.section("BCG Matrix", rows=len(investment_df_original), memory=True)
     st.markdown("#### 🎯 BCG Matrix - Stratejik Pazar Pozisyonları")
     st.caption("⭐ Stars | ❓ Question Marks | 💰 Cash Cows | 🐕 Dogs")
     
     col_bcg1, col_bcg2 = st.columns([2, 1])
     
     with col_bcg1:
-        # BCG Matrix hesaplamaları
-        scatter_df = investment_df_original.copy()
-        
-        # Median değerler
-        pazar_median = scatter_df["Toplam Kutu"].median()
-        pay_median = scatter_df["Pazar Payı %"].median()
-        
-        # BCG Kadran atama
-        def assign_bcg_quadrant(row):
-            if row["Toplam Kutu"] >= pazar_median and row["Pazar Payı %"] >= pay_median:
-                return "⭐ Stars (Yıldızlar)"
-            elif row["Toplam Kutu"] >= pazar_median and row["Pazar Payı %"] < pay_median:
-                return "❓ Question Marks (Soru İşaretleri)"
-            elif row["Toplam Kutu"] < pazar_median and row["Pazar Payı %"] >= pay_median:
-                return "💰 Cash Cows (Nakit İnekleri)"
-            else:
-                return "🐕 Dogs (Düşük Öncelik)"
+        # BCG Matrix hesaplamaları - medyanlar veri başına önbellekteki tablodan
+        bcg_index = get_bcg_index(data_key, merged)
+        pazar_median, pay_median = bcg_index.median(selected_manager, selected_bolge)
+        bcg_codes = bcg_index.classify(investment_df_original, selected_manager, selected_bolge)
         
-        scatter_df["BCG Kategori"] = scatter_df.apply(assign_bcg_quadrant, axis=1)
+        scatter_df = investment_df_original.copy(deep=False)  # CoW: yeni kolonlar orijinali değiştirmez
+        scatter_df["BCG Kategori"] = np.asarray(BCG_QUADRANTS, dtype=object)[bcg_codes]
         
         # Mavi tonları renk paleti
         color_map_bcg = {
@@ -1135,7 +3824,7 @@ if len(investment_df_original) > 0:
         
         fig_bcg.update_traces(marker=dict(line=dict(width=2, color='rgba(255,255,255,0.5)'), opacity=0.85))
         
-        st.plotly_chart(fig_bcg, use_container_width=True)
+        show_chart(fig_bcg)
     
     with col_bcg2:
         st.markdown("##### 📚 BCG Matrix Rehberi")
@@ -1180,12 +3869,7 @@ if len(investment_df_original) > 0:
     # 4 kolon yan yana
     col_dist1, col_dist2, col_dist3, col_dist4 = st.columns(4)
     
-    bcg_stats = scatter_df.groupby('BCG Kategori').agg({
-        'Şehir': 'count',
-        'PF Kutu': 'sum',
-        'Pazar Payı %': 'mean'
-    }).reset_index()
-    bcg_stats.columns = ['Kategori', 'Şehir Sayısı', 'Toplam PF Kutu', 'Ort. Pay']
+    bcg_stats = BCGIndex.summary(investment_df_original, bcg_codes)
     
     bcg_dict = bcg_stats.set_index('Kategori').to_dict('index')
     
@@ -1233,10 +3917,11 @@ if len(investment_df_original) > 0:
     st.markdown("---")
     
     # 4. ÇOK BOYUTLU ŞEHİR ANALİZİ - PROFESYONEL
+    perf.section("Top 30 Analizi", rows=len(investment_df_original), memory=True)
     st.markdown("#### 🔗 Çok Boyutlu Şehir Analizi (Top 30)")
     st.caption("📊 Üç boyutlu metrik analizi: PF Kutu, Pazar Büyüklüğü ve Pazar Payı")
     
-    top30_df = investment_df_original.nlargest(30, 'PF Kutu').copy()
+    top30_df = ranking.top('PF Kutu', 30)
     
     col_3d1, col_3d2 = st.columns(2)
     
@@ -1305,7 +3990,7 @@ if len(investment_df_original) > 0:
             )
         )
         
-        st.plotly_chart(fig_3d, use_container_width=True)
+        show_chart(fig_3d)
         st.caption("🎯 3 eksende şehirlerin konumu. Büyük top = Yüksek hacim. Koyu mavi = Yüksek pazar payı.")
     
     with col_3d2:
@@ -1318,13 +4003,7 @@ if len(investment_df_original) > 0:
             y='Pazar Payı %',
             size='PF Kutu',
             color='Yatırım Stratejisi',
-            color_discrete_map={
-                "🚀 Agresif": "#EF4444",
-                "⚡ Hızlandırılmış": "#F59E0B",
-                "🛡️ Koruma": "#10B981",
-                "💎 Potansiyel": "#8B5CF6",
-                "👁️ İzleme": "#6B7280"
-            },
+            color_discrete_map=STRATEGY_COLORS,
             hover_name='Şehir',
             hover_data={
                 'Bölge': True,
@@ -1376,7 +4055,7 @@ if len(investment_df_original) > 0:
             )
         )
         
-        st.plotly_chart(fig_bubble_adv, use_container_width=True)
+        show_chart(fig_bubble_adv)
         st.caption("💡 Bubble boyutu = PF Kutu. Renk = Strateji. Sağ üst köşe = İdeal pozisyon.")
     
     st.markdown("---")
@@ -1388,12 +4067,7 @@ if len(investment_df_original) > 0:
     top30_display.index = top30_display.index + 1
     
     display_cols = ['Şehir', 'Bölge', 'PF Kutu', 'Toplam Kutu', 'Pazar Payı %', 'Yatırım Stratejisi']
-    top30_display_formatted = top30_display[display_cols].copy()
-    
-    # Formatting
-    top30_display_formatted['PF Kutu'] = top30_display_formatted['PF Kutu'].apply(lambda x: f'{x:,.0f}')
-    top30_display_formatted['Toplam Kutu'] = top30_display_formatted['Toplam Kutu'].apply(lambda x: f'{x:,.0f}')
-    top30_display_formatted['Pazar Payı %'] = top30_display_formatted['Pazar Payı %'].apply(lambda x: f'{x:.1f}%')
+    top30_display_formatted = top30_display[display_cols]
     
     # Conditional formatting için stil
     def highlight_top(row):
@@ -1404,9 +4078,9 @@ if len(investment_df_original) > 0:
         else:
             return [''] * len(row)
     
-    st.dataframe(
+    show_table(
         top30_display_formatted,
-        use_container_width=True,
+        formats={'PF Kutu': 'adet', 'Toplam Kutu': 'adet', 'Pazar Payı %': 'yuzde'},
         hide_index=False,
         height=400
     )
@@ -1429,15 +4103,11 @@ if len(investment_df_original) > 0:
     st.markdown("---")
     
     # 5. RADAR CHART - Bölge Karşılaştırması
+    perf.section("Radar", rows=len(investment_df_original))
     st.markdown("#### 🎯 Bölge Performans Karşılaştırması")
     
     # Bölge bazında metrikler
-    bolge_metrics = investment_df_original.groupby('Bölge').agg({
-        'PF Kutu': 'sum',
-        'Toplam Kutu': 'sum',
-        'Pazar Payı %': 'mean',
-        'Şehir': 'count'
-    }).reset_index()
+    bolge_metrics = rollup.level('Bölge')[['Bölge', 'PF Kutu', 'Toplam Kutu', 'Ort. Pazar Payı %', 'Şehir Sayısı']]
     
     bolge_metrics.columns = ['Bölge', 'PF Kutu', 'Toplam Kutu', 'Ort Pazar Payı', 'Şehir Sayısı']
     
@@ -1481,12 +4151,11 @@ if len(investment_df_original) > 0:
         )
     )
     
-    st.plotly_chart(fig_radar, use_container_width=True)
+    show_chart(fig_radar)
     st.caption("🎯 Her eksen bir metriği temsil eder. Şeklin büyüklüğü o bölgenin genel performansını gösterir.")
     
     st.markdown("---")
 
-import plotly.express as px
 
 if len(investment_df_original) > 0:
     
@@ -1494,60 +4163,18 @@ if len(investment_df_original) > 0:
     # ... Treemap, Sunburst, Box Plot, vb ...
     
     #  🌊 1. SANKEY AKIŞ DİYAGRAMI
+    perf.section("Sankey", rows=len(investment_df_original), memory=True)
     st.markdown("### 🌊 Sankey Akış Diyagramı")
-    st.caption("💡 Bölge → Strateji → Top Şehirler akışı")
-    
-    sankey_df = investment_df_original.nlargest(15, 'PF Kutu').copy()
-    all_bolge = sankey_df['Bölge'].unique().tolist()
-    all_strateji = sankey_df['Yatırım Stratejisi'].unique().tolist()
-    all_sehir = sankey_df['Şehir'].tolist()
-    nodes = all_bolge + all_strateji + all_sehir
-    node_dict = {node: idx for idx, node in enumerate(nodes)}
-    
-    sources, targets, values, colors_link = [], [], [], []
-    for idx, row in sankey_df.iterrows():
-        sources.append(node_dict[row['Bölge']])
-        targets.append(node_dict[row['Yatırım Stratejisi']])
-        values.append(row['PF Kutu'])
-        colors_link.append('rgba(59, 130, 246, 0.3)')
-    
-    for idx, row in sankey_df.iterrows():
-        sources.append(node_dict[row['Yatırım Stratejisi']])
-        targets.append(node_dict[row['Şehir']])
-        values.append(row['PF Kutu'])
-        if '🚀' in row['Yatırım Stratejisi']:
-            colors_link.append('rgba(239, 68, 68, 0.4)')
-        elif '⚡' in row['Yatırım Stratejisi']:
-            colors_link.append('rgba(245, 158, 11, 0.4)')
-        elif '🛡️' in row['Yatırım Stratejisi']:
-            colors_link.append('rgba(16, 185, 129, 0.4)')
-        elif '💎' in row['Yatırım Stratejisi']:
-            colors_link.append('rgba(139, 92, 246, 0.4)')
-        else:
-            colors_link.append('rgba(107, 114, 128, 0.4)')
-    
-    node_colors = []
-    for node in nodes:
-        if node in all_bolge:
-            node_colors.append('#3B82F6')
-        elif node in all_strateji:
-            if '🚀' in node:
-                node_colors.append('#EF4444')
-            elif '⚡' in node:
-                node_colors.append('#F59E0B')
-            elif '🛡️' in node:
-                node_colors.append('#10B981')
-            elif '💎' in node:
-                node_colors.append('#8B5CF6')
-            else:
-                node_colors.append('#6B7280')
-        else:
-            node_colors.append('#64748B')
+    st.caption("💡 Bölge → Strateji → Müdür → Şehir akışı (küçük akışlar 'Diğer' altında toplanır)")
+    
+    sankey_top_k = st.slider("Seviye başına düğüm sayısı", 5, 50, SANKEY_TOP_K, step=5)
+    sankey = build_sankey(filter_key, investment_df_original, sankey_top_k)
     
     fig_sankey = go.Figure(data=[go.Sankey(
         node=dict(pad=15, thickness=20, line=dict(color='white', width=2),
-                  label=nodes, color=node_colors),
-        link=dict(source=sources, target=targets, value=values, color=colors_link)
+                  label=sankey["labels"], color=sankey["node_colors"]),
+        link=dict(source=sankey["source"], target=sankey["target"],
+                  value=sankey["value"], color=sankey["link_colors"])
     )])
     
     fig_sankey.update_layout(
@@ -1556,11 +4183,12 @@ if len(investment_df_original) > 0:
         plot_bgcolor='#0f172a',
         paper_bgcolor='rgba(0,0,0,0)'
     )
-    st.plotly_chart(fig_sankey, use_container_width=True)
+    show_chart(fig_sankey)
     
     st.markdown("---")
     
     # 📊 2. FUNNEL CHART
+    perf.section("Funnel", rows=len(investment_df_original))
     st.markdown("### 📊 Pazar Penetrasyon Hunisi")
     st.caption("🎯 Toplam Pazar → PF Kutu → Top Performers")
     
@@ -1569,9 +4197,9 @@ if len(investment_df_original) > 0:
     with col_f1:
         total_market = filtered_toplam_pazar
         total_pf = filtered_pf_toplam
-        top_20 = investment_df_original.nlargest(20, 'PF Kutu')['PF Kutu'].sum()
-        top_10 = investment_df_original.nlargest(10, 'PF Kutu')['PF Kutu'].sum()
-        top_5 = investment_df_original.nlargest(5, 'PF Kutu')['PF Kutu'].sum()
+        top_20 = ranking.top_sum('PF Kutu', 20)
+        top_10 = ranking.top_sum('PF Kutu', 10)
+        top_5 = ranking.top_sum('PF Kutu', 5)
         
         funnel_data = pd.DataFrame({
             'Aşama': ['🌍 Toplam Pazar', '📦 PF Toplam', '🏆 Top 20', '⭐ Top 10', '👑 Top 5'],
@@ -1586,7 +4214,7 @@ if len(investment_df_original) > 0:
             marker=dict(color=['#60A5FA', '#3B82F6', '#2563EB', '#1D4ED8', '#1E40AF'])
         ))
         fig_funnel.update_layout(height=500, paper_bgcolor='rgba(0,0,0,0)', font=dict(color='white'))
-        st.plotly_chart(fig_funnel, use_container_width=True)
+        show_chart(fig_funnel)
     
     with col_f2:
         st.markdown("#### 📈 Metriks")
@@ -1605,21 +4233,15 @@ if len(investment_df_original) > 0:
 # ============================================================================
 # YENİ ÖZELLİK 1: TİCARET MÜDÜRÜ PERFORMANS SCORECARD
 # ============================================================================
+perf.section("Müdür Scorecard", rows=len(investment_df_original))
 st.markdown("---")
 st.markdown("### 👥 Ticaret Müdürü Performans Scorecard")
 
 if len(investment_df_original) > 0:
-    mudur_performance = investment_df_original.groupby('Ticaret Müdürü').agg({
-        'PF Kutu': 'sum',
-        'Toplam Kutu': 'sum',
-        'Şehir': 'count',
-        'Pazar Payı %': 'mean'
-    }).reset_index()
-    
-    mudur_performance['Ort. Pazar Payı %'] = mudur_performance['Pazar Payı %'].round(1)
-    mudur_performance['Toplam Pazar Payı %'] = (
-        mudur_performance['PF Kutu'] / mudur_performance['Toplam Kutu'] * 100
-    ).round(1)
+    mudur_performance = rollup.level('Ticaret Müdürü').rename(columns={'Şehir Sayısı': 'Şehir'})
+    
+    mudur_performance['Ort. Pazar Payı %'] = mudur_performance['Ort. Pazar Payı %'].round(1)
+    mudur_performance['Toplam Pazar Payı %'] = mudur_performance['Toplam Pazar Payı %'].round(1)
     mudur_performance = mudur_performance.sort_values('PF Kutu', ascending=False)
     mudur_performance['Rank'] = range(1, len(mudur_performance) + 1)
     
@@ -1662,12 +4284,15 @@ if len(investment_df_original) > 0:
     st.markdown("#### 📊 Detaylı Müdür Karşılaştırması")
     
     mudur_display = mudur_performance[['Rank', 'Ticaret Müdürü', 'PF Kutu', 'Toplam Kutu', 
-                                       'Şehir', 'Toplam Pazar Payı %']].copy()
-    mudur_display['PF Kutu'] = mudur_display['PF Kutu'].apply(lambda x: f"{x:,.0f}")
-    mudur_display['Toplam Kutu'] = mudur_display['Toplam Kutu'].apply(lambda x: f"{x:,.0f}")
-    mudur_display.columns = ['Sıra', 'Müdür', 'PF Kutu', 'Toplam Pazar', 'Şehir Sayısı', 'Pazar Payı %']
-    
-    st.dataframe(mudur_display, use_container_width=True, hide_index=True)
+                                       'Şehir', 'Toplam Pazar Payı %']]
+    
+    show_table(
+        mudur_display,
+        formats={'PF Kutu': 'adet', 'Toplam Kutu': 'adet', 'Şehir': '%d', 'Toplam Pazar Payı %': 'yuzde'},
+        labels={'Rank': 'Sıra', 'Ticaret Müdürü': 'Müdür', 'Toplam Kutu': 'Toplam Pazar',
+                'Şehir': 'Şehir Sayısı', 'Toplam Pazar Payı %': 'Pazar Payı %'},
+        hide_index=True
+    )
     
     # Müdür karşılaştırma grafiği
     col_mg1, col_mg2 = st.columns(2)
@@ -1689,7 +4314,7 @@ if len(investment_df_original) > 0:
             paper_bgcolor='rgba(0,0,0,0)',
             xaxis=dict(tickangle=-45)
         )
-        st.plotly_chart(fig_mudur, use_container_width=True)
+        show_chart(fig_mudur)
     
     with col_mg2:
         st.markdown("##### 🎯 Pazar Payı Karşılaştırması")
@@ -1707,31 +4332,57 @@ if len(investment_df_original) > 0:
             plot_bgcolor='#0f172a',
             paper_bgcolor='rgba(0,0,0,0)'
         )
-        st.plotly_chart(fig_mudur_pay, use_container_width=True)
+        show_chart(fig_mudur_pay)
 
 # ============================================================================
 # YENİ ÖZELLİK 2: BÜYÜK FIRSATLAR - AKSIYONA DÖNÜŞTÜR (KIRMIZI)
 # ============================================================================
+perf.section("Büyük Fırsatlar", rows=len(investment_df_original), memory=True)
 st.markdown("---")
 st.markdown("### 💎 Büyük Fırsatlar - Aksiyon Gerekli!")
 st.caption("🎯 Büyük pazar + Düşük payımız = En yüksek ROI potansiyeli")
 
 if len(investment_df_original) > 0:
-    investment_df_original['Büyüme Potansiyeli Kutu'] = (
-        investment_df_original['Toplam Kutu'] - investment_df_original['PF Kutu']
+    # 'Büyüme Alanı' strateji hesabında zaten var - yeniden hesaplamak yerine yeni isimle bağla
+    investment_df_original = investment_df_original.assign(
+        **{'Büyüme Potansiyeli Kutu': investment_df_original['Büyüme Alanı']}
     )
     
-    # Fırsat kriterleri
-    median_pazar = investment_df_original['Toplam Kutu'].median()
+    # Fırsat kriterleri - varsayılanlar: medyan üstü pazar, %10 altı pay, 50.000 üstü potansiyel
+    max_pazar = int(investment_df_original['Toplam Kutu'].max())
+    max_buyume = int(investment_df_original['Büyüme Alanı'].max())
+    firsat_varsayilan = {
+        'Toplam Kutu': (int(investment_df_original['Toplam Kutu'].median()), None),
+        'Pazar Payı %': (None, OPPORTUNITY_MAX_PAY),
+        'Büyüme Alanı': (min(OPPORTUNITY_MIN_BUYUME, max_buyume), None),
+    }
+    
+    col_esik1, col_esik2, col_esik3 = st.columns(3)
+    with col_esik1:
+        firsat_min_pazar = st.slider(
+            "Toplam Kutu (min)", 0, max(max_pazar, 1),
+            firsat_varsayilan['Toplam Kutu'][0], step=max(max_pazar // 100, 1)
+        )
+    with col_esik2:
+        firsat_max_pay = st.slider("Pazar Payı % (max)", 0.0, 100.0, OPPORTUNITY_MAX_PAY, step=0.5)
+    with col_esik3:
+        firsat_min_buyume = st.slider(
+            "Büyüme Potansiyeli Kutu (min)", 0, max(max_buyume, 1),
+            firsat_varsayilan['Büyüme Alanı'][0], step=max(max_buyume // 100, 1)
+        )
     
-    firsatlar_df = investment_df_original[
-        (investment_df_original['Toplam Kutu'] > median_pazar) &
-        (investment_df_original['Pazar Payı %'] < 10) &
-        (investment_df_original['Büyüme Potansiyeli Kutu'] > 50000)
-    ].copy()
+    firsat_kosullari = {
+        'Toplam Kutu': (firsat_min_pazar, None),
+        'Pazar Payı %': (None, firsat_max_pay),
+        'Büyüme Alanı': (firsat_min_buyume, None),
+    }
+    # Aksiyon planına sadece değiştirilen eşikler gider; varsayılanlar kapsam başına hesaplanır
+    firsat_degisen = tuple(sorted(
+        (metric, limits) for metric, limits in firsat_kosullari.items() if limits != firsat_varsayilan[metric]
+    ))
+    firsatlar_df = investment_df_original.iloc[thresholds.select(firsat_kosullari, 'Büyüme Alanı')]
     
     if len(firsatlar_df) > 0:
-        firsatlar_df = firsatlar_df.sort_values('Büyüme Potansiyeli Kutu', ascending=False)
         
         st.error(f"🚨 **{len(firsatlar_df)} şehirde büyük fırsat tespit edildi!**")
         
@@ -1772,7 +4423,7 @@ if len(investment_df_original) > 0:
             font=dict(color='white')
         )
         
-        st.plotly_chart(fig_firsat, use_container_width=True)
+        show_chart(fig_firsat)
         
         st.markdown("---")
         
@@ -1812,66 +4463,146 @@ if len(investment_df_original) > 0:
         st.markdown("##### 📋 Tüm Fırsatlar - Detaylı Liste")
         firsat_display = firsatlar_df[['Şehir', 'Bölge', 'PF Kutu', 'Toplam Kutu', 
                                         'Pazar Payı %', 'Büyüme Potansiyeli Kutu', 
-                                        'Ticaret Müdürü']].copy()
-        firsat_display['PF Kutu'] = firsat_display['PF Kutu'].apply(lambda x: f"{x:,.0f}")
-        firsat_display['Toplam Kutu'] = firsat_display['Toplam Kutu'].apply(lambda x: f"{x:,.0f}")
-        firsat_display['Büyüme Potansiyeli Kutu'] = firsat_display['Büyüme Potansiyeli Kutu'].apply(lambda x: f"{x:,.0f}")
-        firsat_display.columns = ['Şehir', 'Bölge', 'PF Kutu', 'Toplam Pazar', 'Pazar Payı %', 'Potansiyel', 'Sorumlu Müdür']
+                                        'Ticaret Müdürü']]
         
-        st.dataframe(firsat_display, use_container_width=True, hide_index=True)
+        show_table(
+            firsat_display,
+            formats={'PF Kutu': 'adet', 'Toplam Kutu': 'adet', 'Pazar Payı %': 'yuzde2',
+                     'Büyüme Potansiyeli Kutu': 'adet'},
+            labels={'Toplam Kutu': 'Toplam Pazar', 'Büyüme Potansiyeli Kutu': 'Potansiyel',
+                    'Ticaret Müdürü': 'Sorumlu Müdür'},
+            hide_index=True
+        )
     else:
         st.success("✅ Şu anda büyük fırsat kategorisinde şehir yok!")
 
 # ============================================================================
 # YENİ ÖZELLİK 3: SIFIR SATIŞ OLAN ŞEHİRLER - UYARI
 # ============================================================================
+perf.section("Sıfır Satış", rows=len(white_space))
 st.markdown("---")
 st.markdown("### ⚠️ Sıfır Satış Olan Şehirler")
 
-if len(investment_df_original) > 0:
-    sifir_satis = investment_df_original[investment_df_original['PF Kutu'] == 0].copy()
-    
-    if len(sifir_satis) > 0:
-        st.error(f"🚨 **{len(sifir_satis)} şehirde hiç satış YOK!**")
-        
-        col_sif1, col_sif2 = st.columns([1, 2])
-        
-        with col_sif1:
-            st.markdown("##### 📋 Liste")
-            for _, row in sifir_satis.iterrows():
-                pazar = row['Toplam Kutu']
-                if pazar > 0:
-                    st.warning(f"🔴 **{row['Şehir']}** - Pazar: {pazar:,.0f}")
-                else:
-                    st.info(f"⚪ **{row['Şehir']}** - Pazar verisi yok")
-        
-        with col_sif2:
-            st.markdown("##### 🗺️ Coğrafi Dağılım")
-            sifir_bolge = sifir_satis.groupby('Bölge').size().reset_index()
-            sifir_bolge.columns = ['Bölge', 'Sıfır Satış Şehir Sayısı']
-            
-            fig_sifir = px.bar(
-                sifir_bolge,
-                x='Bölge',
-                y='Sıfır Satış Şehir Sayısı',
-                color='Sıfır Satış Şehir Sayısı',
-                color_continuous_scale='Reds',
-                text='Sıfır Satış Şehir Sayısı'
+sifir_satis = white_space
+
+if len(sifir_satis) > 0:
+    st.error(f"🚨 **{len(sifir_satis)} şehirde hiç satış YOK!**")
+    
+    col_sif1, col_sif2 = st.columns([1, 2])
+    
+    with col_sif1:
+        st.markdown("##### 📋 Liste")
+        for _, row in sifir_satis.iterrows():
+            pazar = row['Toplam Kutu']
+            if pazar > 0:
+                st.warning(f"🔴 **{row['Şehir']}** - Pazar: {pazar:,.0f}")
+            else:
+                st.info(f"⚪ **{row['Şehir']}** - Pazar verisi yok")
+    
+    with col_sif2:
+        st.markdown("##### 🗺️ Coğrafi Dağılım")
+        sifir_bolge = sifir_satis.groupby('Bölge').size().reset_index()
+        sifir_bolge.columns = ['Bölge', 'Sıfır Satış Şehir Sayısı']
+        
+        fig_sifir = px.bar(
+            sifir_bolge,
+            x='Bölge',
+            y='Sıfır Satış Şehir Sayısı',
+            color='Sıfır Satış Şehir Sayısı',
+            color_continuous_scale='Reds',
+            text='Sıfır Satış Şehir Sayısı'
+        )
+        fig_sifir.update_traces(textposition='outside')
+        fig_sifir.update_layout(
+            height=350,
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            xaxis=dict(tickangle=-45)
+        )
+        show_chart(fig_sifir)
+else:
+    st.success("✅ Harika! Her şehirde satış var!")
+
+# ============================================================================
+# YENİ ÖZELLİK: ZİYARET ROTALARI
+# ============================================================================
+if visit_routes:
+    perf.section("Ziyaret Rotaları", rows=len(filtered_data))
+    # Aksiyon planının şehir kuralları ile aynı kaynaklar: fırsat eşikleri + pazarı olan sıfır satışlı iller
+    rota_iller = pd.concat([
+        firsatlar_df[['Ticaret Müdürü', 'Şehir']] if len(investment_df_original) > 0 else None,
+        sifir_satis.loc[sifir_satis['Toplam Kutu'] > 0, ['Ticaret Müdürü', 'Şehir']],
+    ]).astype(object).drop_duplicates()
+    rota_duraklar, rota_ozet, rota_sure = plan_routes(
+        data_key, tuple(map(tuple, rota_iller.to_numpy().tolist())), merged, geo
+    )
+    with map_slot:
+        show_chart(route_overlay(fig, rota_duraklar) if len(rota_duraklar) > 0 else fig)
+
+    st.markdown("---")
+    st.markdown("### 🚗 Ziyaret Rotaları")
+    st.caption(
+        "Büyük Fırsatlar ve pazarı olan sıfır satışlı iller, müdürün en çok sattığı merkez ilden başlayan "
+        "kapalı turla (en yakın komşu + 2-opt, il merkezleri arası kuş uçuşu mesafe) sıralanır. "
+        f"{len(rota_ozet)} müdür, {int(rota_ozet['Durak'].sum())} durak - {rota_sure * 1000:,.0f} ms"
+    )
+    if len(rota_ozet) > 0:
+        rcol1, rcol2 = st.columns([1, 2])
+        with rcol1:
+            show_table(
+                rota_ozet.sort_values('Tur km', ascending=False, kind='stable'),
+                formats={'Durak': '%d', 'Tur km': 'adet'},
+                labels={'Ticaret Müdürü': 'Müdür'},
+                hide_index=True
             )
-            fig_sifir.update_traces(textposition='outside')
-            fig_sifir.update_layout(
-                height=350,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                xaxis=dict(tickangle=-45)
+        with rcol2:
+            show_table(
+                rota_duraklar[['Ticaret Müdürü', 'Sıra', 'Şehir', 'Mesafe km']],
+                formats={'Sıra': '%d', 'Mesafe km': 'adet'},
+                labels={'Ticaret Müdürü': 'Müdür'},
+                hide_index=True
             )
-            st.plotly_chart(fig_sifir, use_container_width=True)
     else:
-        st.success("✅ Harika! Her şehirde satış var!")
+        st.info("Filtrede ziyaret edilecek işaretli il yok.")
+
+# ============================================================================
+# YENİ ÖZELLİK: KOMŞULUK FIRSATLARI
+# ============================================================================
+perf.section("Komşuluk", rows=len(filtered_data))
+st.markdown("---")
+st.markdown("### 🧭 Komşuluk Fırsatları")
+st.caption(
+    "Komşu illerin ortalama pazar payı ile karşılaştırma. 🎯 Yayılım Fırsatı: il zayıf, komşuları güçlü - "
+    "Yayılım Potansiyeli, ilin payı komşu seviyesine çıkarsa kazanılacak kutu."
+)
+
+kume_counts = filtered_data["Komşuluk Kümesi"].value_counts()
+kume_cols = st.columns(len(NEIGHBOUR_CLUSTERS))
+for col, label in zip(kume_cols, NEIGHBOUR_CLUSTERS.values()):
+    with col:
+        st.metric(label, f"{kume_counts.get(label, 0)} şehir")
+
+yayilim_df = (
+    filtered_data[filtered_data["Yayılım Potansiyeli"] > 0]
+    .sort_values("Yayılım Potansiyeli", ascending=False, kind="stable")
+    .head(15)
+)
+if len(yayilim_df) > 0:
+    show_table(
+        yayilim_df[["Şehir", "Bölge", "Ticaret Müdürü", "Pazar Payı %", "Komşu Pazar Payı %",
+                    "Komşuluk Kümesi", "Yayılım Potansiyeli", "Toplam Kutu"]],
+        formats={"Pazar Payı %": "yuzde", "Komşu Pazar Payı %": "yuzde",
+                 "Yayılım Potansiyeli": "adet", "Toplam Kutu": "adet"},
+        labels={"Toplam Kutu": "Toplam Pazar"},
+        hide_index=True
+    )
+else:
+    st.info("Filtrede komşularının gerisinde kalan il yok.")
 
 # ============================================================================
 # YENİ ÖZELLİK 4: KONSANTRASYON RİSKİ ANALİZİ
 # ============================================================================
+perf.section("Konsantrasyon (Pareto)", rows=len(investment_df_original), memory=True)
 st.markdown("---")
 st.markdown("### 📊 Konsantrasyon Risk Analizi")
 st.caption("💡 Pareto prensibi: Satışların ne kadarı az sayıda şehirden geliyor?")
@@ -1879,21 +4610,22 @@ st.caption("💡 Pareto prensibi: Satışların ne kadarı az sayıda şehirden
 if len(investment_df_original) > 0:
     total_pf = investment_df_original['PF Kutu'].sum()
     
-    # Kümülatif hesaplama
-    sorted_df = investment_df_original.sort_values('PF Kutu', ascending=False).copy()
-    sorted_df['Kümülatif PF'] = sorted_df['PF Kutu'].cumsum()
+    # Kümülatif hesaplama - sıralama indeksinin prefix-sum dizisi
+    sorted_df = ranking.sorted_frame('PF Kutu')
+    sorted_df['Kümülatif PF'] = ranking.cumulative('PF Kutu')
     sorted_df['Kümülatif %'] = (sorted_df['Kümülatif PF'] / total_pf * 100).round(1)
     sorted_df['Şehir Sırası'] = range(1, len(sorted_df) + 1)
     
-    # 80/20 kuralı - %80 satış kaç şehirden?
-    sehir_80 = sorted_df[sorted_df['Kümülatif %'] <= 80]['Şehir Sırası'].max()
+    # Seçili filtre tek segment olarak; organizasyon tablosu ile aynı metrikler
+    secim_kon = concentration_stats(investment_df_original['PF Kutu'], np.zeros(len(investment_df_original)), 1).iloc[0]
+    sehir_80 = int(secim_kon['%80 Şehir'])
     
-    col_kon1, col_kon2, col_kon3 = st.columns(3)
+    col_kon1, col_kon2, col_kon3, col_kon4 = st.columns(4)
     
     with col_kon1:
         st.metric(
             "🎯 Top 10 Şehir",
-            f"%{sorted_df.head(10)['Kümülatif %'].iloc[-1]:.1f}",
+            f"%{secim_kon['Top 10 %']:.1f}",
             delta="Toplam satıştan"
         )
     
@@ -1905,10 +4637,12 @@ if len(investment_df_original) > 0:
         )
     
     with col_kon3:
-        risk_seviye = "🟢 Düşük" if sehir_80 > 20 else "🟡 Orta" if sehir_80 > 10 else "🔴 Yüksek"
+        st.metric("📐 HHI / Gini", f"{secim_kon['HHI']:,.0f} / {secim_kon['Gini']:.2f}")
+    
+    with col_kon4:
         st.metric(
             "⚠️ Risk Seviyesi",
-            risk_seviye
+            secim_kon['Risk Seviyesi']
         )
     
     # Pareto grafiği
@@ -1981,7 +4715,7 @@ if len(investment_df_original) > 0:
         )
     )
     
-    st.plotly_chart(fig_pareto, use_container_width=True)
+    show_chart(fig_pareto)
     
     # Yorum
     if sehir_80 <= 10:
@@ -1998,9 +4732,21 @@ if len(investment_df_original) > 0:
         Satışlar {sehir_80} şehre yayılmış durumda. Risk dengeli.
         """)
 
+# Organizasyon geneli karşılaştırma - filtreden bağımsız, tüm müdür ve bölgeler
+st.markdown("#### 🏢 Organizasyon Geneli Konsantrasyon")
+st.caption("HHI: 0-10.000 (>2.500 yüksek, 1.500-2.500 orta). %80/%90/%95: satışın bu kısmına ulaşmak için gereken şehir sayısı")
+kon_tablo = organization_concentration(data_key, merged)
+show_table(
+    kon_tablo,
+    formats={'PF Kutu': 'adet', 'HHI': 'adet', 'Gini': '%.2f',
+             **{f'Top {k} %': 'yuzde' for k in CONCENTRATION_TOP_K}},
+    hide_index=True
+)
+
 # ============================================================================
 # YENİ ÖZELLİK 5: AKSİYON PLANI OLUŞTURUCU
 # ============================================================================
+perf.section("Aksiyon Planı", rows=len(investment_df_original), memory=True)
 st.markdown("---")
 st.markdown("### 📋 Otomatik Aksiyon Planı")
 st.caption("🤖 AI destekli öneriler - Veriye dayalı aksiyonlar")
@@ -2009,68 +4755,17 @@ if len(investment_df_original) > 0:
     
     st.markdown("#### 🎯 Öncelikli 10 Aksiyon")
     
-    aksiyonlar = []
-    
-    # 1. En büyük fırsatlar
-    top_firsatlar = investment_df_original[
-        (investment_df_original['Pazar Payı %'] < 5) & 
-        (investment_df_original['Toplam Kutu'] > investment_df_original['Toplam Kutu'].median())
-    ].nlargest(3, 'Toplam Kutu')
-    
-    for idx, row in top_firsatlar.iterrows():
-        aksiyonlar.append({
-            'Öncelik': '🔴 Kritik',
-            'Aksiyon': f"{row['Şehir']}'de agresif yatırım",
-            'Neden': f"Pazar büyük ({row['Toplam Kutu']:,.0f}) ama payımız %{row['Pazar Payı %']:.1f}",
-            'Sorumlu': row['Ticaret Müdürü'],
-            'Potansiyel': f"+{(row['Toplam Kutu'] - row['PF Kutu']):,.0f} kutu"
-        })
-    
-    # 2. Sıfır satış olanlar
-    sifir_satis_top = investment_df_original[
-        investment_df_original['PF Kutu'] == 0
-    ].nlargest(2, 'Toplam Kutu')
-    
-    for idx, row in sifir_satis_top.iterrows():
-        aksiyonlar.append({
-            'Öncelik': '🟠 Yüksek',
-            'Aksiyon': f"{row['Şehir']}'ye giriş yap",
-            'Neden': f"Hiç satış yok ama pazar var ({row['Toplam Kutu']:,.0f})",
-            'Sorumlu': row['Ticaret Müdürü'],
-            'Potansiyel': f"+{row['Toplam Kutu']:,.0f} kutu"
-        })
-    
-    # 3. Düşük performanslı müdürler
-    mudur_perf = investment_df_original.groupby('Ticaret Müdürü').agg({
-        'PF Kutu': 'sum',
-        'Toplam Kutu': 'sum'
-    })
-    mudur_perf['Pay %'] = mudur_perf['PF Kutu'] / mudur_perf['Toplam Kutu'] * 100
-    dusuk_mudur = mudur_perf[mudur_perf['Pay %'] < 5].sort_values('Pay %').head(2)
-    
-    for mudur, row in dusuk_mudur.iterrows():
-        aksiyonlar.append({
-            'Öncelik': '🟡 Orta',
-            'Aksiyon': f"{mudur} ile performans görüşmesi",
-            'Neden': f"Genel pazar payı %{row['Pay %']:.1f} - ortalamanın altında",
-            'Sorumlu': 'Bölge Müdürü',
-            'Potansiyel': 'Ekip motivasyonu artışı'
-        })
-    
-    # DataFrame'e çevir ve göster
-    aksiyon_df = pd.DataFrame(aksiyonlar)
+    # Tüm kapsamların planı veri + fırsat eşikleri başına bir kez üretilir; burada sadece seçilir
+    aksiyon_plani = build_action_plan(data_key, firsat_degisen, merged, coverage)
+    aksiyon_df = aksiyon_plani[
+        (aksiyon_plani['Kapsam Müdür'] == selected_manager) &
+        (aksiyon_plani['Kapsam Bölge'] == selected_bolge)
+    ][['Öncelik', 'Aksiyon', 'Neden', 'Sorumlu', 'Potansiyel']]
     
     # Renkli gösterim - OKUNUR RENKLER
-    for idx, aksiyon in enumerate(aksiyonlar, 1):
-        if aksiyon['Öncelik'] == '🔴 Kritik':
-            bg_color = "#DC2626"  # Koyu kırmızı
-            text_color = "white"
-        elif aksiyon['Öncelik'] == '🟠 Yüksek':
-            bg_color = "#EA580C"  # Koyu turuncu
-            text_color = "white"
-        else:
-            bg_color = "#0891B2"  # Koyu cyan
-            text_color = "white"
+    for idx, aksiyon in enumerate(aksiyon_df.itertuples(index=False), 1):
+        bg_color = ACTION_PRIORITY_COLORS.get(aksiyon.Öncelik, "#0891B2")
+        text_color = "white"
         
         st.markdown(f"""
         <div style="
@@ -2081,11 +4776,11 @@ if len(investment_df_original) > 0:
             color: {text_color};
             box-shadow: 0 4px 8px rgba(0,0,0,0.15);
         ">
-            <h4 style="margin: 0 0 15px 0; font-size: 1.3rem; font-weight: bold;">{idx}. {aksiyon['Aksiyon']}</h4>
-            <p style="margin: 8px 0; font-size: 1rem;"><b>Öncelik:</b> {aksiyon['Öncelik']}</p>
-            <p style="margin: 8px 0; font-size: 1rem;"><b>Neden:</b> {aksiyon['Neden']}</p>
-            <p style="margin: 8px 0; font-size: 1rem;"><b>Sorumlu:</b> {aksiyon['Sorumlu']}</p>
-            <p style="margin: 8px 0; font-size: 1rem;"><b>Potansiyel Kazanç:</b> {aksiyon['Potansiyel']}</p>
+            <h4 style="margin: 0 0 15px 0; font-size: 1.3rem; font-weight: bold;">{idx}. {aksiyon.Aksiyon}</h4>
+            <p style="margin: 8px 0; font-size: 1rem;"><b>Öncelik:</b> {aksiyon.Öncelik}</p>
+            <p style="margin: 8px 0; font-size: 1rem;"><b>Neden:</b> {aksiyon.Neden}</p>
+            <p style="margin: 8px 0; font-size: 1rem;"><b>Sorumlu:</b> {aksiyon.Sorumlu}</p>
+            <p style="margin: 8px 0; font-size: 1rem;"><b>Potansiyel Kazanç:</b> {aksiyon.Potansiyel}</p>
         </div>
         """, unsafe_allow_html=True)
     
@@ -2096,6 +4791,7 @@ if len(investment_df_original) > 0:
     output_aksiyon = BytesIO()
     with pd.ExcelWriter(output_aksiyon, engine='openpyxl') as writer:
         aksiyon_df.to_excel(writer, sheet_name='Aksiyon Planı', index=False)
+        aksiyon_plani.to_excel(writer, sheet_name='Tüm Kapsamlar', index=False)
     
     st.download_button(
         label="📥 Aksiyon Planını İndir (Excel)",
@@ -2112,14 +4808,14 @@ st.subheader("📥 Raporları İndir")
 col_exp1, col_exp2 = st.columns(2)
 
 with col_exp1:
+    perf.section("Excel Export", rows=len(investment_df_original), memory=True)
     if len(investment_df_original) > 0:
         # Yatırım Stratejisi Raporu Excel Export
-        export_df = investment_df_original[[
+        export_df = ranking.sorted_frame("PF Kutu")[[
             "Şehir", "Bölge", "PF Kutu", "Toplam Kutu", "Pazar Payı %",
             "Yatırım Stratejisi", "Pazar Büyüklüğü", "Performans",
             "Büyüme Potansiyeli", "Ticaret Müdürü"
-        ]].copy()
-        export_df = export_df.sort_values("PF Kutu", ascending=False)
+        ]]
         
         # Excel'e çevir
         from io import BytesIO
@@ -2136,6 +4832,7 @@ with col_exp1:
         )
 
 with col_exp2:
+    perf.section("PDF Export", rows=len(investment_df_original), memory=True)
     if len(investment_df_original) > 0:
         st.markdown("##### 📄 PDF Özet Raporu")
         st.caption("BCG Matrix ve temel metrikleri içeren özet rapor")
@@ -2143,158 +4840,203 @@ with col_exp2:
         from io import BytesIO
         from datetime import datetime
         
-        try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib import colors
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-            from reportlab.lib.units import cm
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            
-            # PDF için veri hazırla
-            top10_summary = investment_df_original.nlargest(10, 'PF Kutu')[['Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı %']]
-            bolge_summary = investment_df_original.groupby('Bölge').agg({
-                'PF Kutu': 'sum',
-                'Pazar Payı %': 'mean'
-            }).sort_values('PF Kutu', ascending=False).head(5).reset_index()
-            strateji_summary = investment_df_original.groupby('Yatırım Stratejisi').agg({
-                'Şehir': 'count',
-                'PF Kutu': 'sum'
-            }).reset_index()
+        if importlib.util.find_spec("reportlab") is not None:
+            def pdf_raporu():
+                """PDF rapor - indirme tıklandığında oluşturulur; reportlab sadece burada yüklenir"""
+                from reportlab.lib.pagesizes import A4
+                from reportlab.lib import colors
+                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+                from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
+                from reportlab.lib.units import cm
+                from reportlab.pdfbase import pdfmetrics
+                from reportlab.pdfbase.ttfonts import TTFont
             
-            # PDF oluştur
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-            elements = []
-            styles = getSampleStyleSheet()
-            
-            # Başlık
-            title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=20, textColor=colors.HexColor('#1E40AF'), spaceAfter=30, alignment=1)
-            elements.append(Paragraph("TÜRKİYE SATIŞ ANALİZİ - ÖZET RAPOR", title_style))
-            elements.append(Paragraph(f"Tarih: {datetime.now().strftime('%d.%m.%Y %H:%M')}", styles['Normal']))
-            elements.append(Spacer(1, 0.5*cm))
+                # PDF için veri hazırla
+                top10_summary = ranking.top('PF Kutu', 10)[['Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı %']]
+                bolge_summary = (
+                    rollup.level('Bölge')
+                    .rename(columns={'Ort. Pazar Payı %': 'Pazar Payı %'})
+                    .sort_values('PF Kutu', ascending=False).head(5).reset_index(drop=True)
+                )
+                strateji_summary = rollup.level('Yatırım Stratejisi').rename(columns={'Şehir Sayısı': 'Şehir'})
+
+                # Sunucu tarafı grafikler (matplotlib Agg, süreç havuzunda) - zemin harita önbellekte, sadece veri katmanı çizilir
+                rapor_bcg = get_bcg_index(data_key, merged)
+                rapor_pareto = ranking.sorted_frame('PF Kutu').head(30)
+                rapor_grafikleri = render_report_charts(filter_key, {
+                    'harita': (report_charts.render_map_png, (
+                        filtered_data['CITY_KEY'].astype(object).to_numpy(),
+                        filtered_data['Şehir'].astype(object).to_numpy(),
+                        filtered_data['Bölge'].astype(object).to_numpy(),
+                        filtered_data['PF Kutu'].to_numpy(dtype='float64'),
+                        REGION_COLORS,
+                    )),
+                    'bcg': (report_charts.render_bcg_png, (
+                        investment_df_original['Toplam Kutu'].to_numpy(dtype='float64'),
+                        investment_df_original['Pazar Payı %'].to_numpy(dtype='float64'),
+                        investment_df_original['PF Kutu'].to_numpy(dtype='float64'),
+                        rapor_bcg.classify(investment_df_original, selected_manager, selected_bolge),
+                        *rapor_bcg.median(selected_manager, selected_bolge),
+                        BCG_QUADRANTS,
+                    )),
+                    'pareto': (report_charts.render_pareto_png, (
+                        rapor_pareto['Şehir'].astype(object).tolist(),
+                        rapor_pareto['PF Kutu'].to_numpy(dtype='float64'),
+                        ranking.cumulative('PF Kutu')[:30] / filtered_pf_toplam * 100 if filtered_pf_toplam > 0 else np.zeros(len(rapor_pareto)),
+                    )),
+                }, get_map_base_layer(geo))
+
+                def rapor_gorseli(png, width):
+                    """PNG'yi en-boy oranını koruyarak PDF genişliğine sığdır"""
+                    image = Image(BytesIO(png))
+                    image.drawHeight = width * image.imageHeight / image.imageWidth
+                    image.drawWidth = width
+                    return image
+
+                # PDF oluştur
+                buffer = BytesIO()
+                doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+                elements = []
+                styles = getSampleStyleSheet()
             
-            # Genel Özet
-            elements.append(Paragraph("GENEL ÖZET", styles['Heading2']))
-            genel_data = [
-                ['Metrik', 'Değer'],
-                ['Toplam PF Kutu', f'{filtered_pf_toplam:,.0f}'],
-                ['Toplam Pazar', f'{filtered_toplam_pazar:,.0f}'],
-                ['Genel Pazar Payı', f'%{genel_pazar_payi:.1f}'],
-                ['Aktif Şehir Sayısı', f'{filtered_aktif_sehir}']
-            ]
-            genel_table = Table(genel_data, colWidths=[8*cm, 8*cm])
-            genel_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(genel_table)
-            elements.append(Spacer(1, 1*cm))
+                # Başlık
+                title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=20, textColor=colors.HexColor('#1E40AF'), spaceAfter=30, alignment=1)
+                elements.append(Paragraph("TÜRKİYE SATIŞ ANALİZİ - ÖZET RAPOR", title_style))
+                elements.append(Paragraph(f"Tarih: {datetime.now().strftime('%d.%m.%Y %H:%M')}", styles['Normal']))
+                elements.append(Spacer(1, 0.5*cm))
             
-            # Yatırım Stratejisi Dağılımı
-            elements.append(Paragraph("YATIRIM STRATEJİSİ DAĞILIMI", styles['Heading2']))
-            strateji_data = [['Strateji', 'Şehir Sayısı', 'PF Kutu']]
-            for idx, row in strateji_summary.iterrows():
-                strateji_data.append([
-                    row['Yatırım Stratejisi'],
-                    f"{int(row['Şehir'])}",
-                    f"{row['PF Kutu']:,.0f}"
-                ])
-            strateji_table = Table(strateji_data, colWidths=[8*cm, 4*cm, 4*cm])
-            strateji_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(strateji_table)
-            elements.append(Spacer(1, 1*cm))
+                # Genel Özet
+                elements.append(Paragraph("GENEL ÖZET", styles['Heading2']))
+                genel_data = [
+                    ['Metrik', 'Değer'],
+                    ['Toplam PF Kutu', f'{filtered_pf_toplam:,.0f}'],
+                    ['Toplam Pazar', f'{filtered_toplam_pazar:,.0f}'],
+                    ['Genel Pazar Payı', f'%{genel_pazar_payi:.1f}'],
+                    ['Aktif Şehir Sayısı', f'{filtered_aktif_sehir}']
+                ]
+                genel_table = Table(genel_data, colWidths=[8*cm, 8*cm])
+                genel_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 12),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]))
+                elements.append(genel_table)
+                elements.append(Spacer(1, 1*cm))
+
+                # Harita
+                elements.append(Paragraph("BÖLGE & İL HARİTASI", styles['Heading2']))
+                elements.append(rapor_gorseli(rapor_grafikleri['harita'], 17*cm))
+                elements.append(Spacer(1, 1*cm))
             
-            # Top 5 Bölge
-            elements.append(Paragraph("TOP 5 BÖLGE", styles['Heading2']))
-            bolge_data = [['#', 'Bölge', 'PF Kutu', 'Ort. Pazar Payı']]
-            for idx, row in bolge_summary.iterrows():
-                bolge_data.append([
-                    f"{idx+1}",
-                    row['Bölge'],
-                    f"{row['PF Kutu']:,.0f}",
-                    f"%{row['Pazar Payı %']:.1f}"
-                ])
-            bolge_table = Table(bolge_data, colWidths=[1.5*cm, 6*cm, 4.5*cm, 4*cm])
-            bolge_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(bolge_table)
-            elements.append(Spacer(1, 1*cm))
+                # Yatırım Stratejisi Dağılımı
+                elements.append(Paragraph("YATIRIM STRATEJİSİ DAĞILIMI", styles['Heading2']))
+                strateji_data = [['Strateji', 'Şehir Sayısı', 'PF Kutu']]
+                for idx, row in strateji_summary.iterrows():
+                    strateji_data.append([
+                        row['Yatırım Stratejisi'],
+                        f"{int(row['Şehir'])}",
+                        f"{row['PF Kutu']:,.0f}"
+                    ])
+                strateji_table = Table(strateji_data, colWidths=[8*cm, 4*cm, 4*cm])
+                strateji_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 11),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]))
+                elements.append(strateji_table)
+                elements.append(Spacer(1, 1*cm))
             
-            # Top 10 Şehir
-            elements.append(Paragraph("TOP 10 ŞEHİR", styles['Heading2']))
-            sehir_data = [['#', 'Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı']]
-            for idx, row in top10_summary.iterrows():
-                sehir_data.append([
-                    f"{idx+1}",
-                    row['Şehir'],
-                    row['Bölge'],
-                    f"{row['PF Kutu']:,.0f}",
-                    f"%{row['Pazar Payı %']:.1f}"
-                ])
-            sehir_table = Table(sehir_data, colWidths=[1*cm, 4*cm, 4*cm, 4*cm, 3*cm])
-            sehir_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F59E0B')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(sehir_table)
+                # Top 5 Bölge
+                elements.append(Paragraph("TOP 5 BÖLGE", styles['Heading2']))
+                bolge_data = [['#', 'Bölge', 'PF Kutu', 'Ort. Pazar Payı']]
+                for idx, row in bolge_summary.iterrows():
+                    bolge_data.append([
+                        f"{idx+1}",
+                        row['Bölge'],
+                        f"{row['PF Kutu']:,.0f}",
+                        f"%{row['Pazar Payı %']:.1f}"
+                    ])
+                bolge_table = Table(bolge_data, colWidths=[1.5*cm, 6*cm, 4.5*cm, 4*cm])
+                bolge_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 11),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]))
+                elements.append(bolge_table)
+                elements.append(Spacer(1, 1*cm))
             
-            # PDF'i oluştur
-            doc.build(elements)
-            pdf_bytes = buffer.getvalue()
-            buffer.close()
+                # Top 10 Şehir
+                elements.append(Paragraph("TOP 10 ŞEHİR", styles['Heading2']))
+                sehir_data = [['#', 'Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı']]
+                for idx, row in top10_summary.iterrows():
+                    sehir_data.append([
+                        f"{idx+1}",
+                        row['Şehir'],
+                        row['Bölge'],
+                        f"{row['PF Kutu']:,.0f}",
+                        f"%{row['Pazar Payı %']:.1f}"
+                    ])
+                sehir_table = Table(sehir_data, colWidths=[1*cm, 4*cm, 4*cm, 4*cm, 3*cm])
+                sehir_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F59E0B')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 10),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]))
+                elements.append(sehir_table)
+
+                # BCG ve Pareto
+                elements.append(PageBreak())
+                elements.append(Paragraph("BCG MATRIX", styles['Heading2']))
+                elements.append(rapor_gorseli(rapor_grafikleri['bcg'], 16*cm))
+                elements.append(Spacer(1, 1*cm))
+                elements.append(Paragraph("KONSANTRASYON (PARETO)", styles['Heading2']))
+                elements.append(rapor_gorseli(rapor_grafikleri['pareto'], 17*cm))
+
+                # PDF'i oluştur
+                doc.build(elements)
+                pdf_bytes = buffer.getvalue()
+                buffer.close()
+                return pdf_bytes
             
             st.download_button(
                 label="📄 PDF Rapor İndir",
-                data=pdf_bytes,
+                data=pdf_raporu,
                 file_name=f"turkiye_satis_raporu_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
                 mime="application/pdf",
                 help="Detaylı PDF raporu - tablolar ve grafiklerle"
             )
             
-        except ImportError:
+        else:
             # reportlab yoksa basit text raporu sun
             st.warning("⚠️ PDF özelliği için reportlab kütüphanesi gerekli. Text raporu indirilebilir:")
             
-            top10_summary = investment_df_original.nlargest(10, 'PF Kutu')[['Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı %']]
-            bolge_summary = investment_df_original.groupby('Bölge').agg({
-                'PF Kutu': 'sum',
-                'Pazar Payı %': 'mean'
-            }).sort_values('PF Kutu', ascending=False).head(5).reset_index()
-            strateji_summary = investment_df_original.groupby('Yatırım Stratejisi').agg({
-                'Şehir': 'count',
-                'PF Kutu': 'sum'
-            }).reset_index()
+            top10_summary = ranking.top('PF Kutu', 10)[['Şehir', 'Bölge', 'PF Kutu', 'Pazar Payı %']]
+            bolge_summary = (
+                rollup.level('Bölge')
+                .rename(columns={'Ort. Pazar Payı %': 'Pazar Payı %'})
+                .sort_values('PF Kutu', ascending=False).head(5).reset_index(drop=True)
+            )
+            strateji_summary = rollup.level('Yatırım Stratejisi').rename(columns={'Şehir Sayısı': 'Şehir'})
             
             pdf_content = f"""
 ╔══════════════════════════════════════════════════════════════╗
@@ -2345,17 +5087,32 @@ Bu rapor Türkiye Satış Haritası uygulaması tarafından oluşturulmuştur.
                 help="Genel özet ve top performansları içeren rapor"
             )
 
+# =============================================================================
+# GELİŞTİRİCİ - PERFORMANS PANELİ
+# =============================================================================
+perf.finish()
+startup.setdefault("İlk render", time.perf_counter() - _SCRIPT_STARTED)
 
+st.sidebar.markdown("---")
+st.sidebar.header("🛠️ Geliştirici")
+st.sidebar.checkbox(
+    "⏱️ Performans Paneli",
+    key="perf_panel",
+    help="Her rerun için bölüm/fonksiyon süreleri, CPU, satır sayısı ve grafik payload boyutu"
+)
 
+st.sidebar.checkbox(
+    "🧠 Bellek Ölçümü (tracemalloc)",
+    key="memory_panel",
+    help="Yükleme, hazırlık, filtre, strateji, grafik ve export aşamalarında bellek snapshot'ı alır. "
+         "Ölçüm süresince uygulama belirgin şekilde yavaşlar."
+)
 
+st.sidebar.caption(
+    "⏱️ Soğuk başlangıç: " + " · ".join(f"{name} {seconds * 1000:,.0f} ms" for name, seconds in startup.items())
+)
 
-
-
-
-
-
-
-
-
-
-
+if perf.enabled:
+    render_perf_panel(perf)
+if perf.track_memory:
+    render_memory_panel(perf)
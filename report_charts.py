@@ -0,0 +1,161 @@
+"""
+PDF raporu için sunucu tarafı grafikler (matplotlib Agg, pyplot yok)
+
+app.py bir Streamlit betiği olduğu için import edilemez; rapor süreç
+havuzunun işçileri çizim fonksiyonlarını bu modülden bulur. Her işçinin kendi
+matplotlib durumu (font önbelleği, rcParams) vardır, kilit gerekmez.
+"""
+import numpy as np
+
+REPORT_DPI = 150
+REPORT_MAP_WIDTH = 10          # inç; yükseklik Türkiye'nin en-boy oranından gelir
+REPORT_MAP_LABELS = 12         # Haritada etiketlenecek en büyük il sayısı
+
+
+def _polygon_rings(geom):
+    """Polygon / MultiPolygon dış halkaları (N x 2 dizileri)"""
+    parts = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+    return [np.asarray(part.exterior.coords) for part in parts]
+
+
+class MapBaseLayer:
+    """
+    turkey.geojson için önceden çizilmiş harita zemini
+
+    Tüm iller bir kez gri dolgu + beyaz sınırla Agg tuvaline çizilir ve RGBA
+    dizisi olarak saklanır. Rapor haritası bu raster'ı imshow ile koyar ve
+    üstüne sadece filtredeki illerin veri katmanını çizer.
+    """
+
+    def __init__(self, gdf):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import PolyCollection
+
+        self.rings = [_polygon_rings(geom) for geom in gdf.geometry]
+        self.row_of = {key: i for i, key in enumerate(gdf["CITY_KEY"])}
+        centroids = gdf.geometry.representative_point()
+        self.centroids = np.column_stack([centroids.x, centroids.y])
+
+        minx, miny, maxx, maxy = gdf.total_bounds
+        pad = 0.2
+        self.extent = (minx - pad, maxx + pad, miny - pad, maxy + pad)
+        # Enlem düzeltmesi ile en-boy oranı (≈ 39° enlemde 1 / cos)
+        ratio = (self.extent[3] - self.extent[2]) / ((self.extent[1] - self.extent[0]) * np.cos(np.radians(39)))
+        self.figsize = (REPORT_MAP_WIDTH, REPORT_MAP_WIDTH * ratio)
+
+        fig = Figure(figsize=self.figsize, dpi=REPORT_DPI)
+        canvas = FigureCanvasAgg(fig)
+        ax = self.axes(fig)
+        ax.add_collection(PolyCollection(
+            [ring for rings in self.rings for ring in rings],
+            facecolors="#E2E8F0", edgecolors="white", linewidths=0.6
+        ))
+        canvas.draw()
+        self.raster = np.asarray(canvas.buffer_rgba()).copy()
+
+    def axes(self, fig):
+        """Zemin ile aynı konum ve sınırlara sahip eksen"""
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_xlim(self.extent[0], self.extent[1])
+        ax.set_ylim(self.extent[2], self.extent[3])
+        ax.set_axis_off()
+        return ax
+
+
+# İşçi başına harita zemini - havuz initializer'ı ile bir kez verilir
+_base_layer = None
+
+
+def init_worker(base):
+    """Havuz işçisi başlangıcı: MapBaseLayer her işte tekrar gönderilmez"""
+    global _base_layer
+    _base_layer = base
+
+
+def _figure_png(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from io import BytesIO
+
+    FigureCanvasAgg(fig)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=REPORT_DPI)
+    return buffer.getvalue()
+
+
+def _plain_label(label):
+    """Emoji önekini at - matplotlib fontlarında emoji yok"""
+    return label.split(" ", 1)[1] if " " in label else label
+
+
+def render_map_png(city_keys, names, regions, pf, region_colors):
+    """Zemin raster'ı + filtredeki illerin bölge renkli dolgusu ve en büyük illerin etiketleri"""
+    from matplotlib.figure import Figure
+    from matplotlib.collections import PolyCollection
+
+    base = _base_layer
+    fig = Figure(figsize=base.figsize, dpi=REPORT_DPI)
+    ax = base.axes(fig)
+    ax.imshow(base.raster, extent=base.extent, aspect="auto", zorder=0)
+
+    rows = np.array([base.row_of.get(key, -1) for key in city_keys], dtype=np.int64)
+    keep = (rows >= 0) & (pf > 0)
+    rows, names, regions, pf = rows[keep], names[keep], regions[keep], pf[keep]
+
+    verts, colors = [], []
+    for row, region in zip(rows, regions):
+        color = region_colors.get(region, "#CCCCCC")
+        verts += base.rings[row]
+        colors += [color] * len(base.rings[row])
+    ax.add_collection(PolyCollection(verts, facecolors=colors, edgecolors="white", linewidths=0.6, zorder=1))
+
+    total = pf.sum()
+    for i in np.argsort(-pf, kind="stable")[:REPORT_MAP_LABELS]:
+        x, y = base.centroids[rows[i]]
+        share = pf[i] / total * 100 if total > 0 else 0
+        ax.text(x, y, f"{names[i]}\n{pf[i]:,.0f} ({share:.1f}%)",
+                ha="center", va="center", fontsize=6, zorder=2)
+    return _figure_png(fig)
+
+
+def render_bcg_png(toplam, pay, pf, codes, pazar_median, pay_median, quadrants):
+    """BCG dağılımı: kadran renkleri, medyan çizgileri"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 5), dpi=REPORT_DPI)
+    ax = fig.add_subplot()
+    palette = ["#93C5FD", "#60A5FA", "#3B82F6", "#1E40AF"]
+    span = pf.max() - pf.min() if len(pf) else 0
+    sizes = 20 + (pf - pf.min()) / span * 180 if span > 0 else np.full(len(pf), 60.0)
+    for code, label in enumerate(quadrants):
+        mask = codes == code
+        if mask.any():
+            ax.scatter(toplam[mask], pay[mask], s=sizes[mask], c=palette[code],
+                       label=_plain_label(label), edgecolors="white", linewidths=0.8)
+    ax.axvline(pazar_median, color="#94A3B8", linestyle="--", linewidth=1)
+    ax.axhline(pay_median, color="#94A3B8", linestyle="--", linewidth=1)
+    ax.set_xlabel("Pazar Büyüklüğü (Toplam Kutu)")
+    ax.set_ylabel("Pazar Payı (%)")
+    ax.legend(fontsize=7, loc="upper right")
+    ax.grid(alpha=0.2)
+    fig.tight_layout()
+    return _figure_png(fig)
+
+
+def render_pareto_png(names, values, cumulative_pct):
+    """Pareto: PF Kutu barları + kümülatif % çizgisi ve %80 referansı"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 4.5), dpi=REPORT_DPI)
+    ax = fig.add_subplot()
+    x = np.arange(len(names))
+    ax.bar(x, values, color="#3B82F6")
+    ax.set_xticks(x, names, rotation=60, ha="right", fontsize=6)
+    ax.set_ylabel("PF Kutu")
+    ax2 = ax.twinx()
+    ax2.plot(x, cumulative_pct, color="#1E40AF", marker="o", markersize=3)
+    ax2.axhline(80, color="#EF4444", linestyle="--", linewidth=1)
+    ax2.set_ylim(0, 100)
+    ax2.set_ylabel("Kümülatif %")
+    fig.tight_layout()
+    return _figure_png(fig)
@@ -0,0 +1,52 @@
+"""
+app.py bir Streamlit betiği; import edilirse tüm sayfa çalışır. Testler
+gerekli fonksiyon / sabit tanımlarını AST'den çekip ayrı bir isim alanında
+çalıştırır.
+"""
+import ast
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+APP_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = APP_DIR / "app.py"
+
+# streamlit run gibi: betik klasöründeki modüller (report_charts) import edilebilir
+sys.path.insert(0, str(APP_DIR))
+
+
+def load_app_functions(names, **namespace):
+    """app.py'den sadece names içindeki fonksiyon, sınıf ve atamaları yükle"""
+    tree = ast.parse(APP_PATH.read_text(encoding="utf-8"))
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            defined = {node.name}
+        elif isinstance(node, ast.Assign):
+            defined = {t.id for t in node.targets if isinstance(t, ast.Name)}
+        else:
+            continue
+        if defined & names:
+            if isinstance(node, ast.FunctionDef):
+                # profiled / cache dekoratörleri Streamlit çalışma zamanı ister
+                node.decorator_list = []
+            nodes.append(node)
+    scope = {"pd": pd, "np": np, "st": st, **namespace}
+    exec(compile(ast.Module(nodes, type_ignores=[]), str(APP_PATH), "exec"), scope)
+    return scope
+
+
+@pytest.fixture(scope="session", autouse=True)
+def copy_on_write():
+    # app.py ile aynı: pandas 2.x'te açıkça, pandas 3+ için varsayılan
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+
+@pytest.fixture(scope="session")
+def load_app():
+    return load_app_functions
@@ -0,0 +1,101 @@
+"""
+Copy-on-write veri akışı için bellek tahsis testi
+
+prepare_data / calculate_investment_strategy girdiyi savunma amaçlı tam
+kopyalamamalı. Girdiye kullanılmayan geniş bir sayısal blok eklenir; tam bir
+kopya bu bloğun boyutu kadar ek tahsis demektir ve tepe tahsis sınırı aşılır.
+"""
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_NAMES = {
+    "normalize_city",
+    "prepare_data",
+    "calculate_investment_strategy",
+    "FIX_CITY_MAP",
+    "TOPLAM_COLUMN_CANDIDATES",
+    "NEIGHBOUR_CLUSTERS",
+}
+ROWS = 5000
+PAYLOAD_COLUMNS = 200
+CITY_COUNT = 81
+
+
+@pytest.fixture(scope="module")
+def app(load_app):
+    return load_app(APP_NAMES)
+
+
+def payload(frame, rng):
+    """Hesaplamada kullanılmayan geniş float64 bloğu ekle"""
+    extra = pd.DataFrame(
+        rng.random((len(frame), PAYLOAD_COLUMNS)),
+        columns=[f"Ek {i}" for i in range(PAYLOAD_COLUMNS)],
+        index=frame.index,
+    )
+    return pd.concat([frame, extra], axis=1)
+
+
+def sales_frame(rng):
+    keys = np.array([f"IL{i:02d}" for i in range(CITY_COUNT)], dtype=object)
+    return pd.DataFrame({
+        "Şehir": keys[rng.integers(0, CITY_COUNT, ROWS)],
+        "Bölge": rng.choice(["EGE", "MARMARA", "AKDENİZ"], ROWS).astype(object),
+        "Ticaret Müdürü": rng.choice(["A", "B", "C"], ROWS).astype(object),
+        "Kutu Adet": rng.integers(1, 1000, ROWS).astype(float),
+        "Toplam Adet": rng.integers(1000, 5000, ROWS).astype(float),
+    })
+
+
+def city_frame():
+    keys = [f"IL{i:02d}" for i in range(CITY_COUNT)]
+    return pd.DataFrame({
+        "name": keys,
+        "raw_name": keys,
+        "fixed_name": keys,
+        "CITY_KEY": keys,
+        "geometry": [None] * CITY_COUNT,
+    })
+
+
+def peak_allocation(func, *args):
+    """func çağrısının tepe tahsisi (bayt) ve sonucu"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def payload_bytes(frame):
+    return frame.filter(like="Ek ").memory_usage(index=False).sum()
+
+
+def test_prepare_data_copies_input_once(app):
+    rng = np.random.default_rng(0)
+    df = payload(sales_frame(rng), rng)
+    peak, (merged, _, _, _) = peak_allocation(app["prepare_data"], df, city_frame())
+
+    assert len(merged) == ROWS
+    # merge sonucu bloğu bir kez taşır; girdinin ayrıca kopyalanması ikinci kez
+    assert peak < 1.5 * payload_bytes(df)
+
+
+def test_investment_strategy_copies_input_once(app):
+    rng = np.random.default_rng(1)
+    merged = app["prepare_data"](sales_frame(rng), city_frame())[0]
+    merged = payload(merged, rng)
+    peak, invest = peak_allocation(app["calculate_investment_strategy"], merged)
+
+    assert "geometry" not in invest.columns
+    assert "Yatırım Stratejisi" in invest.columns
+    # tüm satırlar aktif: filtre ve yeni kolonlar bloğu kopyalamamalı; satır
+    # bazlı apply tüm tabloyu object dizisine çevirirse de sınır aşılır
+    assert peak < payload_bytes(merged)
@@ -0,0 +1,94 @@
+"""
+Dönem animasyonu matrisi ile ana harita aynı il atamasını kullanmalı
+
+Koordinatlı dosyalarda Şehir güvenilmez; dönem matrisi de ana harita gibi
+ili koordinattan almalı.
+"""
+import hashlib
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+APP_NAMES = {
+    "normalize_city",
+    "FIX_CITY_MAP",
+    "TOPLAM_COLUMN_CANDIDATES",
+    "load_excel",
+    "load_geo",
+    "prepare_data",
+    "frame_fingerprint",
+    "LAT_COLUMN_CANDIDATES",
+    "LON_COLUMN_CANDIDATES",
+    "point_columns",
+    "get_province_tree",
+    "locate_points",
+    "aggregate_points",
+    "MAP_COORD_DECIMALS",
+    "NEIGHBOUR_BUFFER",
+    "_segment_index",
+    "GeometryStore",
+    "_period_label",
+    "build_period_matrix",
+}
+
+
+@pytest.fixture(scope="module")
+def app(load_app):
+    return load_app(
+        APP_NAMES,
+        hashlib=hashlib,
+        gpd=gpd,
+        shapely=shapely,
+        read_geometry_artifact=lambda: gpd.read_file(APP_DIR / "turkey.geojson"),
+    )
+
+
+@pytest.fixture(scope="module")
+def geo(app):
+    return app["load_geo"]()
+
+
+def point_file(path, geo, rng):
+    """Her ilde birkaç eczane; satırların ~dörtte birinde Şehir başka bir il, birkaçında boş"""
+    points = shapely.point_on_surface(geo.geometry.values)
+    rows = np.repeat(np.arange(len(geo)), 3)
+    names = geo["name"].to_numpy(dtype=object)[rows]
+    wrong = rng.random(len(rows)) < 0.25
+    names[wrong] = geo["name"].to_numpy(dtype=object)[rng.integers(0, len(geo), wrong.sum())]
+    names[rng.random(len(rows)) < 0.05] = None
+    pd.DataFrame({
+        "Şehir": names,
+        "Bölge": "EGE",
+        "Ticaret Müdürü": "A",
+        "Kutu Adet": rng.integers(1, 500, len(rows)),
+        "Toplam Adet": rng.integers(500, 2000, len(rows)),
+        "Enlem": shapely.get_y(points)[rows],
+        "Boylam": shapely.get_x(points)[rows],
+    }).to_excel(path, index=False)
+    return path
+
+
+def test_first_period_matches_main_map(app, geo, tmp_path):
+    rng = np.random.default_rng(0)
+    files = [point_file(tmp_path / f"Dönem {i}.xlsx", geo, rng) for i in range(2)]
+    _, coords, offsets = shapely.to_ragged_array(geo.geometry.values)
+    store = app["GeometryStore"](coords, offsets, geo["CITY_KEY"])
+
+    matrix = app["build_period_matrix"](tuple(f.name for f in files), files, store, geo)
+
+    # Ana harita: ilk dosya aggregate_points + prepare_data
+    df = app["load_excel"](files[0])
+    provinces = app["aggregate_points"](app["frame_fingerprint"](df), df, geo)[0]
+    merged = app["prepare_data"](provinces, geo)[0]
+
+    assert matrix["periods"] == ["Dönem 0", "Dönem 1"]
+    expected = np.zeros(len(store.keys))
+    expected[store.rows(merged["CITY_KEY"])] = merged["PF Kutu"].to_numpy(dtype="float64")
+    np.testing.assert_allclose(matrix["PF Kutu"][0], expected)
+    assert matrix["PF Kutu"][0].sum() == df["Kutu Adet"].sum()
@@ -0,0 +1,72 @@
+"""
+Rapor grafikleri süreç havuzunda, oturumda çizilenle aynı PNG'leri üretmeli
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+import report_charts
+
+APP_DIR = Path(__file__).resolve().parent.parent
+APP_NAMES = {"normalize_city", "FIX_CITY_MAP", "load_geo", "REGION_COLORS", "BCG_QUADRANTS"}
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="rapor havuzu fork ister"
+)
+
+
+@pytest.fixture(scope="module")
+def app(load_app):
+    return load_app(APP_NAMES, read_geometry_artifact=lambda: gpd.read_file(APP_DIR / "turkey.geojson"))
+
+
+def report_jobs(app, geo, rng):
+    n = len(geo)
+    toplam = rng.integers(1000, 5000, n).astype("float64")
+    pf = rng.integers(0, 1000, n).astype("float64")
+    pay = pf / toplam * 100
+    order = np.argsort(-pf, kind="stable")[:30]
+    return {
+        "harita": (report_charts.render_map_png, (
+            geo["CITY_KEY"].to_numpy(dtype=object),
+            geo["fixed_name"].to_numpy(dtype=object),
+            rng.choice(list(app["REGION_COLORS"]), n).astype(object),
+            pf,
+            app["REGION_COLORS"],
+        )),
+        "bcg": (report_charts.render_bcg_png, (
+            toplam, pay, pf, rng.integers(0, 4, n), float(np.median(toplam)), float(np.median(pay)),
+            app["BCG_QUADRANTS"],
+        )),
+        "pareto": (report_charts.render_pareto_png, (
+            geo["fixed_name"].to_numpy(dtype=object)[order].tolist(),
+            pf[order],
+            np.cumsum(pf[order]) / pf.sum() * 100,
+        )),
+    }
+
+
+def test_pool_matches_in_process(app):
+    geo = app["load_geo"]()
+    base = report_charts.MapBaseLayer(geo)
+    jobs = [report_jobs(app, geo, np.random.default_rng(seed)) for seed in range(2)]
+
+    with ProcessPoolExecutor(
+        max_workers=3,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=report_charts.init_worker,
+        initargs=(base,),
+    ) as pool:
+        # İki rapor aynı anda: işler havuzda karışık sırayla çizilir
+        futures = [{name: pool.submit(fn, *args) for name, (fn, args) in batch.items()} for batch in jobs]
+        pooled = [{name: future.result() for name, future in batch.items()} for batch in futures]
+
+    report_charts.init_worker(base)
+    for batch, result in zip(jobs, pooled):
+        for name, (fn, args) in batch.items():
+            assert result[name].startswith(b"\x89PNG")
+            assert result[name] == fn(*args)